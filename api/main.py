@@ -2,13 +2,22 @@
 Главный файл FastAPI приложения
 """
 import os
+import asyncio
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from contextlib import asynccontextmanager
 import logging
 
-from api.database import init_db
-from api.routers import users, measurements, favorites, catalog, size_recommend, admin, photos
+from api.services.stats_rollup import stats_rollup_service
+from api.services.blob_store import blob_store
+from api.services.file_outbox import file_outbox_worker
+from api.services.storage_gc import storage_gc
+from api.services.retention import retention_service
+from api.services.tryon_queue import tryon_queue
+from api.services.activity import activity_buffer
+from api.services.warmup import warmup_service
+from api.routers import users, session, measurements, favorites, catalog, cards, size_recommend, admin, photos
 
 # Настройка логирования
 logging.basicConfig(
@@ -26,7 +35,8 @@ class NoHealthCheckFilter(logging.Filter):
     def filter(self, record: logging.LogRecord) -> bool:
         # Check if the log message contains the /health endpoint access
         # Uvicorn access logs usually contain the full request path
-        return "/health" not in record.getMessage()
+        message = record.getMessage()
+        return "/health" not in message and "/ready" not in message
 
 # Get the uvicorn.access logger and add the filter
 uvicorn_access_logger = logging.getLogger("uvicorn.access")
@@ -35,22 +45,60 @@ uvicorn_access_logger.addFilter(NoHealthCheckFilter())
 logger = logging.getLogger(__name__)
 
 
+# Фоновые задачи, работающие с БД (запускаются после миграций)
+BACKGROUND_SERVICES = (
+    stats_rollup_service,  # Пересчет дневной статистики
+    blob_store,  # Удаление файлов без ссылок из blob store
+    file_outbox_worker,  # Удаление файлов удаленных фото и примерок
+    storage_gc,  # Периодическая сверка хранилища с БД
+    retention_service,  # Пережатие старых результатов примерок, перенос оригиналов на холодный уровень
+    tryon_queue,  # Возврат в очередь примерок, воркеры которых перестали продлевать аренду
+    activity_buffer,  # Пакетная запись last_activity из буфера
+)
+
+
+async def run_background_services():
+    """Запустить фоновые задачи, когда прогрев применит миграции"""
+    await warmup_service.migrated.wait()
+    tasks = [asyncio.create_task(service.run_forever()) for service in BACKGROUND_SERVICES]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    """Lifespan events"""
+    """
+    Lifespan events
+
+    Старт не ждет сети: миграции, пул БД и Google Sheets прогреваются в фоне,
+    готовность показывает /ready.
+    """
     logger.info("Starting FastAPI application...")
 
-    # Инициализация БД
-    try:
-        await init_db()
-        logger.info("Database initialized")
-    except Exception as e:
-        logger.error(f"Failed to initialize database: {e}")
+    warmup_task = asyncio.create_task(warmup_service.run())
+    background_task = asyncio.create_task(run_background_services())
 
     yield
 
     logger.info("Shutting down FastAPI application...")
 
+    for task in (warmup_task, background_task):
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    # Отметки активности, накопленные после последнего сброса
+    try:
+        await activity_buffer.flush()
+    except Exception as e:
+        logger.error(f"Failed to flush activity buffer on shutdown: {e}")
+
 
 # Создание приложения
 app = FastAPI(
@@ -76,11 +124,14 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
 # Подключение роутеров
 app.include_router(users.router, prefix="/api")
+app.include_router(session.router, prefix="/api")
 app.include_router(measurements.router, prefix="/api")
 app.include_router(favorites.router, prefix="/api")
 app.include_router(catalog.router, prefix="/api")
+app.include_router(cards.router, prefix="/api")
 app.include_router(size_recommend.router, prefix="/api")
 app.include_router(photos.router, prefix="/api")
 app.include_router(admin.router, prefix="/api")
@@ -99,10 +150,18 @@ async def root():
 @app.get("/health")
 @app.head("/health")
 async def health_check():
-    """Health check endpoint"""
+    """Health check endpoint (процесс жив, прогрев может еще идти)"""
     return {"status": "healthy"}
 
 
+@app.get("/ready")
+async def readiness_check():
+    """Готовность принимать запросы: состояние шагов прогрева, 503 - прогрев не завершен"""
+    report = warmup_service.report()
+    status_code = 200 if report["status"] == "ready" else 503
+    return JSONResponse(report, status_code=status_code)
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
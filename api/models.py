@@ -1,7 +1,8 @@
 """
 SQLAlchemy модели для БД
 """
-from sqlalchemy import Column, Integer, String, BigInteger, Boolean, DateTime, ForeignKey, Text, UniqueConstraint
+from sqlalchemy import Column, Integer, String, BigInteger, Boolean, Date, DateTime, ForeignKey, Index, Text, UniqueConstraint, text
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 
@@ -59,7 +60,7 @@ class Favorite(Base):
     __tablename__ = "favorites"
 
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
-    user_id = Column(BigInteger, ForeignKey("users.tg_id", ondelete="CASCADE"), nullable=False, index=True)
+    user_id = Column(BigInteger, ForeignKey("users.tg_id", ondelete="CASCADE"), nullable=False)
     product_id = Column(String(100), nullable=False)  # ID товара из Google Sheets
     added_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
 
@@ -69,6 +70,8 @@ class Favorite(Base):
     # Constraints
     __table_args__ = (
         UniqueConstraint('user_id', 'product_id', name='unique_user_product'),
+        # Список избранного: WHERE user_id = ? ORDER BY added_at DESC
+        Index('ix_favorites_user_added', 'user_id', text('added_at DESC')),
     )
 
 
@@ -77,7 +80,7 @@ class UserPhoto(Base):
     __tablename__ = "user_photos"
 
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
-    user_id = Column(BigInteger, ForeignKey("users.tg_id", ondelete="CASCADE"), nullable=False, index=True)
+    user_id = Column(BigInteger, ForeignKey("users.tg_id", ondelete="CASCADE"), nullable=False)
     file_id = Column(String(255), nullable=False)  # Telegram file_id
     file_path = Column(String(500), nullable=False)  # Путь к файлу на сервере
     uploaded_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
@@ -88,22 +91,167 @@ class UserPhoto(Base):
     user = relationship("User", back_populates="photos")
     try_on_history = relationship("TryOnHistory", back_populates="user_photo", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        # Фото пользователя: WHERE user_id = ? ORDER BY uploaded_at DESC
+        Index('ix_user_photos_user_uploaded', 'user_id', text('uploaded_at DESC')),
+    )
+
 
 class TryOnHistory(Base):
     """Модель истории примерок"""
     __tablename__ = "try_on_history"
 
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
-    user_id = Column(BigInteger, ForeignKey("users.tg_id", ondelete="CASCADE"), nullable=False, index=True)
+    user_id = Column(BigInteger, ForeignKey("users.tg_id", ondelete="CASCADE"), nullable=False)
     product_id = Column(String(100), nullable=False, index=True)  # ID товара из Google Sheets
     user_photo_id = Column(Integer, ForeignKey("user_photos.id", ondelete="CASCADE"), nullable=False)
     result_file_path = Column(String(500), nullable=True)  # Путь к результату примерки
+    preview_file_path = Column(String(500), nullable=True)  # Уменьшенная копия (после retention)
+    original_file_path = Column(String(500), nullable=True)  # Оригинал на холодном уровне (после retention)
+    retention_applied_at = Column(DateTime(timezone=True), nullable=True)  # Когда результат пережат
     created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
     generation_time = Column(Integer, nullable=True)  # Время генерации в секундах
-    status = Column(String(20), nullable=False, default="processing")  # processing, success, failed
+    status = Column(String(20), nullable=False, default="queued")  # queued, processing, success, failed
     wb_link = Column(String(500), nullable=True)  # Ссылка на Wildberries
     ozon_url = Column(String(500), nullable=True) # Ссылка на Ozon
 
+    # Очередь генерации (api.services.tryon_queue)
+    job_payload = Column(JSONB, nullable=True)  # Параметры генерации и доставки результата
+    attempts = Column(Integer, nullable=False, default=0, server_default="0")  # Сколько раз задачу брали воркеры
+    available_at = Column(DateTime(timezone=True), server_default=func.now())  # Не раньше - повтор с задержкой
+    locked_by = Column(String(100), nullable=True)  # Воркер, выполняющий задачу
+    lease_expires_at = Column(DateTime(timezone=True), nullable=True)  # Аренда продлевается heartbeat
+    last_error = Column(Text, nullable=True)
+
     # Relationships
     user = relationship("User", back_populates="try_on_history")
     user_photo = relationship("UserPhoto", back_populates="try_on_history")
+
+    __table_args__ = (
+        # История успешных примерок: WHERE user_id = ? AND status = 'success' ORDER BY created_at DESC, id DESC
+        Index(
+            'ix_try_on_history_user_success_created',
+            'user_id', text('created_at DESC'), text('id DESC'),
+            postgresql_where=text("status = 'success'"),
+        ),
+        # Дневной лимит примерок: WHERE user_id = ? AND created_at >= ? AND created_at < ?
+        Index('ix_try_on_history_user_created', 'user_id', 'created_at'),
+        # Каскадное удаление при удалении фото
+        Index('ix_try_on_history_user_photo_id', 'user_photo_id'),
+        # Кандидаты retention: успешные примерки, которые еще не пережаты, по возрасту
+        Index(
+            'ix_try_on_history_retention_pending', 'created_at',
+            postgresql_where=text("status = 'success' AND retention_applied_at IS NULL"),
+        ),
+        # Очередь генерации: WHERE status = 'queued' AND available_at <= now() ORDER BY available_at, id
+        Index(
+            'ix_try_on_history_queued', 'available_at', 'id',
+            postgresql_where=text("status = 'queued'"),
+        ),
+        # Просроченные аренды: WHERE status = 'processing' AND lease_expires_at < now()
+        Index(
+            'ix_try_on_history_processing_lease', 'lease_expires_at',
+            postgresql_where=text("status = 'processing'"),
+        ),
+    )
+
+
+class StatsDaily(Base):
+    """Модель дневных агрегатов статистики (rollup для /admin/stats)"""
+    __tablename__ = "stats_daily"
+
+    day = Column(Date, primary_key=True)  # Локальная дата
+    new_users = Column(Integer, nullable=False, default=0)
+    tryons_total = Column(Integer, nullable=False, default=0)    # Все попытки примерок
+    tryons_success = Column(Integer, nullable=False, default=0)  # Успешные примерки
+    generation_time_sum = Column(BigInteger, nullable=False, default=0)  # Сумма времени генерации успешных
+    generation_time_count = Column(Integer, nullable=False, default=0)   # Кол-во успешных с известным временем
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class StatsDailyProduct(Base):
+    """Модель дневных агрегатов успешных примерок по товарам"""
+    __tablename__ = "stats_daily_products"
+
+    day = Column(Date, primary_key=True)
+    product_id = Column(String(100), primary_key=True)
+    tryons_success = Column(Integer, nullable=False, default=0)
+
+
+class StatsProductTotal(Base):
+    """Успешные примерки товара за все свернутые дни (ведется пересчетом агрегатов)"""
+    __tablename__ = "stats_product_totals"
+
+    product_id = Column(String(100), primary_key=True)
+    tryons_success = Column(BigInteger, nullable=False, default=0)
+
+    __table_args__ = (
+        Index('ix_stats_product_totals_tryons', text('tryons_success DESC')),
+    )
+
+
+class StatsCounter(Base):
+    """
+    Текущие счетчики статистики: users, measurements, users_with_photos
+
+    Поддерживаются триггерами БД (миграция 0008) в транзакции изменения строк.
+    """
+    __tablename__ = "stats_counters"
+
+    name = Column(String(50), primary_key=True)
+    value = Column(BigInteger, nullable=False, default=0)
+
+
+class StatsFavoriteProduct(Base):
+    """Сколько раз товар сейчас в избранном (поддерживается триггером БД)"""
+    __tablename__ = "stats_favorite_products"
+
+    product_id = Column(String(100), primary_key=True)
+    favorites = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        Index('ix_stats_favorite_products_favorites', text('favorites DESC')),
+    )
+
+
+class StatsUserPhotos(Base):
+    """Число фото пользователя (поддерживается триггером БД, для счетчика users_with_photos)"""
+    __tablename__ = "stats_user_photos"
+
+    user_id = Column(BigInteger, primary_key=True)
+    photos = Column(Integer, nullable=False, default=0)
+
+
+class Blob(Base):
+    """Модель объекта контентно-адресуемого хранилища (фото пользователей, результаты примерок)"""
+    __tablename__ = "blobs"
+
+    key = Column(String(64), primary_key=True)  # SHA-256 содержимого (hex)
+    size = Column(BigInteger, nullable=False)  # Размер в байтах
+    content_type = Column(String(100), nullable=True)
+    ref_count = Column(Integer, nullable=False, default=0)  # Сколько записей ссылается на объект
+    tier = Column(String(10), nullable=False, default="hot", server_default="hot")  # hot, cold
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        # Кандидаты на удаление: объекты без ссылок
+        Index('ix_blobs_unreferenced', 'updated_at', postgresql_where=text('ref_count <= 0')),
+    )
+
+
+class FileDeletion(Base):
+    """
+    Outbox удаления файлов
+
+    Строки добавляют триггеры БД (миграция 0005) в транзакции, которая удаляет
+    user_photos / try_on_history (в том числе каскадом) или заменяет ссылку на
+    файл. Обрабатывает фоновый воркер api.services.file_outbox.
+    """
+    __tablename__ = "file_deletion_outbox"
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    ref = Column(String(500), nullable=False)  # Ключ blob store или старый путь к файлу
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    attempts = Column(Integer, nullable=False, default=0, server_default=text('0'))
+    last_error = Column(Text, nullable=True)
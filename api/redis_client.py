@@ -0,0 +1,20 @@
+"""
+Подключение к Redis для API
+"""
+import os
+
+from redis.asyncio import Redis
+
+REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
+REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
+REDIS_DB = int(os.getenv("REDIS_DB", 0))
+
+# Клиент создается лениво: соединение открывается при первом запросе
+redis_client = Redis(
+    host=REDIS_HOST,
+    port=REDIS_PORT,
+    db=REDIS_DB,
+    decode_responses=True,
+    socket_timeout=2,
+    socket_connect_timeout=2
+)
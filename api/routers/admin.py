@@ -3,12 +3,15 @@ API endpoints для административной панели
 """
 from fastapi import APIRouter, Depends
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func
-from datetime import datetime, timedelta
+from sqlalchemy import select, func, true, union
+from datetime import date, datetime, timedelta
 
-from api.database import get_db
-from api.models import User, UserMeasurement, Favorite, UserPhoto, TryOnHistory
+from api.database import AsyncSessionLocal, get_read_db
+from api.models import User, TryOnHistory, StatsDaily, StatsCounter, StatsFavoriteProduct, StatsProductTotal, Blob
+from api.services.catalog_responses import catalog_response_cache
 from api.services.sheets import sheets_service
+from api.services.dates import local_day_start
+from api.services.stats_rollup import stats_rollup_service
 
 router = APIRouter(prefix="/admin", tags=["admin"])
 
@@ -17,150 +20,186 @@ router = APIRouter(prefix="/admin", tags=["admin"])
 async def clear_sheets_cache():
     """Очистить кеш Google Sheets"""
     sheets_service.clear_cache()
+    catalog_response_cache.clear()
     return {"status": "success", "message": "Google Sheets cache cleared"}
 
 
 @router.get("/stats")
-async def get_stats(db: AsyncSession = Depends(get_db)):
-    """Получить статистику бота"""
-    # Общее количество пользователей
-    total_users_result = await db.execute(select(func.count()).select_from(User))
-    total_users = total_users_result.scalar()
-
-    # Новые пользователи за сегодня
-    today = datetime.now().date()
-    today_users_result = await db.execute(
-        select(func.count()).select_from(User).where(func.date(User.created_at) == today)
-    )
-    today_users = today_users_result.scalar()
-
-    # Новые за 7 дней
-    week_ago = datetime.now() - timedelta(days=7)
-    week_users_result = await db.execute(
-        select(func.count()).select_from(User).where(User.created_at >= week_ago)
-    )
-    week_users = week_users_result.scalar()
-
-    # Новые за 30 дней
-    month_ago = datetime.now() - timedelta(days=30)
-    month_users_result = await db.execute(
-        select(func.count()).select_from(User).where(User.created_at >= month_ago)
-    )
-    month_users = month_users_result.scalar()
-
-    # Активные за 7 дней
-    active_users_result = await db.execute(
-        select(func.count()).select_from(User).where(User.last_activity >= week_ago)
-    )
-    active_users = active_users_result.scalar()
-
-    # Пользователи с параметрами
-    measurements_count_result = await db.execute(
-        select(func.count()).select_from(UserMeasurement)
-    )
-    measurements_count = measurements_count_result.scalar()
-
-    # Процент пользователей с параметрами
-    measurements_percent = (measurements_count / total_users * 100) if total_users > 0 else 0
+async def get_stats(db: AsyncSession = Depends(get_read_db)):
+    """
+    Получить статистику бота
+
+    Закрытые дни берутся из дневных агрегатов (stats_daily), текущий день
+    считается одним агрегирующим запросом по строкам за сегодня, текущие
+    итоги и ТОП избранного - из счетчиков, которые ведут триггеры БД.
+
+    users.total и доля с параметрами - по текущим строкам, а счетчики
+    примерок (tryons.total, success_rate) - все когда-либо созданные
+    примерки, включая удаленные пользователями.
+    """
+    today = date.today()
+    today_start = local_day_start(today)
+    week_start = today - timedelta(days=6)
+    month_start = today - timedelta(days=29)
+    week_ago = datetime.now().astimezone() - timedelta(days=7)
+
+    row = (await db.execute(_build_stats_query(today, today_start, week_start, month_start, week_ago))).one()
+
+    # Если фоновый пересчет еще не свернул вчерашний день (например, сразу после полуночи),
+    # досчитываем недостающие дни синхронно (запись и повторное чтение - в основной
+    # БД, реплика их еще не видит). Первичное заполнение всей истории (stats_daily
+    # пуста) остается фоновому воркеру: до него отдаются неполные агрегаты
+    if row.last_day is not None and row.last_day < today - timedelta(days=1):
+        async with AsyncSessionLocal() as primary_db:
+            if await stats_rollup_service.run_pending(primary_db):
+                row = (await primary_db.execute(
+                    _build_stats_query(today, today_start, week_start, month_start, week_ago)
+                )).one()
+
+    total_users = row.users_current
+    measurements_percent = (row.measurements_count / total_users * 100) if total_users > 0 else 0
+
+    total_tryons = int(row.tryons_success_total) + row.today_success
+    total_attempts = int(row.tryons_total) + row.today_total
+    success_rate = (total_tryons / total_attempts * 100) if total_attempts > 0 else 0
 
-    # Всего добавлений в избранное
-    favorites_count_result = await db.execute(
-        select(func.count()).select_from(Favorite)
-    )
-    favorites_count = favorites_count_result.scalar()
+    generation_time_sum = int(row.generation_time_sum) + int(row.today_gen_sum)
+    generation_time_count = int(row.generation_time_count) + row.today_gen_count
+    avg_generation_time = generation_time_sum / generation_time_count if generation_time_count else None
 
-    # ТОП-5 избранных товаров
-    top_favorites_result = await db.execute(
-        select(Favorite.product_id, func.count(Favorite.id).label('count'))
-        .group_by(Favorite.product_id)
-        .order_by(func.count(Favorite.id).desc())
-        .limit(5)
-    )
+    top_favorites_result = await db.execute(_build_top_favorites_query())
     top_favorites = top_favorites_result.all()
 
-    # === Статистика примерок ===
-
-    # Всего успешных примерок
-    total_tryons_result = await db.execute(
-        select(func.count()).select_from(TryOnHistory).where(TryOnHistory.status == "success")
-    )
-    total_tryons = total_tryons_result.scalar()
-
-    # Примерок за сегодня
-    today_tryons_result = await db.execute(
-        select(func.count()).select_from(TryOnHistory)
-        .where(TryOnHistory.status == "success", func.date(TryOnHistory.created_at) == today)
-    )
-    today_tryons = today_tryons_result.scalar()
-
-    # Примерок за 7 дней
-    week_tryons_result = await db.execute(
-        select(func.count()).select_from(TryOnHistory)
-        .where(TryOnHistory.status == "success", TryOnHistory.created_at >= week_ago)
-    )
-    week_tryons = week_tryons_result.scalar()
-
-    # Примерок за 30 дней
-    month_tryons_result = await db.execute(
-        select(func.count()).select_from(TryOnHistory)
-        .where(TryOnHistory.status == "success", TryOnHistory.created_at >= month_ago)
-    )
-    month_tryons = month_tryons_result.scalar()
-
-    # Среднее время генерации
-    avg_time_result = await db.execute(
-        select(func.avg(TryOnHistory.generation_time))
-        .where(TryOnHistory.status == "success", TryOnHistory.generation_time.isnot(None))
-    )
-    avg_generation_time = avg_time_result.scalar()
-
-    # Процент успешных примерок
-    total_attempts_result = await db.execute(
-        select(func.count()).select_from(TryOnHistory)
-    )
-    total_attempts = total_attempts_result.scalar()
-    success_rate = (total_tryons / total_attempts * 100) if total_attempts > 0 else 0
-
-    # Пользователей с фото
-    users_with_photos_result = await db.execute(
-        select(func.count(func.distinct(UserPhoto.user_id))).select_from(UserPhoto)
-    )
-    users_with_photos = users_with_photos_result.scalar()
-
-    # ТОП-5 товаров для примерки
-    top_tryons_result = await db.execute(
-        select(TryOnHistory.product_id, func.count(TryOnHistory.id).label('count'))
-        .where(TryOnHistory.status == "success")
-        .group_by(TryOnHistory.product_id)
-        .order_by(func.count(TryOnHistory.id).desc())
-        .limit(5)
-    )
+    top_tryons_result = await db.execute(_build_top_tryons_query(today_start))
     top_tryons = top_tryons_result.all()
 
     return {
         "users": {
             "total": total_users,
-            "today": today_users,
-            "week": week_users,
-            "month": month_users,
-            "active_week": active_users
+            "today": row.users_today,
+            "week": int(row.users_week) + row.users_today,
+            "month": int(row.users_month) + row.users_today,
+            "active_week": row.active_week
         },
         "measurements": {
-            "count": measurements_count,
+            "count": row.measurements_count,
             "percent": round(measurements_percent, 1)
         },
         "favorites": {
-            "total": favorites_count,
-            "top": [{"product_id": row[0], "count": row[1]} for row in top_favorites]
+            "total": row.favorites_count,
+            "top": [{"product_id": r[0], "count": int(r[1])} for r in top_favorites]
         },
         "tryons": {
             "total": total_tryons,
-            "today": today_tryons,
-            "week": week_tryons,
-            "month": month_tryons,
+            "today": row.today_success,
+            "week": int(row.tryons_success_week) + row.today_success,
+            "month": int(row.tryons_success_month) + row.today_success,
             "avg_generation_time": round(avg_generation_time, 1) if avg_generation_time else None,
             "success_rate": round(success_rate, 1),
-            "users_with_photos": users_with_photos,
-            "top": [{"product_id": row[0], "count": row[1]} for row in top_tryons]
+            "users_with_photos": row.users_with_photos,
+            "top": [{"product_id": r[0], "count": int(r[1])} for r in top_tryons]
         }
     }
+
+
+def _build_stats_query(today: date, today_start: datetime, week_start: date, month_start: date, week_ago: datetime):
+    """
+    Один запрос: дневные агрегаты + строки за сегодня + текущие счетчики
+
+    Текущие итоги (пользователи, параметры, избранное, пользователи с фото)
+    ведут триггеры БД, по таблицам читаются только диапазоны по индексам
+    (зарегистрированные сегодня, активные за неделю).
+    """
+    closed = StatsDaily.day < today
+    rollup = select(
+        func.max(StatsDaily.day).label("last_day"),
+        func.coalesce(func.sum(StatsDaily.new_users).filter(closed, StatsDaily.day >= week_start), 0).label("users_week"),
+        func.coalesce(func.sum(StatsDaily.new_users).filter(closed, StatsDaily.day >= month_start), 0).label("users_month"),
+        func.coalesce(func.sum(StatsDaily.tryons_total).filter(closed), 0).label("tryons_total"),
+        func.coalesce(func.sum(StatsDaily.tryons_success).filter(closed), 0).label("tryons_success_total"),
+        func.coalesce(func.sum(StatsDaily.tryons_success).filter(closed, StatsDaily.day >= week_start), 0).label("tryons_success_week"),
+        func.coalesce(func.sum(StatsDaily.tryons_success).filter(closed, StatsDaily.day >= month_start), 0).label("tryons_success_month"),
+        func.coalesce(func.sum(StatsDaily.generation_time_sum).filter(closed), 0).label("generation_time_sum"),
+        func.coalesce(func.sum(StatsDaily.generation_time_count).filter(closed), 0).label("generation_time_count"),
+    ).subquery()
+
+    success = TryOnHistory.status == "success"
+    today_tryons = select(
+        func.count().label("today_total"),
+        func.count().filter(success).label("today_success"),
+        func.coalesce(func.sum(TryOnHistory.generation_time).filter(success), 0).label("today_gen_sum"),
+        func.count(TryOnHistory.generation_time).filter(success).label("today_gen_count"),
+    ).where(TryOnHistory.created_at >= today_start).subquery()
+
+    return select(
+        rollup,
+        today_tryons,
+        _counter("users").label("users_current"),
+        select(func.count()).select_from(User)
+        .where(User.created_at >= today_start).scalar_subquery().label("users_today"),
+        select(func.count()).select_from(User)
+        .where(User.last_activity >= week_ago).scalar_subquery().label("active_week"),
+        _counter("measurements").label("measurements_count"),
+        select(func.coalesce(func.sum(StatsFavoriteProduct.favorites), 0))
+        .scalar_subquery().label("favorites_count"),
+        _counter("users_with_photos").label("users_with_photos"),
+    ).select_from(rollup.join(today_tryons, true()))
+
+
+def _counter(name: str):
+    """Значение счетчика stats_counters"""
+    return func.coalesce(select(StatsCounter.value).where(StatsCounter.name == name).scalar_subquery(), 0)
+
+
+def _build_top_favorites_query():
+    """ТОП-5 избранных товаров - по счетчикам товаров (индекс по убыванию)"""
+    return (
+        select(StatsFavoriteProduct.product_id, StatsFavoriteProduct.favorites)
+        .where(StatsFavoriteProduct.favorites > 0)
+        .order_by(StatsFavoriteProduct.favorites.desc())
+        .limit(5)
+    )
+
+
+def _build_top_tryons_query(today_start: datetime):
+    """
+    ТОП-5 товаров по успешным примеркам: итоги свернутых дней + сегодняшние строки
+
+    Товар без примерок сегодня не обгонит пятерку лидеров по итогам, поэтому
+    суммы считаются только для этой пятерки и товаров с примерками за сегодня.
+    """
+    today_products = (
+        select(TryOnHistory.product_id, func.count().label("count"))
+        .where(TryOnHistory.status == "success", TryOnHistory.created_at >= today_start)
+        .group_by(TryOnHistory.product_id)
+        .cte("today_products")
+    )
+    candidates = union(
+        select(StatsProductTotal.product_id).order_by(StatsProductTotal.tryons_success.desc()).limit(5),
+        select(today_products.c.product_id),
+    ).subquery("candidates")
+
+    count = (
+        func.coalesce(StatsProductTotal.tryons_success, 0) + func.coalesce(today_products.c.count, 0)
+    ).label("count")
+    return (
+        select(candidates.c.product_id, count)
+        .select_from(candidates)
+        .outerjoin(StatsProductTotal, StatsProductTotal.product_id == candidates.c.product_id)
+        .outerjoin(today_products, today_products.c.product_id == candidates.c.product_id)
+        .where(count > 0)
+        .order_by(count.desc())
+        .limit(5)
+    )
+
+
+@router.get("/storage")
+async def get_storage_stats(db: AsyncSession = Depends(get_read_db)):
+    """Объем blob store по уровням хранения (горячий/холодный)"""
+    result = await db.execute(
+        select(Blob.tier, func.count().label('count'), func.coalesce(func.sum(Blob.size), 0).label('bytes'))
+        .where(Blob.ref_count > 0)
+        .group_by(Blob.tier)
+    )
+    tiers = {row.tier: {"count": row.count, "bytes": int(row.bytes)} for row in result.all()}
+    return {"tiers": tiers}
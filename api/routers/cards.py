@@ -0,0 +1,138 @@
+"""
+API endpoints карточек товаров
+
+Карточка - все, что нужно боту для показа товара: сам товар, позиция в
+списке, флаг избранного и рекомендация размера. Данные пользователя
+(параметры и избранное) читаются одним запросом к БД, товары и таблицы
+размеров берутся из кеша каталога.
+"""
+from typing import Dict, List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import select, exists, func, literal, Select
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.database import get_read_db
+from api.models import UserMeasurement, Favorite
+from api.schemas import ProductCardResponse
+from api.services.sheets import sheets_service
+from api.services.size_matcher import size_matcher_service
+
+router = APIRouter(prefix="/cards", tags=["cards"])
+
+# Столбцы параметров для подбора размера
+MEASUREMENT_COLUMNS = [
+    getattr(UserMeasurement, param) for param in size_matcher_service.ALL_PARAMS
+    if hasattr(UserMeasurement, param)
+]
+
+
+def _user_card_query(tg_id: int, *columns) -> Select:
+    """
+    Параметры пользователя и дополнительные столбцы одной строкой
+
+    Строка есть всегда: параметры присоединяются к строке-заглушке LEFT JOIN,
+    has_measurements показывает, указаны ли они.
+    """
+    anchor = select(literal(1).label("anchor")).subquery("anchor")
+    return (
+        select(
+            (UserMeasurement.id.is_not(None)).label("has_measurements"),
+            *MEASUREMENT_COLUMNS,
+            *columns
+        )
+        .select_from(anchor)
+        .outerjoin(UserMeasurement, UserMeasurement.user_id == tg_id)
+    )
+
+
+def _build_product_card_query(tg_id: int, product_id: str) -> Select:
+    """Параметры пользователя и флаг избранного для товара"""
+    is_favorite = exists().where(Favorite.user_id == tg_id, Favorite.product_id == product_id)
+    return _user_card_query(tg_id, is_favorite.label("is_favorite"))
+
+
+def _build_favorite_card_query(tg_id: int) -> Select:
+    """Параметры пользователя и product_id избранного (новые первыми)"""
+    favorite_ids = (
+        select(func.array_agg(aggregate_order_by(
+            Favorite.product_id, Favorite.added_at.desc(), Favorite.id.desc()
+        )))
+        .where(Favorite.user_id == tg_id)
+        .scalar_subquery()
+    )
+    return _user_card_query(tg_id, favorite_ids.label("favorite_ids"))
+
+
+def _build_card(row, product: Dict, index: int, total: int, is_favorite: bool) -> Dict:
+    measurements = None
+    if row.has_measurements:
+        measurements = {param: row._mapping.get(param) for param in size_matcher_service.ALL_PARAMS}
+
+    return {
+        "product": product,
+        "index": index,
+        "total": total,
+        "is_favorite": is_favorite,
+        "size_recommendation": size_matcher_service.recommend_for_product(measurements, product),
+    }
+
+
+def _resolve_index(product_ids: List[str], index: int, product_id: Optional[str]) -> int:
+    """Позиция товара: по product_id, если он в списке, иначе index по кругу"""
+    if product_id is not None and product_id in product_ids:
+        return product_ids.index(product_id)
+    return index % len(product_ids)
+
+
+@router.get("/{tg_id}", response_model=ProductCardResponse)
+async def get_product_card(
+    tg_id: int,
+    category: str = Query(..., description="ID категории"),
+    index: int = Query(0, description="Позиция в категории (по кругу, -1 - последний товар)"),
+    product_id: Optional[str] = Query(None, description="Показать этот товар (позиция определяется по нему)"),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """Карточка товара категории"""
+    # Неизвестная категория - 404 без чтения листа товаров
+    if not any(cat['category_id'] == category for cat in sheets_service.get_categories()):
+        raise HTTPException(status_code=404, detail="Category not found")
+
+    products = sheets_service.get_products_by_category(category)
+    if not products:
+        raise HTTPException(status_code=404, detail="No products in category")
+
+    index = _resolve_index([p['product_id'] for p in products], index, product_id)
+    product = products[index]
+
+    row = (await db.execute(_build_product_card_query(tg_id, product['product_id']))).one()
+
+    return _build_card(row, product, index, len(products), row.is_favorite)
+
+
+@router.get("/{tg_id}/favorites", response_model=ProductCardResponse)
+async def get_favorite_card(
+    tg_id: int,
+    index: int = Query(0, description="Позиция в избранном (по кругу, -1 - последний товар)"),
+    product_id: Optional[str] = Query(None, description="Показать этот товар (позиция определяется по нему)"),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """
+    Карточка товара из избранного
+
+    Порядок как в списке избранного (новые первыми), товары, которых нет в
+    каталоге, пропускаются.
+    """
+    row = (await db.execute(_build_favorite_card_query(tg_id))).one()
+
+    catalog = sheets_service.get_products_index()
+    product_ids = [
+        favorite_id for favorite_id in (row.favorite_ids or [])
+        if catalog.get(favorite_id) and catalog[favorite_id].get('is_active')
+    ]
+    if not product_ids:
+        raise HTTPException(status_code=404, detail="No favorites")
+
+    index = _resolve_index(product_ids, index, product_id)
+    return _build_card(row, catalog[product_ids[index]], index, len(product_ids), True)
@@ -1,10 +1,11 @@
 """
 API endpoints для работы с каталогом товаров
 """
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, Query, Request
 from typing import List, Optional
 
 from api.schemas import Product, Category
+from api.services.catalog_responses import catalog_response_cache, parse_fields
 from api.services.sheets import sheets_service
 import logging
 
@@ -14,30 +15,39 @@ logger.info("'api.services.sheets.sheets_service' imported and instantiated.")
 router = APIRouter(prefix="/catalog", tags=["catalog"])
 
 
+FIELDS_DESCRIPTION = "Только эти поля: через запятую или имя набора (ids, photos, card)"
+
+
 @router.get("/categories", response_model=List[Category])
-async def get_categories():
-    """Получить список категорий"""
+async def get_categories(
+    request: Request,
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION)
+):
+    """Получить список категорий (готовый ответ версии каталога, ETag и gzip/br)"""
+    projection = parse_fields(Category, fields)
     categories = sheets_service.get_categories()
-    return categories
+    payload = await catalog_response_cache.get("categories", Category, [categories], projection)
+    return catalog_response_cache.response(request, payload)
 
 
 @router.get("/products", response_model=List[Product])
 async def get_products(
-    category: Optional[str] = Query(None, description="Filter by category ID")
+    request: Request,
+    category: Optional[str] = Query(None, description="Filter by category ID"),
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION)
 ):
-    """Получить список товаров"""
+    """Получить список товаров (готовый ответ версии каталога, ETag и gzip/br)"""
+    projection = parse_fields(Product, fields)
+    categories = [cat['category_id'] for cat in sheets_service.get_categories()]
     if category:
-        products = sheets_service.get_products_by_category(category)
+        # Неизвестная категория - пустой список без чтения листа товаров
+        sources = [sheets_service.get_products_by_category(category)] if category in categories else []
     else:
-        # Возвращаем все товары
-        all_products = []
-        categories = sheets_service.get_categories()
-        for cat in categories:
-            products = sheets_service.get_products_by_category(cat['category_id'])
-            all_products.extend(products)
-        return all_products
+        # Все товары - товары категорий по порядку
+        sources = [sheets_service.get_products_by_category(category_id) for category_id in categories]
 
-    return products
+    payload = await catalog_response_cache.get(f"products:{category or '*'}", Product, sources, projection)
+    return catalog_response_cache.response(request, payload)
 
 
 @router.get("/products/{product_id}", response_model=Product)
@@ -56,4 +66,5 @@ async def get_product(product_id: str):
 async def refresh_cache():
     """Очистить кеш Google Sheets"""
     sheets_service.clear_cache()
+    catalog_response_cache.clear()
     return {"status": "ok", "message": "Cache cleared"}
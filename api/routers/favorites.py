@@ -1,50 +1,92 @@
 """
 API endpoints для работы с избранным
 """
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, delete
-from typing import List
-
-from api.database import get_db
-from api.models import Favorite, User
-from api.schemas import FavoriteCreate, FavoriteResponse
+from sqlalchemy import select, delete, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import IntegrityError
+from datetime import datetime
+from typing import List, Literal, Optional, Tuple, Union
+import hashlib
+
+from api.database import get_db, get_read_db, pin_primary_reads, is_foreign_key_violation
+from api.models import Favorite
+from api.services.sheets import sheets_service
+from api.services.pagination import encode_cursor, decode_cursor
+from api.schemas import (
+    FavoriteCreate,
+    FavoriteResponse,
+    FavoritesPageResponse,
+    FavoriteIdsResponse,
+    FavoriteCheckRequest,
+    FavoriteCheckResponse
+)
 
 router = APIRouter(prefix="/favorites", tags=["favorites"])
 
+# Максимальный размер страницы избранного с данными товаров
+FAVORITES_PAGE_MAX = 100
+
+
+def _build_add_query(user_tg_id: int, product_id: str):
+    """
+    Одна команда: вставка или возврат существующей записи,
+    существование пользователя проверяет внешний ключ
+    """
+    stmt = insert(Favorite).values(user_id=user_tg_id, product_id=product_id)
+    return stmt.on_conflict_do_update(
+        constraint='unique_user_product',
+        set_={"product_id": stmt.excluded.product_id}
+    ).returning(Favorite)
+
+
+def _build_remove_query(user_tg_id: int, product_id: str):
+    return delete(Favorite).where(Favorite.user_id == user_tg_id, Favorite.product_id == product_id)
+
+
+def _build_list_query(user_tg_id: int):
+    return select(Favorite).where(Favorite.user_id == user_tg_id).order_by(Favorite.added_at.desc())
 
-@router.post("/", response_model=FavoriteResponse)
-async def add_to_favorites(favorite: FavoriteCreate, db: AsyncSession = Depends(get_db)):
-    """Добавить товар в избранное. user_id здесь - это tg_id."""
-    # Проверяем существование пользователя по tg_id
-    result = await db.execute(select(User).where(User.tg_id == favorite.user_id))
-    user = result.scalar_one_or_none()
-
-    if not user:
-        raise HTTPException(status_code=404, detail="User with this tg_id not found")
-
-    # Проверяем, есть ли уже в избранном
-    result = await db.execute(
-        select(Favorite).where(
-            Favorite.user_id == favorite.user_id,
-            Favorite.product_id == favorite.product_id
-        )
-    )
-    existing = result.scalar_one_or_none()
 
-    if existing:
-        return existing
+def _build_page_query(user_tg_id: int, after: Optional[Tuple[datetime, int]], limit: int):
+    """Страница избранного (keyset по added_at, id) с лишней строкой - признаком следующей страницы"""
+    query = select(Favorite).where(Favorite.user_id == user_tg_id)
+    if after is not None:
+        query = query.where(tuple_(Favorite.added_at, Favorite.id) < tuple_(*after))
+    return query.order_by(Favorite.added_at.desc(), Favorite.id.desc()).limit(limit + 1)
 
-    # Создаем новую запись
-    new_favorite = Favorite(
-        user_id=favorite.user_id,
-        product_id=favorite.product_id
+
+def _build_check_query(user_tg_id: int, product_id: str):
+    return select(Favorite).where(Favorite.user_id == user_tg_id, Favorite.product_id == product_id)
+
+
+def _build_ids_query(user_tg_id: int):
+    # Index-only scan по unique_user_product (user_id, product_id)
+    return select(Favorite.product_id).where(Favorite.user_id == user_tg_id).order_by(Favorite.product_id)
+
+
+def _build_check_batch_query(user_tg_id: int, product_ids: List[str]):
+    return select(Favorite.product_id).where(
+        Favorite.user_id == user_tg_id,
+        Favorite.product_id.in_(product_ids)
     )
 
-    db.add(new_favorite)
-    await db.commit()
-    await db.refresh(new_favorite)
 
+@router.post("/", response_model=FavoriteResponse)
+async def add_to_favorites(favorite: FavoriteCreate, db: AsyncSession = Depends(get_db)):
+    """Добавить товар в избранное. user_id здесь - это tg_id."""
+    try:
+        result = await db.execute(_build_add_query(favorite.user_id, favorite.product_id))
+        new_favorite = result.scalar_one()
+        await db.commit()
+    except IntegrityError as e:
+        await db.rollback()
+        if is_foreign_key_violation(e):
+            raise HTTPException(status_code=404, detail="User with this tg_id not found")
+        raise
+
+    await pin_primary_reads(favorite.user_id)
     return new_favorite
 
 
@@ -55,43 +97,116 @@ async def remove_from_favorites(
     db: AsyncSession = Depends(get_db)
 ):
     """Удалить товар из избранного по tg_id"""
-    await db.execute(
-        delete(Favorite).where(
-            Favorite.user_id == user_tg_id,
-            Favorite.product_id == product_id
-        )
-    )
+    await db.execute(_build_remove_query(user_tg_id, product_id))
     await db.commit()
+    await pin_primary_reads(user_tg_id)
 
     return {"status": "ok", "message": "Removed from favorites"}
 
 
-@router.get("/{user_tg_id}", response_model=List[FavoriteResponse])
-async def get_favorites(user_tg_id: int, db: AsyncSession = Depends(get_db)):
-    """Получить список избранного пользователя по tg_id"""
-    result = await db.execute(
-        select(Favorite)
-        .where(Favorite.user_id == user_tg_id)
-        .order_by(Favorite.added_at.desc())
-    )
+@router.get("/{user_tg_id}", response_model=Union[List[FavoriteResponse], FavoritesPageResponse])
+async def get_favorites(
+    user_tg_id: int,
+    expand: Optional[Literal["product"]] = Query(None, description="product - добавить данные товара из каталога"),
+    limit: int = Query(20, ge=1, le=FAVORITES_PAGE_MAX),
+    cursor: Optional[str] = Query(None, description="next_cursor предыдущей страницы"),
+    include_unavailable: bool = Query(False, description="Не скрывать товары, которых нет в каталоге"),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """
+    Получить список избранного пользователя по tg_id
+
+    С expand=product возвращается страница записей с данными товаров из каталога
+    (keyset-пагинация по added_at, id). Неактивные и удаленные из каталога товары
+    скрываются, либо помечаются available=false при include_unavailable=true.
+    """
+    if expand != "product":
+        result = await db.execute(_build_list_query(user_tg_id))
+        return result.scalars().all()
+
+    # Лишняя строка показывает, есть ли следующая страница
+    after = decode_cursor(cursor) if cursor else None
+    result = await db.execute(_build_page_query(user_tg_id, after, limit))
     favorites = result.scalars().all()
-
-    return favorites
+    has_more = len(favorites) > limit
+    favorites = favorites[:limit]
+
+    products = sheets_service.get_products_index()
+    items = []
+    for favorite in favorites:
+        product = products.get(favorite.product_id)
+        available = bool(product and product.get('is_active'))
+        if not available and not include_unavailable:
+            continue
+        items.append({
+            "id": favorite.id,
+            "product_id": favorite.product_id,
+            "added_at": favorite.added_at,
+            "available": available,
+            "product": product if available else None
+        })
+
+    next_cursor = None
+    if has_more:
+        last = favorites[-1]
+        next_cursor = encode_cursor(last.added_at, last.id)
+
+    return {"items": items, "next_cursor": next_cursor}
 
 
 @router.get("/{user_tg_id}/check/{product_id}")
 async def check_favorite(
     user_tg_id: int,
     product_id: str,
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """Проверить, находится ли товар в избранном по tg_id"""
-    result = await db.execute(
-        select(Favorite).where(
-            Favorite.user_id == user_tg_id,
-            Favorite.product_id == product_id
-        )
-    )
+    result = await db.execute(_build_check_query(user_tg_id, product_id))
     favorite = result.scalar_one_or_none()
 
     return {"is_favorite": favorite is not None}
+
+
+def _favorite_ids_etag(product_ids: List[str]) -> str:
+    """ETag набора избранного (product_ids отсортированы)"""
+    digest = hashlib.sha1("\n".join(product_ids).encode("utf-8")).hexdigest()
+    return f'"{digest}"'
+
+
+@router.get("/{user_tg_id}/ids", response_model=FavoriteIdsResponse)
+async def get_favorite_ids(
+    user_tg_id: int,
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_read_db)
+):
+    """
+    Получить все product_id избранного пользователя одним запросом
+
+    Поддерживает If-None-Match: если набор не изменился, возвращается 304 без тела.
+    """
+    result = await db.execute(_build_ids_query(user_tg_id))
+    product_ids = list(result.scalars().all())
+    etag = _favorite_ids_etag(product_ids)
+
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+
+    response.headers["ETag"] = etag
+    return {"product_ids": product_ids, "etag": etag}
+
+
+@router.post("/{user_tg_id}/check", response_model=FavoriteCheckResponse)
+async def check_favorites_batch(
+    user_tg_id: int,
+    request: FavoriteCheckRequest,
+    db: AsyncSession = Depends(get_read_db)
+):
+    """Проверить сразу несколько товаров на наличие в избранном по tg_id"""
+    if not request.product_ids:
+        return {"favorites": {}}
+
+    result = await db.execute(_build_check_batch_query(user_tg_id, request.product_ids))
+    found = set(result.scalars().all())
+
+    return {"favorites": {product_id: product_id in found for product_id in request.product_ids}}
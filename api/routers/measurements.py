@@ -1,18 +1,41 @@
 """
 API endpoints для работы с параметрами пользователей
 """
+from typing import Any, Dict
+
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.sql import func
 
-from api.database import get_db
-from api.models import UserMeasurement, User
+from api.database import get_db, get_read_db, pin_primary_reads, is_foreign_key_violation
+from api.models import UserMeasurement
 from api.schemas import MeasurementsCreate, MeasurementsResponse
 
 router = APIRouter(prefix="/measurements", tags=["measurements"])
 
 
+def _build_upsert_query(user_tg_id: int, update_data: Dict[str, Any]):
+    """
+    Одна команда: вставка или частичное обновление существующей записи,
+    существование пользователя проверяет внешний ключ
+    """
+    stmt = insert(UserMeasurement).values(user_id=user_tg_id, **update_data)
+    return stmt.on_conflict_do_update(
+        index_elements=[UserMeasurement.user_id],
+        set_={
+            **{field: stmt.excluded[field] for field in update_data},
+            "updated_at": func.now()
+        }
+    ).returning(UserMeasurement)
+
+
+def _build_measurements_query(user_tg_id: int):
+    return select(UserMeasurement).where(UserMeasurement.user_id == user_tg_id)
+
+
 @router.post("/{user_tg_id}", response_model=MeasurementsResponse)
 async def create_or_update_measurements(
     user_tg_id: int,
@@ -20,50 +43,27 @@ async def create_or_update_measurements(
     db: AsyncSession = Depends(get_db)
 ):
     """Создать или обновить параметры пользователя по tg_id (частичное обновление)"""
-    # Проверяем существование пользователя
-    result = await db.execute(select(User).where(User.tg_id == user_tg_id))
-    user = result.scalar_one_or_none()
-
-    if not user:
-        raise HTTPException(status_code=404, detail="User with this tg_id not found")
-
-    # Проверяем, существуют ли уже параметры
-    result = await db.execute(
-        select(UserMeasurement).where(UserMeasurement.user_id == user_tg_id)
-    )
-    existing = result.scalar_one_or_none()
-
     # Получаем только переданные поля (не None)
     update_data = measurements.model_dump(exclude_unset=True)
 
-    if existing:
-        # Обновляем только переданные поля
-        for field, value in update_data.items():
-            setattr(existing, field, value)
-        existing.updated_at = func.now()
-
+    try:
+        result = await db.execute(_build_upsert_query(user_tg_id, update_data))
+        saved = result.scalar_one()
         await db.commit()
-        await db.refresh(existing)
-        return existing
-    else:
-        # Создаем новую запись с переданными полями
-        new_measurements = UserMeasurement(
-            user_id=user_tg_id,
-            **update_data
-        )
+    except IntegrityError as e:
+        await db.rollback()
+        if is_foreign_key_violation(e):
+            raise HTTPException(status_code=404, detail="User with this tg_id not found")
+        raise
 
-        db.add(new_measurements)
-        await db.commit()
-        await db.refresh(new_measurements)
-        return new_measurements
+    await pin_primary_reads(user_tg_id)
+    return saved
 
 
 @router.get("/{user_tg_id}", response_model=MeasurementsResponse)
-async def get_measurements(user_tg_id: int, db: AsyncSession = Depends(get_db)):
+async def get_measurements(user_tg_id: int, db: AsyncSession = Depends(get_read_db)):
     """Получить параметры пользователя по tg_id"""
-    result = await db.execute(
-        select(UserMeasurement).where(UserMeasurement.user_id == user_tg_id)
-    )
+    result = await db.execute(_build_measurements_query(user_tg_id))
     measurements = result.scalar_one_or_none()
 
     if not measurements:
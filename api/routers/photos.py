@@ -1,33 +1,60 @@
 """
 API endpoints для работы с фото пользователей и примерками
 """
-from fastapi import APIRouter, HTTPException, Depends, File, UploadFile, Form
+from fastapi import APIRouter, HTTPException, Depends, File, UploadFile, Form, Header, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, delete, and_
-from typing import List, Optional
+from sqlalchemy import select, func, delete, update, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import IntegrityError
+from typing import Dict, Literal, Optional, Tuple
 from datetime import datetime, date
-import os
 import logging
-import uuid
 
 from pydantic import BaseModel
 
-from api.database import get_db
-from api.models import User, UserPhoto, TryOnHistory
+from api.database import get_db, get_read_db, pin_primary_reads, is_foreign_key_violation
+from api.models import User, UserPhoto, TryOnHistory, Blob
 from api.schemas import (
     UserPhotoCreate,
     UserPhotoResponse,
     UserPhotosResponse,
     TryOnHistoryCreate,
     TryOnHistoryResponse,
-    TryOnHistoryListResponse
+    TryOnJobClaimRequest,
+    TryOnJobFailRequest,
+    TryOnJobResponse,
+    TryOnHistoryListResponse,
+    TryOnHistoryCountResponse
 )
 from api.services.sheets import sheets_service
+from api.services.tryon_quota import tryon_quota_service
+from api.services.tryon_queue import tryon_queue
+from api.services.uploads import UploadTooLargeError
+from api.services.blob_store import blob_store, is_blob_key
+from api.services.pagination import encode_cursor, decode_cursor
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(tags=["photos"])
 
+# Максимальный размер страницы истории примерок
+TRYON_HISTORY_PAGE_MAX = 100
+
+# Столбцы записи истории (без лишних данных строки)
+HISTORY_COLUMNS = (
+    TryOnHistory.id,
+    TryOnHistory.user_id,
+    TryOnHistory.product_id,
+    TryOnHistory.user_photo_id,
+    TryOnHistory.result_file_path,
+    TryOnHistory.preview_file_path,
+    TryOnHistory.created_at,
+    TryOnHistory.status,
+    TryOnHistory.wb_link,
+    TryOnHistory.ozon_url,
+)
+
 
 class TryOnStatsResponse(BaseModel):
     total: int
@@ -38,8 +65,150 @@ class TryOnStatsResponse(BaseModel):
     success_rate: float
 
 
-# Определяем базовую директорию для хранения фото в контейнере
-USER_PHOTOS_DIR = "/app/storage/user_photos"
+def _photo_url(photo_id: int) -> str:
+    return f"/api/photos/{photo_id}/file"
+
+
+def _result_url(tryon_id: int, variant: Optional[str] = None) -> str:
+    url = f"/api/tryon/{tryon_id}/result"
+    return f"{url}?variant={variant}" if variant else url
+
+
+def _parse_range(range_header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Диапазон из заголовка Range (один диапазон байт)
+
+    Returns:
+        (start, end) включительно или None - отдать файл целиком
+
+    Raises:
+        HTTPException 416: диапазон вне файла
+    """
+    if not range_header or not range_header.startswith("bytes=") or "," in range_header:
+        return None
+
+    start_str, _, end_str = range_header[len("bytes="):].strip().partition("-")
+    try:
+        if start_str:
+            start = int(start_str)
+            end = int(end_str) if end_str else size - 1
+        else:
+            # bytes=-N: последние N байт
+            start = max(size - int(end_str), 0)
+            end = size - 1
+    except ValueError:
+        return None
+
+    if start >= size or start > end:
+        raise HTTPException(
+            status_code=416,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{size}"}
+        )
+    return start, min(end, size - 1)
+
+
+def _build_photo_count_query(user_id: int):
+    return select(func.count(UserPhoto.id)).where(UserPhoto.user_id == user_id)
+
+
+def _build_delete_oldest_photo_query(user_id: int):
+    """Удаление самого старого фото (примерки удаляются каскадом)"""
+    oldest_photo_id = (
+        select(UserPhoto.id)
+        .where(UserPhoto.user_id == user_id)
+        .order_by(UserPhoto.uploaded_at.asc())
+        .limit(1)
+        .scalar_subquery()
+    )
+    return delete(UserPhoto).where(UserPhoto.id == oldest_photo_id)
+
+
+def _build_photos_query(tg_id: int):
+    return select(UserPhoto).where(UserPhoto.user_id == tg_id).order_by(UserPhoto.uploaded_at.desc())
+
+
+def _build_photo_file_query(photo_id: int):
+    return select(UserPhoto.file_path).where(UserPhoto.id == photo_id)
+
+
+def _build_update_tryon_query(tryon_id: int, values: Dict):
+    """Одна команда: обновление + предыдущий статус (строка блокируется в подзапросе)"""
+    previous = (
+        select(TryOnHistory.id, TryOnHistory.status)
+        .where(TryOnHistory.id == tryon_id)
+        .with_for_update()
+        .subquery("previous")
+    )
+    return (
+        update(TryOnHistory)
+        .where(TryOnHistory.id == previous.c.id)
+        .values(**values)
+        .returning(TryOnHistory.user_id, TryOnHistory.created_at, previous.c.status.label("previous_status"))
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _build_tryon_result_query(tryon_id: int, variant: str):
+    """Ссылка на файл варианта результата (или сам результат) и тип содержимого"""
+    columns = {
+        "full": TryOnHistory.result_file_path,
+        "preview": TryOnHistory.preview_file_path,
+        "original": TryOnHistory.original_file_path,
+    }
+    ref_column = func.coalesce(columns[variant], TryOnHistory.result_file_path)
+    return (
+        select(ref_column, Blob.content_type)
+        .select_from(TryOnHistory)
+        .outerjoin(Blob, Blob.key == ref_column)
+        .where(TryOnHistory.id == tryon_id)
+    )
+
+
+def _build_history_page_query(tg_id: int, before: Optional[Tuple[datetime, int]], limit: int):
+    """Страница истории (keyset по created_at, id) с лишней строкой - признаком следующей страницы"""
+    query = select(*HISTORY_COLUMNS).where(
+        TryOnHistory.user_id == tg_id,
+        TryOnHistory.status == "success"
+    )
+    if before is not None:
+        query = query.where(tuple_(TryOnHistory.created_at, TryOnHistory.id) < tuple_(*before))
+    return query.order_by(TryOnHistory.created_at.desc(), TryOnHistory.id.desc()).limit(limit + 1)
+
+
+def _build_history_count_query(tg_id: int):
+    return select(func.count()).select_from(TryOnHistory).where(
+        TryOnHistory.user_id == tg_id,
+        TryOnHistory.status == "success"
+    )
+
+
+async def _file_response(ref: Optional[str], range_header: Optional[str], media_type: str) -> StreamingResponse:
+    """Потоковая отдача файла из хранилища с поддержкой Range"""
+    size = await blob_store.size(ref) if ref else None
+    if size is None:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    headers = {"Accept-Ranges": "bytes"}
+    if is_blob_key(ref):
+        # Содержимое объекта по ключу не меняется
+        headers["ETag"] = f'"{ref}"'
+        headers["Cache-Control"] = "private, max-age=31536000, immutable"
+
+    byte_range = _parse_range(range_header, size)
+    if byte_range is None:
+        headers["Content-Length"] = str(size)
+        return StreamingResponse(blob_store.iter_range(ref), media_type=media_type, headers=headers)
+
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        blob_store.iter_range(ref, start, end),
+        status_code=206,
+        media_type=media_type,
+        headers=headers
+    )
 
 
 # === Photo Management ===
@@ -55,7 +224,6 @@ async def upload_photo(
     """
     Загрузка файла фото и сохранение информации в БД
     """
-    file_path = None
     try:
         # Проверяем пользователя
         result = await db.execute(select(User).where(User.tg_id == user_id))
@@ -64,47 +232,27 @@ async def upload_photo(
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
 
-        # Создаем директорию пользователя, если ее нет
-        user_dir = os.path.join(USER_PHOTOS_DIR, str(user_id))
-        os.makedirs(user_dir, exist_ok=True)
-        
-        # Генерируем уникальное имя файла, чтобы избежать конфликтов
-        file_extension = os.path.splitext(file.filename)[1]
-        unique_filename = f"{uuid.uuid4()}{file_extension}"
-        file_path = os.path.join(user_dir, unique_filename)
-        
-        # Сохраняем файл
-        with open(file_path, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
+        # Сохраняем файл в blob store (потоково, одинаковые файлы хранятся один раз)
+        try:
+            blob = await blob_store.put_upload(db, file)
+        except UploadTooLargeError as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        logger.info(f"Saved photo for user {user_id}: {blob.size} bytes, blob={blob.key}")
 
         # Проверяем лимит фото (максимум 3)
-        result = await db.execute(
-            select(func.count(UserPhoto.id)).where(UserPhoto.user_id == user_id)
-        )
+        result = await db.execute(_build_photo_count_query(user_id))
         photo_count = result.scalar() or 0
 
         if photo_count >= 3:
-            # Удаляем самое старое фото
-            result = await db.execute(
-                select(UserPhoto)
-                .where(UserPhoto.user_id == user_id)
-                .order_by(UserPhoto.uploaded_at.asc())
-                .limit(1)
-            )
-            oldest_photo = result.scalar_one_or_none()
-
-            if oldest_photo:
-                # Удаляем файл со диска
-                if oldest_photo.file_path and os.path.exists(oldest_photo.file_path):
-                    os.remove(oldest_photo.file_path)
-                await db.delete(oldest_photo)
+            # Удаляем самое старое фото (примерки удаляются каскадом,
+            # файлы ставят в outbox удаления триггеры БД)
+            await db.execute(_build_delete_oldest_photo_query(user_id))
 
         # Создаем новое фото
         new_photo = UserPhoto(
             user_id=user_id,
             file_id=file_id,
-            file_path=file_path,
+            file_path=blob.key,
             consent_given=consent_given,
             is_active=True
         )
@@ -112,6 +260,7 @@ async def upload_photo(
         db.add(new_photo)
         await db.commit()
         await db.refresh(new_photo)
+        await pin_primary_reads(user_id)
 
         return {
             "success": True,
@@ -119,35 +268,30 @@ async def upload_photo(
                 "id": new_photo.id,
                 "file_id": new_photo.file_id,
                 "file_path": new_photo.file_path,
-                "uploaded_at": new_photo.uploaded_at.isoformat()
+                "file_url": _photo_url(new_photo.id),
+                "uploaded_at": new_photo.uploaded_at.isoformat(),
+                "blob_key": blob.key,
+                "size": blob.size
             }
         }
 
     except HTTPException:
         await db.rollback()
-        if file_path and os.path.exists(file_path):
-            os.remove(file_path)
         raise
     except Exception as e:
+        # Без commit ссылка на blob не сохраняется
         await db.rollback()
-        # Попытаемся удалить сохраненный файл, если что-то пошло не так
-        if file_path and os.path.exists(file_path):
-            os.remove(file_path)
         logger.error(f"Failed to upload photo: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Internal server error during file upload.")
 
 
 @router.get("/photos/{tg_id}")
-async def get_user_photos(tg_id: int, db: AsyncSession = Depends(get_db)):
+async def get_user_photos(tg_id: int, db: AsyncSession = Depends(get_read_db)):
     """
     Получение всех фото пользователя
     """
     try:
-        result = await db.execute(
-            select(UserPhoto)
-            .where(UserPhoto.user_id == tg_id)
-            .order_by(UserPhoto.uploaded_at.desc())
-        )
+        result = await db.execute(_build_photos_query(tg_id))
         photos = result.scalars().all()
 
         return {
@@ -157,6 +301,7 @@ async def get_user_photos(tg_id: int, db: AsyncSession = Depends(get_db)):
                     "id": photo.id,
                     "file_id": photo.file_id,
                     "file_path": photo.file_path,
+                    "file_url": _photo_url(photo.id),
                     "uploaded_at": photo.uploaded_at.isoformat(),
                     "is_active": photo.is_active
                 }
@@ -175,18 +320,15 @@ async def delete_photo(photo_id: int, db: AsyncSession = Depends(get_db)):
     Удаление фото пользователя
     """
     try:
-        result = await db.execute(select(UserPhoto).where(UserPhoto.id == photo_id))
-        photo = result.scalar_one_or_none()
-
-        if not photo:
+        # Примерки фото удаляются каскадом, файлы ставят в outbox удаления триггеры БД
+        result = await db.execute(
+            delete(UserPhoto).where(UserPhoto.id == photo_id).returning(UserPhoto.user_id)
+        )
+        user_id = result.scalar_one_or_none()
+        if user_id is None:
             raise HTTPException(status_code=404, detail="Photo not found")
-
-        # Удаляем файл
-        if os.path.exists(photo.file_path):
-            os.remove(photo.file_path)
-
-        await db.delete(photo)
         await db.commit()
+        await pin_primary_reads(user_id)
 
         return {"success": True, "message": "Photo deleted"}
 
@@ -197,58 +339,82 @@ async def delete_photo(photo_id: int, db: AsyncSession = Depends(get_db)):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/photos/{photo_id}/file")
+async def get_photo_file(
+    photo_id: int,
+    range_header: Optional[str] = Header(None, alias="Range"),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Файл фото пользователя (поддерживается Range)
+    """
+    result = await db.execute(_build_photo_file_query(photo_id))
+    ref = result.scalar_one_or_none()
+    if ref is None:
+        raise HTTPException(status_code=404, detail="Photo not found")
+
+    return await _file_response(ref, range_header, "image/jpeg")
+
+
 # === Try-On Management ===
 
 @router.post("/tryon/create")
 async def create_tryon(req: TryOnHistoryCreate, db: AsyncSession = Depends(get_db)):
     """
-    Создание записи о примерке (статус processing)
+    Постановка примерки в очередь генерации (статус queued)
+
+    Ответ возвращается сразу, генерацию выполняют воркеры (POST /tryon/jobs/claim).
     """
     try:
-        # Проверяем rate limit (10 примерок в день)
-        today = date.today()
-        result = await db.execute(
-            select(func.count(TryOnHistory.id))
-            .where(
-                and_(
-                    TryOnHistory.user_id == req.user_id,
-                    func.date(TryOnHistory.created_at) == today
-                )
-            )
-        )
-        today_count = result.scalar() or 0
-
-        if today_count >= 10:
+        # Атомарно занимаем примерку из дневного лимита
+        allowed, _used = await tryon_quota_service.reserve(db, req.user_id)
+        if not allowed:
+            limit = tryon_quota_service.get_limit(req.user_id)
             return {
                 "success": False,
                 "error": "rate_limit",
-                "message": "Ты достиг лимита примерок на сегодня (10/10). Попробуй завтра! 😊"
+                "message": f"Ты достиг лимита примерок на сегодня ({limit}/{limit}). Попробуй завтра! 😊"
             }
 
-        # Получаем данные о товаре из Google Sheets
-        product = sheets_service.get_product_by_id(req.product_id)
-        wb_link = product.get("wb_link") if product else None
-        ozon_url = product.get("ozon_url") if product else None
-
-        # Создаем запись
-        tryon = TryOnHistory(
-            user_id=req.user_id,
-            product_id=req.product_id,
-            user_photo_id=req.user_photo_id,
-            status="processing",
-            wb_link=wb_link,
-            ozon_url=ozon_url
-        )
+        try:
+            # Получаем данные о товаре из Google Sheets
+            product = sheets_service.get_product_by_id(req.product_id)
+            wb_link = product.get("wb_link") if product else None
+            ozon_url = product.get("ozon_url") if product else None
 
-        db.add(tryon)
-        await db.commit()
-        await db.refresh(tryon)
+            # Создаем запись, пользователя и фото проверяют внешние ключи
+            result = await db.execute(
+                insert(TryOnHistory)
+                .values(
+                    user_id=req.user_id,
+                    product_id=req.product_id,
+                    user_photo_id=req.user_photo_id,
+                    status="queued",
+                    wb_link=wb_link,
+                    ozon_url=ozon_url,
+                    job_payload=req.job.model_dump()
+                )
+                .returning(TryOnHistory.id)
+            )
+            tryon_id = result.scalar_one()
+            await db.commit()
+            await pin_primary_reads(req.user_id)
+        except Exception as e:
+            # Запись не создана - возвращаем примерку в лимит
+            await db.rollback()
+            await tryon_quota_service.refund(req.user_id, date.today())
+            if isinstance(e, IntegrityError) and is_foreign_key_violation(e):
+                raise HTTPException(status_code=404, detail="User or photo not found")
+            raise
 
         return {
             "success": True,
-            "tryon_id": tryon.id
+            "tryon_id": tryon_id,
+            "status": "queued"
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Failed to create try-on: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -270,19 +436,24 @@ async def update_tryon(
     Обновление записи о примерке после генерации
     """
     try:
-        result = await db.execute(select(TryOnHistory).where(TryOnHistory.id == tryon_id))
-        tryon = result.scalar_one_or_none()
-
-        if not tryon:
-            raise HTTPException(status_code=404, detail="Try-on not found")
-
-        tryon.status = req.status
+        values = {"status": req.status}
         if req.result_file_path is not None:
-            tryon.result_file_path = req.result_file_path
+            values["result_file_path"] = req.result_file_path
         if req.generation_time is not None:
-            tryon.generation_time = req.generation_time
+            values["generation_time"] = req.generation_time
+
+        result = await db.execute(_build_update_tryon_query(tryon_id, values))
+        row = result.first()
+
+        if not row:
+            raise HTTPException(status_code=404, detail="Try-on not found")
 
         await db.commit()
+        await pin_primary_reads(row.user_id)
+
+        # Неудачная генерация не расходует дневной лимит
+        if req.status == "failed" and row.previous_status != "failed":
+            await tryon_quota_service.refund(row.user_id, row.created_at.astimezone().date())
 
         logger.info(f"Updated try-on {tryon_id}: status={req.status}, path={req.result_file_path}")
 
@@ -295,64 +466,219 @@ async def update_tryon(
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@router.get("/tryon/history/{tg_id}", response_model=TryOnHistoryListResponse)
-async def get_tryon_history(tg_id: int, db: AsyncSession = Depends(get_db)):
+# === Try-On Job Queue ===
+
+@router.post("/tryon/jobs/claim")
+async def claim_tryon_job(req: TryOnJobClaimRequest, db: AsyncSession = Depends(get_db)):
+    """
+    Взять следующую задачу генерации (FOR UPDATE SKIP LOCKED) под аренду воркера
+
+    Returns:
+        {"job": задача или null, если очередь пуста}
+    """
+    try:
+        job = await tryon_queue.claim(db, req.worker_id)
+    except Exception as e:
+        await db.rollback()
+        logger.error(f"Failed to claim try-on job: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+    if job is None:
+        return {"job": None}
+
+    job["user_photo_url"] = _photo_url(job["user_photo_id"])
+    logger.info(f"Try-on job {job['id']} claimed by {req.worker_id} (attempt {job['attempts']})")
+    return {"job": TryOnJobResponse(**job)}
+
+
+@router.post("/tryon/jobs/{tryon_id}/heartbeat")
+async def heartbeat_tryon_job(tryon_id: int, req: TryOnJobClaimRequest, db: AsyncSession = Depends(get_db)):
+    """Продлить аренду задачи; 409 - аренда потеряна, воркер должен бросить задачу"""
+    lease = await tryon_queue.heartbeat(db, tryon_id, req.worker_id)
+    if lease is None:
+        raise HTTPException(status_code=409, detail="Try-on job lease lost")
+    return lease
+
+
+@router.post("/tryon/jobs/{tryon_id}/fail")
+async def fail_tryon_job(tryon_id: int, req: TryOnJobFailRequest, db: AsyncSession = Depends(get_db)):
+    """
+    Завершить попытку ошибкой: при retry задача возвращается в очередь, пока
+    не исчерпаны попытки, иначе примерка помечается failed
+    """
+    status = await tryon_queue.fail(db, tryon_id, req.worker_id, req.error, req.retry)
+    if status is None:
+        raise HTTPException(status_code=409, detail="Try-on job lease lost")
+
+    logger.info(f"Try-on job {tryon_id} failed on {req.worker_id}: {req.error} -> {status}")
+    return {"success": True, "status": status}
+
+
+@router.post("/tryon/{tryon_id}/result")
+async def upload_tryon_result(
+    tryon_id: int,
+    generation_time: Optional[int] = Form(None),
+    worker_id: Optional[str] = Form(None),
+    file: UploadFile = File(...),
+    db: AsyncSession = Depends(get_db)
+):
     """
-    Получение истории примерок пользователя
+    Загрузка результата примерки: файл сохраняется в blob store, примерка помечается успешной
+
+    С worker_id результат принимается, только пока воркер держит аренду задачи (иначе 409).
     """
     try:
+        try:
+            blob = await blob_store.put_upload(db, file)
+        except UploadTooLargeError as e:
+            raise HTTPException(status_code=413, detail=str(e))
+
+        # Новый результат снова проходит retention с начала
+        values = {
+            "status": "success",
+            "result_file_path": blob.key,
+            "preview_file_path": None,
+            "original_file_path": None,
+            "retention_applied_at": None,
+            "locked_by": None,
+            "lease_expires_at": None,
+        }
+        if generation_time is not None:
+            values["generation_time"] = generation_time
+
+        query = update(TryOnHistory).where(TryOnHistory.id == tryon_id)
+        if worker_id is not None:
+            query = query.where(TryOnHistory.status == "processing", TryOnHistory.locked_by == worker_id)
+
+        # Предыдущий результат ставит в outbox удаления триггер БД
         result = await db.execute(
-            select(TryOnHistory)
-            .where(
-                and_(
-                    TryOnHistory.user_id == tg_id,
-                    TryOnHistory.status == "success"
-                )
-            )
-            .order_by(TryOnHistory.created_at.desc())
+            query
+            .values(**values)
+            .returning(TryOnHistory.user_id)
+            .execution_options(synchronize_session=False)
         )
-        history = result.scalars().all()
+        user_id = result.scalar_one_or_none()
+        if user_id is None:
+            if worker_id is not None:
+                raise HTTPException(status_code=409, detail="Try-on job lease lost")
+            raise HTTPException(status_code=404, detail="Try-on not found")
+
+        await db.commit()
+        await pin_primary_reads(user_id)
+
+        logger.info(f"Stored try-on {tryon_id} result: {blob.size} bytes, blob={blob.key}")
 
         return {
-            "history": [
-                {
-                    "id": item.id,
-                    "user_id": item.user_id,
-                    "product_id": item.product_id,
-                    "user_photo_id": item.user_photo_id,
-                    "result_file_path": item.result_file_path,
-                    "created_at": item.created_at,
-                    "status": item.status,
-                    "wb_link": item.wb_link,
-                    "ozon_url": item.ozon_url,
-                }
-                for item in history
-            ]
+            "success": True,
+            "result_file_path": blob.key,
+            "result_url": _result_url(tryon_id),
+            "blob_key": blob.key
         }
 
+    except HTTPException:
+        await db.rollback()
+        raise
+    except Exception as e:
+        await db.rollback()
+        logger.error(f"Failed to store try-on result: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/tryon/{tryon_id}/result")
+async def get_tryon_result(
+    tryon_id: int,
+    variant: Literal["full", "preview", "original"] = Query(
+        "full", description="preview - уменьшенная копия, original - оригинал до пережатия"
+    ),
+    range_header: Optional[str] = Header(None, alias="Range"),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Файл результата примерки (поддерживается Range)
+
+    После retention результат пережат; preview и original отдают
+    уменьшенную копию и оригинал, а без них - сам результат.
+    """
+    result = await db.execute(_build_tryon_result_query(tryon_id, variant))
+    row = result.first()
+    if row is None or row[0] is None:
+        raise HTTPException(status_code=404, detail="Try-on result not found")
+
+    ref, content_type = row
+    return await _file_response(ref, range_header, content_type or "image/png")
+
+
+@router.get("/tryon/history/{tg_id}", response_model=TryOnHistoryListResponse)
+async def get_tryon_history(
+    tg_id: int,
+    limit: int = Query(20, ge=1, le=TRYON_HISTORY_PAGE_MAX),
+    before: Optional[str] = Query(None, description="next_cursor предыдущей страницы"),
+    expand: Optional[Literal["product"]] = Query(None, description="product - добавить название товара из каталога"),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """
+    Получение страницы истории примерок пользователя
+
+    Keyset-пагинация по (created_at, id) от новых к старым, выбираются только
+    нужные столбцы (индекс ix_try_on_history_user_success_created).
+    """
+    try:
+        # Лишняя строка показывает, есть ли следующая страница
+        after = decode_cursor(before) if before else None
+        result = await db.execute(_build_history_page_query(tg_id, after, limit))
+        rows = result.all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+
+        products = sheets_service.get_products_index() if expand == "product" else {}
+        history = []
+        for row in rows:
+            item = dict(row._mapping)
+            item["result_url"] = _result_url(row.id) if row.result_file_path else None
+            item["preview_url"] = _result_url(row.id, "preview") if row.preview_file_path else None
+            if expand == "product":
+                product = products.get(row.product_id)
+                item["product_name"] = product["name"] if product else None
+            history.append(item)
+
+        next_cursor = None
+        if has_more:
+            last = rows[-1]
+            next_cursor = encode_cursor(last.created_at, last.id)
+
+        return {"history": history, "next_cursor": next_cursor}
+
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Failed to get try-on history: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/tryon/history/{tg_id}/count", response_model=TryOnHistoryCountResponse)
+async def get_tryon_history_count(tg_id: int, db: AsyncSession = Depends(get_read_db)):
+    """
+    Количество успешных примерок пользователя
+    """
+    result = await db.execute(_build_history_count_query(tg_id))
+    return {"count": result.scalar_one()}
+
+
 @router.delete("/tryon/{tryon_id}")
 async def delete_tryon(tryon_id: int, db: AsyncSession = Depends(get_db)):
     """
     Удаление примерки из истории
     """
     try:
-        result = await db.execute(select(TryOnHistory).where(TryOnHistory.id == tryon_id))
-        tryon = result.scalar_one_or_none()
-
-        if not tryon:
+        # Файл результата ставит в outbox удаления триггер БД
+        result = await db.execute(
+            delete(TryOnHistory).where(TryOnHistory.id == tryon_id).returning(TryOnHistory.user_id)
+        )
+        user_id = result.scalar_one_or_none()
+        if user_id is None:
             raise HTTPException(status_code=404, detail="Try-on not found")
-
-        # Удаляем файл результата
-        if tryon.result_file_path and os.path.exists(tryon.result_file_path):
-            os.remove(tryon.result_file_path)
-
-        await db.delete(tryon)
         await db.commit()
+        await pin_primary_reads(user_id)
 
         return {"success": True, "message": "Try-on deleted"}
 
@@ -369,24 +695,15 @@ async def check_tryon_limit(tg_id: int, db: AsyncSession = Depends(get_db)):
     Проверка лимита примерок на сегодня
     """
     try:
-        today = date.today()
-        result = await db.execute(
-            select(func.count(TryOnHistory.id))
-            .where(
-                and_(
-                    TryOnHistory.user_id == tg_id,
-                    func.date(TryOnHistory.created_at) == today
-                )
-            )
-        )
-        today_count = result.scalar() or 0
+        today_count = await tryon_quota_service.get_usage(db, tg_id)
+        limit = tryon_quota_service.get_limit(tg_id)
 
         return {
             "success": True,
             "count": today_count,
-            "limit": 10,
-            "remaining": max(0, 10 - today_count),
-            "limit_reached": today_count >= 10
+            "limit": limit,
+            "remaining": max(0, limit - today_count),
+            "limit_reached": today_count >= limit
         }
 
     except Exception as e:
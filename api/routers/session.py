@@ -0,0 +1,90 @@
+"""
+API endpoints сессии бота
+
+/start и главное меню получают все нужное одним запросом: пользователь
+регистрируется (если его еще нет) и возвращаются флаги для выбора экрана.
+"""
+from fastapi import APIRouter, Depends
+from sqlalchemy import select, exists, func, literal, union_all
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.database import get_db, pin_primary_reads
+from api.models import User, UserMeasurement, TryOnHistory
+from api.schemas import UserCreate, SessionBootstrapResponse
+from api.services.activity import activity_buffer
+
+router = APIRouter(prefix="/session", tags=["session"])
+
+
+def _build_bootstrap_query(user_data: UserCreate):
+    """
+    Одна команда: вставка пользователя (если его нет) и флаги главного меню
+
+    Вставленная строка берется из CTE, существующая - из users: в одном
+    снимке SELECT не видит вставку, поэтому строк не больше одной.
+    """
+    tg_id = user_data.tg_id
+    user_columns = list(User.__table__.c)
+
+    inserted = (
+        insert(User)
+        .values(tg_id=tg_id, username=user_data.username, first_name=user_data.first_name)
+        .on_conflict_do_nothing(index_elements=[User.tg_id])
+        .returning(*user_columns)
+        .cte("inserted")
+    )
+    user = union_all(
+        select(*inserted.c, literal(True).label("is_new")),
+        select(*user_columns, literal(False).label("is_new")).where(User.tg_id == tg_id),
+    ).subquery("session_user")
+
+    has_measurements = exists().where(UserMeasurement.user_id == tg_id)
+    has_russian_size = exists().where(
+        UserMeasurement.user_id == tg_id,
+        func.coalesce(UserMeasurement.russian_size, "") != ""
+    )
+    # Index-only scan по ix_try_on_history_user_success_created
+    tryon_count = (
+        select(func.count())
+        .select_from(TryOnHistory)
+        .where(TryOnHistory.user_id == tg_id, TryOnHistory.status == "success")
+        .scalar_subquery()
+    )
+
+    return select(
+        user,
+        has_measurements.label("has_measurements"),
+        has_russian_size.label("has_russian_size"),
+        tryon_count.label("tryon_count"),
+    ).limit(1)
+
+
+@router.post("/bootstrap", response_model=SessionBootstrapResponse)
+async def bootstrap_session(user_data: UserCreate, db: AsyncSession = Depends(get_db)):
+    """
+    Начало сессии: регистрация пользователя и данные для главного меню
+
+    Заменяет register + measurements + история примерок при /start и
+    отрисовке главного меню.
+    """
+    stmt = _build_bootstrap_query(user_data)
+    row = (await db.execute(stmt)).one_or_none()
+    if row is None:
+        # Параллельная регистрация: вставка пропущена, а снимок запроса
+        # старше чужого коммита - повтор уже видит пользователя
+        row = (await db.execute(stmt)).one()
+    await db.commit()
+
+    if row.is_new:
+        await pin_primary_reads(row.tg_id)
+    # last_activity обновляется пачкой фоновым сбросом буфера
+    await activity_buffer.touch(db, row.id)
+
+    return {
+        "user": row._mapping,
+        "is_new": row.is_new,
+        "has_measurements": row.has_measurements,
+        "has_russian_size": row.has_russian_size,
+        "tryon_count": row.tryon_count,
+    }
@@ -27,14 +27,7 @@ async def recommend_size(
     measurements = result.scalar_one_or_none()
 
     if not measurements:
-        return SizeRecommendResponse(
-            success=False,
-            recommended_size=None,
-            alternative_size=None,
-            confidence="none",
-            message="📐 Укажи свои параметры, чтобы получить рекомендацию по размеру",
-            details={"reason": "no_measurements"}
-        )
+        return SizeRecommendResponse(**size_matcher_service.recommend_for_product(None, {}))
 
     # Получаем информацию о товаре
     product = sheets_service.get_product_by_id(request.product_id)
@@ -42,37 +35,13 @@ async def recommend_size(
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
 
-    # Получаем таблицу размеров по категории товара
-    size_table_id = product.get('category')
-    if not size_table_id:
+    if not product.get('category'):
         raise HTTPException(status_code=404, detail="Product category not found, cannot determine size table")
 
-    size_table = sheets_service.get_size_table(size_table_id)
-
-    if not size_table:
-        return SizeRecommendResponse(
-            success=False,
-            recommended_size=None,
-            alternative_size=None,
-            confidence="none",
-            message="⚠️ Таблица размеров для данной категории не найдена",
-            details={"reason": "no_size_table_for_category"}
-        )
-
-    # Парсим доступные размеры
-    available_sizes = [s.strip() for s in product.get('available_sizes', '').split(',') if s.strip()]
-
     # Параметры пользователя в виде словаря
     user_measurements_dict = {
         param: getattr(measurements, param, None)
         for param in size_matcher_service.ALL_PARAMS
     }
 
-    # Подбираем размер
-    recommendation = size_matcher_service.recommend_size(
-        user_measurements=user_measurements_dict,
-        size_table=size_table,
-        available_sizes=available_sizes
-    )
-
-    return SizeRecommendResponse(**recommendation)
+    return SizeRecommendResponse(**size_matcher_service.recommend_for_product(user_measurements_dict, product))
@@ -3,52 +3,72 @@ API endpoints для работы с пользователями
 """
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, update
-from sqlalchemy.sql import func
+from sqlalchemy import select, exists, union_all
+from sqlalchemy.dialects.postgresql import insert
 
-from api.database import get_db
+from api.database import get_db, get_read_db, pin_primary_reads
 from api.models import User
 from api.schemas import UserCreate, UserResponse
+from api.services.activity import activity_buffer
 
 router = APIRouter(prefix="/users", tags=["users"])
 
 
+def _build_register_query(user_data: UserCreate):
+    """
+    Одна команда: вставка пользователя или чтение существующего
+
+    Вставленная строка берется из CTE, существующая - из users, только если
+    вставки не было.
+    """
+    user_columns = list(User.__table__.c)
+    inserted = (
+        insert(User)
+        .values(tg_id=user_data.tg_id, username=user_data.username, first_name=user_data.first_name)
+        .on_conflict_do_nothing(index_elements=[User.tg_id])
+        .returning(*user_columns)
+        .cte("inserted")
+    )
+    return union_all(
+        select(*inserted.c),
+        select(*user_columns).where(
+            User.tg_id == user_data.tg_id,
+            ~exists().select_from(inserted)
+        ),
+    )
+
+
+def _build_user_query(user_id: int):
+    return select(User).where(User.id == user_id)
+
+
+def _build_user_by_tg_id_query(tg_id: int):
+    return select(User).where(User.tg_id == tg_id)
+
+
 @router.post("/register", response_model=UserResponse)
 async def register_user(user_data: UserCreate, db: AsyncSession = Depends(get_db)):
     """Регистрация нового пользователя"""
-    # Проверяем, существует ли пользователь
-    result = await db.execute(select(User).where(User.tg_id == user_data.tg_id))
-    existing_user = result.scalar_one_or_none()
-
-    if existing_user:
-        # Обновляем last_activity
-        await db.execute(
-            update(User)
-            .where(User.tg_id == user_data.tg_id)
-            .values(last_activity=func.now())
-        )
-        await db.commit()
-        await db.refresh(existing_user)
-        return existing_user
-
-    # Создаем нового пользователя
-    new_user = User(
-        tg_id=user_data.tg_id,
-        username=user_data.username,
-        first_name=user_data.first_name
-    )
-
-    db.add(new_user)
+    # Новый пользователь создается, существующий только читается
+    stmt = _build_register_query(user_data)
+    user = (await db.execute(stmt)).one_or_none()
+    if user is None:
+        # Параллельная регистрация: вставка пропущена, а снимок запроса
+        # старше чужого коммита - повтор уже видит пользователя
+        user = (await db.execute(stmt)).one()
     await db.commit()
-    await db.refresh(new_user)
+    await pin_primary_reads(user.tg_id)
 
-    return new_user
+    # last_activity обновляется пачкой фоновым сбросом буфера
+    await activity_buffer.touch(db, user.id)
+
+    return user._mapping
 
 
 @router.get("/{user_id}", response_model=UserResponse)
 async def get_user(user_id: int, db: AsyncSession = Depends(get_db)):
     """Получить данные пользователя по ID"""
-    result = await db.execute(select(User).where(User.id == user_id))
+    result = await db.execute(_build_user_query(user_id))
     user = result.scalar_one_or_none()
 
     if not user:
@@ -58,9 +78,9 @@ async def get_user(user_id: int, db: AsyncSession = Depends(get_db)):
 
 
 @router.get("/by-tg-id/{tg_id}", response_model=UserResponse)
-async def get_user_by_tg_id(tg_id: int, db: AsyncSession = Depends(get_db)):
+async def get_user_by_tg_id(tg_id: int, db: AsyncSession = Depends(get_read_db)):
     """Получить данные пользователя по Telegram ID"""
-    result = await db.execute(select(User).where(User.tg_id == tg_id))
+    result = await db.execute(_build_user_by_tg_id_query(tg_id))
     user = result.scalar_one_or_none()
 
     if not user:
@@ -71,12 +91,7 @@ async def get_user_by_tg_id(tg_id: int, db: AsyncSession = Depends(get_db)):
 
 @router.put("/{user_id}/activity")
 async def update_activity(user_id: int, db: AsyncSession = Depends(get_db)):
-    """Обновить время последней активности"""
-    await db.execute(
-        update(User)
-        .where(User.id == user_id)
-        .values(last_activity=func.now())
-    )
-    await db.commit()
+    """Обновить время последней активности (запись в БД - при сбросе буфера)"""
+    await activity_buffer.touch(db, user_id)
 
     return {"status": "ok", "message": "Activity updated"}
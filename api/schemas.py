@@ -3,7 +3,7 @@ Pydantic схемы для API
 """
 from pydantic import BaseModel, Field
 from datetime import datetime
-from typing import Optional
+from typing import Dict, List, Optional
 
 
 # User schemas
@@ -26,6 +26,15 @@ class UserResponse(BaseModel):
         from_attributes = True
 
 
+class SessionBootstrapResponse(BaseModel):
+    """Пользователь и флаги для /start и главного меню"""
+    user: UserResponse
+    is_new: bool  # Пользователь зарегистрирован этим запросом
+    has_measurements: bool
+    has_russian_size: bool  # Обязательный параметр заполнен (иначе онбординг)
+    tryon_count: int  # Успешные примерки
+
+
 # Measurements schemas
 class MeasurementsCreate(BaseModel):
     """Схема для создания/обновления параметров (все поля опциональны)"""
@@ -81,6 +90,35 @@ class FavoriteResponse(BaseModel):
         from_attributes = True
 
 
+class FavoriteProductResponse(BaseModel):
+    """Запись избранного вместе с данными товара из каталога"""
+    id: int
+    product_id: str
+    added_at: datetime
+    available: bool  # Товар есть в каталоге и активен
+    product: Optional["Product"] = None
+
+
+class FavoritesPageResponse(BaseModel):
+    items: List[FavoriteProductResponse]
+    next_cursor: Optional[str] = None
+
+
+class FavoriteIdsResponse(BaseModel):
+    """Все product_id избранного пользователя"""
+    product_ids: List[str]
+    etag: str
+
+
+class FavoriteCheckRequest(BaseModel):
+    product_ids: List[str] = Field(..., max_length=500)
+
+
+class FavoriteCheckResponse(BaseModel):
+    """product_id -> находится ли товар в избранном"""
+    favorites: Dict[str, bool]
+
+
 # User Photo schemas
 class UserPhotoCreate(BaseModel):
     user_id: int
@@ -105,12 +143,49 @@ class UserPhotosResponse(BaseModel):
 
 
 # Try-on History schemas
+class TryOnJobPayload(BaseModel):
+    """Параметры генерации и доставки результата (хранятся в задаче очереди)"""
+    model: str
+    tryon_mode: str
+    product_name: str
+    product_category: str = "одежда"
+    chat_id: int
+    status_message_id: Optional[int] = None
+    source: str = "catalog"
+    category_id: str = ""
+    index: int = 0
+
+
 class TryOnHistoryCreate(BaseModel):
     user_id: int
     product_id: str
     user_photo_id: int
     wb_link: Optional[str] = None
     ozon_url: Optional[str] = None
+    job: TryOnJobPayload
+
+
+class TryOnJobClaimRequest(BaseModel):
+    worker_id: str = Field(..., max_length=100)
+
+
+class TryOnJobFailRequest(BaseModel):
+    worker_id: str = Field(..., max_length=100)
+    error: str
+    retry: bool = False
+
+
+class TryOnJobResponse(BaseModel):
+    id: int
+    user_id: int
+    product_id: str
+    user_photo_id: int
+    user_photo_url: str
+    wb_link: Optional[str]
+    ozon_url: Optional[str]
+    job_payload: TryOnJobPayload
+    attempts: int
+    lease_expires_at: datetime
 
 
 class TryOnHistoryResponse(BaseModel):
@@ -119,10 +194,13 @@ class TryOnHistoryResponse(BaseModel):
     product_id: str
     user_photo_id: int
     result_file_path: Optional[str]
+    result_url: Optional[str] = None
+    preview_url: Optional[str] = None  # Уменьшенная копия после retention
     created_at: datetime
     status: str
     wb_link: Optional[str]
     ozon_url: Optional[str]
+    product_name: Optional[str] = None  # Только с expand=product
 
     class Config:
         from_attributes = True
@@ -130,6 +208,11 @@ class TryOnHistoryResponse(BaseModel):
 
 class TryOnHistoryListResponse(BaseModel):
     history: list[TryOnHistoryResponse]
+    next_cursor: Optional[str] = None
+
+
+class TryOnHistoryCountResponse(BaseModel):
+    count: int
 
 
 
@@ -171,3 +254,16 @@ class Category(BaseModel):
     category_name: str
     display_order: int
     emoji: str
+
+
+class ProductCardResponse(BaseModel):
+    """Все данные карточки товара одним ответом"""
+    product: Product
+    index: int  # Позиция товара в списке (категории или избранного)
+    total: int
+    is_favorite: bool
+    size_recommendation: SizeRecommendResponse
+
+
+# Схемы со ссылками на Product, объявленный ниже них
+FavoriteProductResponse.model_rebuild()
@@ -0,0 +1,169 @@
+"""
+Буферизованная запись last_activity пользователей
+
+last_activity нужен только для счетчика активных за неделю, поэтому
+обработчики запросов не пишут в users на каждое действие: отметка активности
+попадает в буфер, а фоновая задача раз в ACTIVITY_FLUSH_INTERVAL_SECONDS
+записывает накопленные отметки пачками одной командой
+UPDATE users ... FROM (VALUES ...).
+
+Буфер (ACTIVITY_BUFFER):
+- redis: hash в Redis, общий для всех процессов API и переживающий их
+  перезапуск; при недоступности Redis отметки копятся в памяти процесса;
+- memory: память процесса, при падении теряются отметки за последний интервал;
+- off: запись в Postgres сразу (как без буфера).
+
+Потерять можно только отметки за последний интервал сброса - он и задает
+допустимые потери.
+"""
+import asyncio
+import logging
+import os
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, List, Tuple
+
+from redis.exceptions import RedisError
+from sqlalchemy import update, values, column, func, BigInteger, DateTime
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.database import AsyncSessionLocal
+from api.models import User
+from api.redis_client import redis_client
+
+logger = logging.getLogger(__name__)
+
+# Где копить отметки: redis, memory или off
+ACTIVITY_BUFFER = os.getenv("ACTIVITY_BUFFER", "redis")
+
+# Интервал сброса в Postgres (максимальная задержка и потери при сбое)
+ACTIVITY_FLUSH_INTERVAL_SECONDS = int(os.getenv("ACTIVITY_FLUSH_INTERVAL_SECONDS", "60"))
+
+# Сколько пользователей обновлять одной командой
+ACTIVITY_FLUSH_BATCH = int(os.getenv("ACTIVITY_FLUSH_BATCH", "1000"))
+
+ACTIVITY_PENDING_KEY = "activity:pending"
+
+# Забранный на сброс буфер живет ограниченное время, если процесс упал во время сброса
+ACTIVITY_FLUSHING_TTL_SECONDS = 3600
+
+# Атомарно забрать буфер: переименовать и прочитать
+TAKE_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return {}
+end
+redis.call('RENAME', KEYS[1], KEYS[2])
+redis.call('EXPIRE', KEYS[2], ARGV[1])
+return redis.call('HGETALL', KEYS[2])
+"""
+
+
+class ActivityBuffer:
+    """Буфер отметок активности с периодическим сбросом в Postgres"""
+
+    def __init__(self, mode: str = ACTIVITY_BUFFER):
+        if mode not in ("redis", "memory", "off"):
+            raise ValueError(f"Unknown ACTIVITY_BUFFER: {mode}")
+        self.mode = mode
+        # user_id -> время последней активности (режим memory и запасной буфер redis)
+        self._pending: Dict[int, datetime] = {}
+        self._take = redis_client.register_script(TAKE_SCRIPT)
+
+    async def touch(self, db: AsyncSession, user_id: int):
+        """Отметить активность пользователя (users.id)"""
+        now = datetime.now(timezone.utc)
+
+        if self.mode == "off":
+            await self._write(db, [(user_id, now)])
+            await db.commit()
+            return
+
+        if self.mode == "redis":
+            try:
+                await redis_client.hset(ACTIVITY_PENDING_KEY, str(user_id), int(now.timestamp()))
+                return
+            except RedisError as e:
+                logger.warning(f"Redis unavailable for activity buffer, keeping in memory: {e}")
+
+        self._pending[user_id] = now
+
+    async def _write(self, db: AsyncSession, stamps: List[Tuple[int, datetime]]):
+        """Записать отметки пачками (время активности только увеличивается)"""
+        # Одинаковый порядок строк в параллельных сбросах исключает взаимные блокировки
+        stamps.sort()
+        for i in range(0, len(stamps), ACTIVITY_FLUSH_BATCH):
+            batch = values(
+                column("id", BigInteger),
+                column("last_activity", DateTime(timezone=True)),
+                name="activity",
+            ).data(stamps[i:i + ACTIVITY_FLUSH_BATCH])
+            await db.execute(
+                update(User)
+                .where(User.id == batch.c.id)
+                .values(last_activity=func.greatest(func.coalesce(User.last_activity, batch.c.last_activity),
+                                                    batch.c.last_activity))
+                .execution_options(synchronize_session=False)
+            )
+
+    async def _take_redis(self, flushing_key: str) -> Dict[int, datetime]:
+        """Забрать буфер Redis под ключом flushing_key (удаляется после записи в Postgres)"""
+        raw = await self._take(keys=[ACTIVITY_PENDING_KEY, flushing_key], args=[ACTIVITY_FLUSHING_TTL_SECONDS])
+        pairs = iter(raw)
+        return {
+            int(user_id): datetime.fromtimestamp(int(ts), tz=timezone.utc)
+            for user_id, ts in zip(pairs, pairs)
+        }
+
+    async def flush(self) -> int:
+        """Записать накопленные отметки в Postgres, возвращает количество пользователей"""
+        stamps, self._pending = self._pending, {}
+        flushing_key = None
+
+        if self.mode == "redis":
+            try:
+                flushing_key = f"activity:flushing:{uuid.uuid4().hex}"
+                for user_id, ts in (await self._take_redis(flushing_key)).items():
+                    stamps[user_id] = max(ts, stamps.get(user_id, ts))
+            except RedisError as e:
+                logger.warning(f"Redis unavailable for activity buffer flush: {e}")
+
+        if not stamps:
+            return 0
+
+        try:
+            async with AsyncSessionLocal() as db:
+                await self._write(db, list(stamps.items()))
+                await db.commit()
+        except Exception:
+            # Отметки вернутся в буфер и будут записаны при следующем сбросе
+            for user_id, ts in stamps.items():
+                self._pending[user_id] = max(ts, self._pending.get(user_id, ts))
+            raise
+
+        if flushing_key:
+            try:
+                await redis_client.delete(flushing_key)
+            except RedisError as e:
+                logger.warning(f"Failed to delete flushed activity buffer: {e}")
+        return len(stamps)
+
+    async def run_forever(self, interval_seconds: int = ACTIVITY_FLUSH_INTERVAL_SECONDS):
+        """Фоновая задача периодического сброса отметок"""
+        logger.info(f"Activity buffer started (mode: {self.mode}, flush interval: {interval_seconds} s)")
+
+        while True:
+            try:
+                flushed = await self.flush()
+                if flushed:
+                    logger.debug(f"Activity buffer flushed {flushed} users")
+            except asyncio.CancelledError:
+                logger.info("Activity buffer stopped")
+                raise
+            except Exception as e:
+                logger.error(f"Error flushing activity buffer: {e}", exc_info=True)
+
+            await asyncio.sleep(interval_seconds)
+
+
+# Singleton instance
+activity_buffer = ActivityBuffer()
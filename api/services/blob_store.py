@@ -0,0 +1,252 @@
+"""
+Контентно-адресуемое хранилище файлов (blob store)
+
+Файл хранится один раз под ключом SHA-256 своего содержимого в бэкенде
+хранения (локальный диск или S3, см. api.services.storage). Количество ссылок на каждый объект ведется
+в таблице blobs: UserPhoto.file_path и TryOnHistory.result_file_path содержат
+ключ объекта, одинаковые файлы разделяют один объект.
+
+Порядок операций защищает от гонки записи и удаления:
+- запись: содержимое пишется во временный файл (по ходу считается ключ),
+  затем в транзакции вызывающего увеличивается ref_count (строка блокируется),
+  и только после этого файл передается в бэкенд;
+- удаление: ref_count уменьшает воркер outbox удаления файлов
+  (api.services.file_outbox), объекты без ссылок удаляет sweep, блокируя
+  строку (FOR UPDATE SKIP LOCKED) на время удаления файла.
+
+Старые записи могут содержать абсолютный путь к файлу вместо ключа - такие
+ссылки поддерживаются при чтении и удалении (только с локального диска).
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Optional, Tuple
+
+from fastapi import UploadFile
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select, update, delete, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.database import AsyncSessionLocal
+from api.models import Blob
+from api.services.uploads import save_upload, remove_file, MAX_UPLOAD_SIZE
+from api.services.storage import StorageBackend, BLOB_STORAGE_DIR, create_storage, create_cold_storage, iter_file
+
+logger = logging.getLogger(__name__)
+
+# Временные файлы до передачи в бэкенд (для локального бэкенда - та же файловая система)
+BLOB_TMP_DIR = os.getenv("BLOB_TMP_DIR", os.path.join(BLOB_STORAGE_DIR, "tmp"))
+
+# Интервал фонового удаления объектов без ссылок
+BLOB_SWEEP_INTERVAL_MINUTES = int(os.getenv("BLOB_SWEEP_INTERVAL_MINUTES", "10"))
+
+# Сколько объект без ссылок хранится до удаления
+BLOB_SWEEP_GRACE_MINUTES = int(os.getenv("BLOB_SWEEP_GRACE_MINUTES", "60"))
+
+# Сколько объектов удалять за один проход
+BLOB_SWEEP_BATCH = 500
+
+BLOB_KEY_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+@dataclass
+class StoredBlob:
+    """Сохраненный объект"""
+    key: str
+    size: int
+
+
+def is_blob_key(ref: Optional[str]) -> bool:
+    """Ссылка является ключом blob store (а не старым путем к файлу)"""
+    return bool(ref) and bool(BLOB_KEY_RE.match(ref))
+
+
+def _write_temp(directory: str, data: bytes) -> str:
+    """Записать байты во временный файл с fsync"""
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".blob-", suffix=".part")
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    return tmp_path
+
+
+def _make_temp(directory: str) -> str:
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".blob-", suffix=".part")
+    os.close(fd)
+    return tmp_path
+
+
+class BlobStore:
+    """
+    Контентно-адресуемое хранилище с подсчетом ссылок в Postgres
+
+    Объекты хранятся на основном (горячем) уровне, редко читаемые можно
+    перенести на холодный (move_to_cold). Чтение ищет объект сначала на
+    горячем уровне, затем на холодном.
+    """
+
+    def __init__(self, backend: StorageBackend, cold: Optional[StorageBackend] = None,
+                 tmp_dir: str = BLOB_TMP_DIR):
+        self.backend = backend
+        self.cold = cold
+        self.tmp_dir = tmp_dir
+
+    async def _locate(self, key: str) -> Tuple[Optional[StorageBackend], Optional[int]]:
+        """Уровень, на котором лежит объект, и его размер"""
+        size = await self.backend.size(key)
+        if size is not None:
+            return self.backend, size
+        if self.cold:
+            size = await self.cold.size(key)
+            if size is not None:
+                return self.cold, size
+        return None, None
+
+    async def size(self, ref: str) -> Optional[int]:
+        """Размер файла по ссылке из БД (ключ или старый путь), None - файла нет"""
+        if is_blob_key(ref):
+            _backend, size = await self._locate(ref)
+            return size
+        return await run_in_threadpool(lambda: os.path.getsize(ref) if os.path.exists(ref) else None)
+
+    async def iter_range(self, ref: str, start: int = 0, end: Optional[int] = None) -> AsyncIterator[bytes]:
+        """Читать файл по ссылке из БД частями (диапазон start..end включительно)"""
+        if not is_blob_key(ref):
+            async for chunk in iter_file(ref, start, end):
+                yield chunk
+            return
+
+        backend, _size = await self._locate(ref)
+        if backend is None:
+            raise FileNotFoundError(ref)
+        async for chunk in backend.iter_range(ref, start, end):
+            yield chunk
+
+    async def read(self, ref: str) -> bytes:
+        """Прочитать файл целиком (для небольших файлов)"""
+        return b"".join([chunk async for chunk in self.iter_range(ref)])
+
+    async def move_to_cold(self, key: str) -> bool:
+        """
+        Перенести объект на холодный уровень
+
+        Копия на холодном уровне создается до удаления с горячего, поэтому
+        объект всегда доступен для чтения. Returns: True, если объект перенесен.
+        """
+        if not self.cold or await self.backend.size(key) is None:
+            return False
+
+        tmp_path = await run_in_threadpool(_make_temp, self.tmp_dir)
+        try:
+            f = await run_in_threadpool(open, tmp_path, "wb")
+            try:
+                async for chunk in self.backend.iter_range(key):
+                    await run_in_threadpool(f.write, chunk)
+            finally:
+                await run_in_threadpool(f.close)
+            await self.cold.put_file(key, tmp_path)
+        finally:
+            await remove_file(tmp_path)
+
+        async with AsyncSessionLocal() as db:
+            await db.execute(update(Blob).where(Blob.key == key).values(tier="cold"))
+            await db.commit()
+        await self.backend.delete(key)
+        return True
+
+    async def _acquire(self, db: AsyncSession, key: str, size: int, content_type: Optional[str]):
+        """Увеличить ref_count (создать строку) в транзакции вызывающего"""
+        stmt = insert(Blob).values(key=key, size=size, content_type=content_type, ref_count=1)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Blob.key],
+            # Объект снова записывается на горячий уровень
+            set_={"ref_count": Blob.ref_count + 1, "updated_at": func.now(), "tier": "hot"}
+        )
+        await db.execute(stmt)
+
+    async def _store_temp(self, db: AsyncSession, tmp_path: str, key: str, size: int,
+                          content_type: Optional[str]) -> StoredBlob:
+        try:
+            await self._acquire(db, key, size, content_type)
+            await self.backend.put_file(key, tmp_path, content_type)
+        except BaseException:
+            await remove_file(tmp_path)
+            raise
+        return StoredBlob(key=key, size=size)
+
+    async def put_upload(self, db: AsyncSession, upload: UploadFile,
+                         max_size: int = MAX_UPLOAD_SIZE) -> StoredBlob:
+        """
+        Сохранить загрузку потоково и взять на нее ссылку
+
+        Ссылка берется в транзакции вызывающего: без commit объект останется
+        без ссылок и будет удален сборщиком.
+
+        Raises:
+            UploadTooLargeError: файл больше max_size
+        """
+        tmp_path = os.path.join(self.tmp_dir, f"{uuid.uuid4()}.part")
+        saved = await save_upload(upload, tmp_path, max_size=max_size)
+        return await self._store_temp(db, saved.path, saved.sha256, saved.size, upload.content_type)
+
+    async def put_bytes(self, db: AsyncSession, data: bytes, content_type: Optional[str] = None) -> StoredBlob:
+        """Сохранить байты и взять на них ссылку (в транзакции вызывающего)"""
+        key = hashlib.sha256(data).hexdigest()
+        tmp_path = await run_in_threadpool(_write_temp, self.tmp_dir, data)
+        return await self._store_temp(db, tmp_path, key, len(data), content_type)
+
+    async def sweep(self, db: AsyncSession, grace_minutes: int = BLOB_SWEEP_GRACE_MINUTES) -> int:
+        """Удалить объекты без ссылок старше grace_minutes, возвращает их количество"""
+        cutoff = datetime.now(timezone.utc) - timedelta(minutes=grace_minutes)
+        result = await db.execute(
+            select(Blob.key)
+            .where(Blob.ref_count <= 0, Blob.updated_at < cutoff)
+            .limit(BLOB_SWEEP_BATCH)
+            .with_for_update(skip_locked=True)
+        )
+        keys = list(result.scalars().all())
+        if not keys:
+            await db.rollback()
+            return 0
+
+        # Строки заблокированы: параллельный _acquire ждет окончания транзакции
+        for key in keys:
+            await self.backend.delete(key)
+            if self.cold:
+                await self.cold.delete(key)
+
+        await db.execute(delete(Blob).where(Blob.key.in_(keys)))
+        await db.commit()
+        return len(keys)
+
+    async def run_forever(self, interval_minutes: int = BLOB_SWEEP_INTERVAL_MINUTES):
+        """Фоновая задача удаления объектов без ссылок"""
+        logger.info(f"Blob sweeper started (interval: {interval_minutes} min)")
+
+        while True:
+            try:
+                async with AsyncSessionLocal() as db:
+                    removed = await self.sweep(db)
+                if removed:
+                    logger.info(f"Blob sweeper removed {removed} unreferenced blobs")
+            except asyncio.CancelledError:
+                logger.info("Blob sweeper stopped")
+                raise
+            except Exception as e:
+                logger.error(f"Error in blob sweeper: {e}", exc_info=True)
+
+            await asyncio.sleep(interval_minutes * 60)
+
+
+# Singleton instance
+blob_store = BlobStore(create_storage(), create_cold_storage())
@@ -0,0 +1,239 @@
+"""
+Готовые ответы каталога
+
+Категории и товары меняются только вместе с Google Sheets, поэтому ответ
+каталога сериализуется один раз на версию данных: проверка схемой
+(как response_model) и JSON-кодирование в pydantic-core, сразу же сжатые
+варианты gzip и brotli. Обработчик только выбирает вариант по
+Accept-Encoding и отдает готовые байты с ETag.
+
+Версия - это объекты списков из кеша GoogleSheetsService: пока кеш
+возвращает те же списки, ответ берется из памяти. После обновления кеша
+ответ собирается заново, а если содержимое не изменилось (тот же ETag),
+сжатые варианты переиспользуются.
+
+Параметр fields= (sparse fieldsets) оставляет в ответе только нужные
+атрибуты: для частых наборов есть короткие имена (FIELD_SETS), каждая
+проекция - отдельный готовый ответ той же версии.
+
+Готовых ответов не больше MAX_ENTRIES (вытесняются давно не запрошенные).
+Пустые списки (неизвестная категория, Google Sheets недоступен) приходят
+каждый раз новыми объектами - для них отдается общий пустой ответ без
+кеширования и без сериализации.
+"""
+import asyncio
+import gzip
+import hashlib
+import logging
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from cachetools import LRUCache
+from pydantic import TypeAdapter
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Уровни сжатия: ответ сжимается один раз на версию, поэтому максимальные
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11
+
+# Готовых ответов в памяти (ключ - категория и набор полей)
+MAX_ENTRIES = 256
+
+# Частые наборы полей (fields=<имя>) по схемам
+FIELD_SETS = {
+    "Product": {
+        # Навигация по списку: только количество и порядок товаров
+        "ids": ("product_id",),
+        # Предзагрузка фото
+        "photos": ("product_id", "collage_url", "photo_1_url", "photo_2_url", "photo_3_url",
+                   "photo_4_url", "photo_5_url", "photo_6_url"),
+        # Карточка без описания и дополнительных фото
+        "card": ("product_id", "category", "name", "available_sizes", "collage_url",
+                 "photo_1_url", "wb_link", "ozon_url"),
+    },
+    "Category": {
+        "ids": ("category_id",),
+    },
+}
+
+
+def parse_fields(schema, fields: Optional[str]) -> Optional[Tuple[str, ...]]:
+    """
+    Разобрать fields= (имя набора или поля через запятую) в кортеж полей схемы
+
+    Поля идут в порядке схемы, первое поле (идентификатор) включается всегда,
+    None - все поля. Неизвестные поля - 400.
+    """
+    if not fields:
+        return None
+
+    names = FIELD_SETS.get(schema.__name__, {}).get(fields)
+    if names is None:
+        names = [name.strip() for name in fields.split(",") if name.strip()]
+
+    model_fields = list(schema.model_fields)
+    unknown = sorted(set(names) - set(model_fields))
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+
+    selected = set(names) | {model_fields[0]}
+    if len(selected) == len(model_fields):
+        return None
+    return tuple(name for name in model_fields if name in selected)
+
+
+@dataclass(frozen=True)
+class CatalogPayload:
+    """Сериализованный ответ каталога во всех кодировках"""
+    etag: str
+    body: bytes
+    gzip: bytes
+    br: Optional[bytes] = None
+
+
+@dataclass
+class _Entry:
+    sources: Tuple[Any, ...]
+    payload: CatalogPayload
+
+
+def _build_payload(body: bytes) -> CatalogPayload:
+    return CatalogPayload(
+        etag=f'"{hashlib.sha1(body).hexdigest()}"',
+        body=body,
+        gzip=gzip.compress(body, compresslevel=GZIP_LEVEL),
+        br=brotli.compress(body, quality=BROTLI_QUALITY) if brotli is not None else None
+    )
+
+
+# Пустой список (одинаков для любой схемы и набора полей)
+EMPTY_PAYLOAD = _build_payload(b"[]")
+
+
+def _accepted_encodings(header: str) -> Dict[str, float]:
+    """Разобрать Accept-Encoding в {кодировка: q}"""
+    encodings = {}
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        encodings[name.strip().lower()] = q
+    return encodings
+
+
+class CatalogResponseCache:
+    """Кеш готовых ответов каталога по версиям данных"""
+
+    def __init__(self):
+        self._entries: LRUCache = LRUCache(maxsize=MAX_ENTRIES)
+        self._adapters: Dict[Any, TypeAdapter] = {}
+        # Одновременные промахи собирают ответ один раз
+        self._build_lock = asyncio.Lock()
+
+    def _adapter(self, schema) -> TypeAdapter:
+        if schema not in self._adapters:
+            self._adapters[schema] = TypeAdapter(List[schema])
+        return self._adapters[schema]
+
+    def _serialize(
+        self,
+        schema,
+        sources: Sequence[List[Dict]],
+        fields: Optional[Tuple[str, ...]],
+        previous: Optional[CatalogPayload]
+    ) -> CatalogPayload:
+        """Проверить схемой, закодировать (только fields) и сжать (в пуле потоков)"""
+        adapter = self._adapter(schema)
+        items = [item for source in sources for item in source]
+        include = {"__all__": set(fields)} if fields else None
+        body = adapter.dump_json(adapter.validate_python(items), include=include)
+
+        if previous is not None and previous.body == body:
+            return previous
+        return _build_payload(body)
+
+    async def get(
+        self,
+        key: str,
+        schema,
+        sources: Sequence[List[Dict]],
+        fields: Optional[Tuple[str, ...]] = None
+    ) -> CatalogPayload:
+        """
+        Готовый ответ для списка schema, склеенного из sources
+
+        sources - списки из кеша GoogleSheetsService; пока это те же объекты,
+        ответ не пересобирается. fields - результат parse_fields.
+        """
+        if not any(sources):
+            return EMPTY_PAYLOAD
+
+        if fields:
+            key = f"{key}?fields={','.join(fields)}"
+        sources = tuple(sources)
+        entry = self._entries.get(key)
+        if entry is not None and self._same_sources(entry.sources, sources):
+            return entry.payload
+
+        async with self._build_lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._same_sources(entry.sources, sources):
+                return entry.payload
+
+            previous = entry.payload if entry is not None else None
+            payload = await run_in_threadpool(self._serialize, schema, sources, fields, previous)
+            if payload is not previous:
+                logger.info(
+                    f"Catalog response {key} rebuilt: {len(payload.body)} bytes, "
+                    f"gzip {len(payload.gzip)}, br {len(payload.br) if payload.br else '-'}"
+                )
+            # Ссылки на исходные списки держатся, чтобы их id не переиспользовались
+            self._entries[key] = _Entry(sources=sources, payload=payload)
+            return payload
+
+    @staticmethod
+    def _same_sources(cached: Tuple[Any, ...], sources: Tuple[Any, ...]) -> bool:
+        return len(cached) == len(sources) and all(a is b for a, b in zip(cached, sources))
+
+    def clear(self):
+        """Сбросить готовые ответы (вместе с кешем Google Sheets)"""
+        self._entries.clear()
+
+    @staticmethod
+    def response(request: Request, payload: CatalogPayload) -> Response:
+        """Ответ с учетом If-None-Match и Accept-Encoding"""
+        headers = {"ETag": payload.etag, "Vary": "Accept-Encoding"}
+
+        if request.headers.get("if-none-match") == payload.etag:
+            return Response(status_code=304, headers=headers)
+
+        accepted = _accepted_encodings(request.headers.get("accept-encoding", ""))
+        if payload.br is not None and accepted.get("br", 0) > 0:
+            body = payload.br
+            headers["Content-Encoding"] = "br"
+        elif accepted.get("gzip", 0) > 0:
+            body = payload.gzip
+            headers["Content-Encoding"] = "gzip"
+        else:
+            body = payload.body
+
+        return Response(content=body, media_type="application/json", headers=headers)
+
+
+# Singleton instance
+catalog_response_cache = CatalogResponseCache()
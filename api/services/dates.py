@@ -0,0 +1,15 @@
+"""
+Вспомогательные функции для работы с локальными датами
+"""
+from datetime import date, datetime, time, timedelta
+from typing import Tuple
+
+
+def local_day_start(day: date) -> datetime:
+    """Начало локального дня в виде timezone-aware datetime"""
+    return datetime.combine(day, time.min).astimezone()
+
+
+def day_bounds(day: date) -> Tuple[datetime, datetime]:
+    """Полуинтервал [начало дня, начало следующего дня)"""
+    return local_day_start(day), local_day_start(day + timedelta(days=1))
@@ -0,0 +1,130 @@
+"""
+Фоновая обработка outbox удаления файлов
+
+Ссылки на файлы удаленных фото и примерок пишут триггеры БД в таблицу
+file_deletion_outbox в той же транзакции, что и удаление, поэтому обработчики
+запросов не трогают хранилище: файл не пропадет при откате транзакции, а
+медленный диск не задерживает ответ.
+
+Воркер забирает пачку строк (FOR UPDATE SKIP LOCKED), для ключей blob store
+уменьшает ref_count (объект потом удалит сборщик blob store), старые файлы по
+пути удаляет с диска и удаляет обработанные строки в одной транзакции.
+"""
+import asyncio
+import logging
+import os
+from collections import Counter, defaultdict
+from typing import Dict, List
+
+from sqlalchemy import select, update, delete, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.database import AsyncSessionLocal
+from api.models import Blob, FileDeletion
+from api.services.blob_store import is_blob_key
+from api.services.uploads import remove_file
+
+logger = logging.getLogger(__name__)
+
+# Пауза между проверками outbox, когда очередь пуста
+FILE_OUTBOX_INTERVAL_SECONDS = int(os.getenv("FILE_OUTBOX_INTERVAL_SECONDS", "5"))
+
+# Сколько строк обрабатывать за одну транзакцию
+FILE_OUTBOX_BATCH = int(os.getenv("FILE_OUTBOX_BATCH", "200"))
+
+# После стольких ошибок строка остается в outbox для ручного разбора
+FILE_OUTBOX_MAX_ATTEMPTS = 5
+
+# Старые пути удаляются только внутри этой директории
+LEGACY_STORAGE_ROOT = os.path.realpath(os.getenv("LEGACY_STORAGE_ROOT", "/app/storage"))
+
+
+def _is_legacy_path_allowed(path: str) -> bool:
+    real_path = os.path.realpath(path)
+    return real_path.startswith(LEGACY_STORAGE_ROOT + os.sep)
+
+
+async def _release_blobs(db: AsyncSession, key_counts: Dict[str, int]):
+    """Уменьшить ref_count объектов (по одной команде на каждое число снятых ссылок)"""
+    keys_by_count: Dict[int, List[str]] = defaultdict(list)
+    for key, count in key_counts.items():
+        keys_by_count[count].append(key)
+
+    for count, keys in keys_by_count.items():
+        await db.execute(
+            update(Blob)
+            .where(Blob.key.in_(keys))
+            .values(ref_count=Blob.ref_count - count, updated_at=func.now())
+        )
+
+
+def _build_batch_query(batch_size: int):
+    """Пачка строк outbox (строки, занятые другим процессом, пропускаются)"""
+    return (
+        select(FileDeletion)
+        .where(FileDeletion.attempts < FILE_OUTBOX_MAX_ATTEMPTS)
+        .order_by(FileDeletion.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )
+
+
+class FileOutboxWorker:
+    """Воркер outbox удаления файлов"""
+
+    async def process_batch(self, db: AsyncSession, batch_size: int = FILE_OUTBOX_BATCH) -> int:
+        """Обработать одну пачку, возвращает количество обработанных строк"""
+        result = await db.execute(_build_batch_query(batch_size))
+        rows = result.scalars().all()
+        if not rows:
+            await db.rollback()
+            return 0
+
+        done_ids = []
+        key_counts: Counter = Counter()
+        for row in rows:
+            if is_blob_key(row.ref):
+                key_counts[row.ref] += 1
+                done_ids.append(row.id)
+                continue
+
+            if not _is_legacy_path_allowed(row.ref):
+                logger.warning(f"Skipping deletion of file outside {LEGACY_STORAGE_ROOT}: {row.ref}")
+                done_ids.append(row.id)
+                continue
+
+            try:
+                await remove_file(row.ref)
+                done_ids.append(row.id)
+            except OSError as e:
+                row.attempts += 1
+                row.last_error = str(e)
+                logger.warning(f"Failed to delete file {row.ref} (attempt {row.attempts}): {e}")
+
+        if key_counts:
+            await _release_blobs(db, key_counts)
+        if done_ids:
+            await db.execute(delete(FileDeletion).where(FileDeletion.id.in_(done_ids)))
+        await db.commit()
+        return len(done_ids)
+
+    async def run_forever(self, interval_seconds: int = FILE_OUTBOX_INTERVAL_SECONDS):
+        """Фоновая задача: обрабатывает outbox пачками, пока он не опустеет"""
+        logger.info(f"File deletion outbox worker started (interval: {interval_seconds} s)")
+
+        while True:
+            try:
+                async with AsyncSessionLocal() as db:
+                    while await self.process_batch(db) >= FILE_OUTBOX_BATCH:
+                        pass
+            except asyncio.CancelledError:
+                logger.info("File deletion outbox worker stopped")
+                raise
+            except Exception as e:
+                logger.error(f"Error in file deletion outbox worker: {e}", exc_info=True)
+
+            await asyncio.sleep(interval_seconds)
+
+
+# Singleton instance
+file_outbox_worker = FileOutboxWorker()
@@ -0,0 +1,29 @@
+"""
+Курсоры keyset-пагинации
+
+Курсор - base64 от "время|id" последней записи страницы. Следующая страница
+выбирается условием (время, id) < курсор при сортировке по убыванию, поэтому
+стоимость страницы не зависит от ее номера.
+"""
+import base64
+from datetime import datetime
+from typing import Tuple
+
+from fastapi import HTTPException
+
+
+def encode_cursor(timestamp: datetime, row_id: int) -> str:
+    raw = f"{timestamp.isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """
+    Raises:
+        HTTPException 400: некорректный курсор
+    """
+    try:
+        timestamp, row_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|")
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
@@ -0,0 +1,274 @@
+"""
+Многоуровневое хранение результатов примерок (retention)
+
+Результаты старше RETENTION_AFTER_DAYS пережимаются в JPEG/WebP высокого
+качества и получают уменьшенную копию для карточки истории. Оригинал по
+политике RETENTION_ORIGINALS:
+- cold: остается в original_file_path и переносится на холодный уровень;
+- keep: остается в original_file_path на горячем уровне;
+- delete: ссылка снимается, файл удаляет outbox удаления (триггер БД).
+
+Изображения обрабатываются вне транзакции в пуле потоков, строки обновляются
+пачками одной транзакцией; если строку за это время удалили или заменили
+результат, новые объекты отдаются outbox удаления.
+"""
+import asyncio
+import io
+import logging
+import os
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+from PIL import Image
+from sqlalchemy import select, update, text, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.database import AsyncSessionLocal, engine
+from api.models import TryOnHistory, FileDeletion
+from api.services.blob_store import blob_store, is_blob_key
+
+logger = logging.getLogger(__name__)
+
+# Через сколько дней результат пережимается
+RETENTION_AFTER_DAYS = int(os.getenv("RETENTION_AFTER_DAYS", "30"))
+
+# Формат и качество пережатого результата: jpeg или webp
+RETENTION_FORMAT = os.getenv("RETENTION_FORMAT", "jpeg")
+RETENTION_QUALITY = int(os.getenv("RETENTION_QUALITY", "90"))
+
+# Уменьшенная копия для карточки истории
+RETENTION_PREVIEW_SIZE = int(os.getenv("RETENTION_PREVIEW_SIZE", "512"))
+RETENTION_PREVIEW_QUALITY = 80
+
+# Что делать с оригиналом: cold, keep или delete
+RETENTION_ORIGINALS = os.getenv("RETENTION_ORIGINALS", "cold")
+
+# Размер пачки, пауза между пачками и интервал запуска
+RETENTION_BATCH = int(os.getenv("RETENTION_BATCH", "50"))
+RETENTION_BATCH_PAUSE_SECONDS = float(os.getenv("RETENTION_BATCH_PAUSE_SECONDS", "1"))
+RETENTION_INTERVAL_HOURS = int(os.getenv("RETENTION_INTERVAL_HOURS", "24"))
+
+# Одновременно работает только один процесс retention
+RETENTION_LOCK_ID = 7_290_003
+
+RETENTION_POLICIES = ("cold", "keep", "delete")
+
+IMAGE_FORMATS = {
+    "jpeg": ("JPEG", "image/jpeg"),
+    "webp": ("WEBP", "image/webp"),
+}
+
+
+@dataclass
+class Recompressed:
+    """Пережатый результат и уменьшенная копия"""
+    result: Optional[bytes]  # None - пережатый файл не меньше оригинала
+    preview: bytes
+
+
+@dataclass
+class RetentionReport:
+    """Итоги прохода retention"""
+    processed: int = 0  # Пережаты и обновлены
+    skipped: int = 0  # Результат не в blob store - только отмечены
+    failed: int = 0  # Ошибка чтения или пережатия - повтор в следующем проходе
+    bytes_before: int = 0
+    bytes_after: int = 0
+    moved_to_cold: int = 0
+
+
+def _encode(img: Image.Image, image_format: str, quality: int) -> bytes:
+    pil_format, _content_type = IMAGE_FORMATS[image_format]
+    if pil_format == "JPEG" and img.mode != "RGB":
+        img = img.convert("RGB")
+    buffer = io.BytesIO()
+    options = {"quality": quality, "optimize": True} if pil_format == "JPEG" else {"quality": quality, "method": 6}
+    img.save(buffer, format=pil_format, **options)
+    return buffer.getvalue()
+
+
+def recompress(data: bytes, image_format: str = RETENTION_FORMAT) -> Recompressed:
+    """Пережать результат и сделать уменьшенную копию (CPU, вызывать в пуле потоков)"""
+    with Image.open(io.BytesIO(data)) as img:
+        img.load()
+        result = _encode(img, image_format, RETENTION_QUALITY)
+        preview_img = img.copy()
+        preview_img.thumbnail((RETENTION_PREVIEW_SIZE, RETENTION_PREVIEW_SIZE))
+        preview = _encode(preview_img, image_format, RETENTION_PREVIEW_QUALITY)
+    return Recompressed(result=result if len(result) < len(data) else None, preview=preview)
+
+
+def _build_pending_query(cutoff: datetime, after: Optional[Tuple[datetime, int]]):
+    query = select(TryOnHistory.id, TryOnHistory.created_at, TryOnHistory.result_file_path).where(
+        TryOnHistory.status == "success",
+        TryOnHistory.retention_applied_at.is_(None),
+        TryOnHistory.created_at < cutoff,
+    )
+    if after:
+        query = query.where(tuple_(TryOnHistory.created_at, TryOnHistory.id) > tuple_(*after))
+    return query.order_by(TryOnHistory.created_at, TryOnHistory.id).limit(RETENTION_BATCH)
+
+
+class RetentionService:
+    """Пережатие старых результатов примерок и перенос оригиналов"""
+
+    def __init__(self, policy: str = RETENTION_ORIGINALS, image_format: str = RETENTION_FORMAT):
+        if policy not in RETENTION_POLICIES:
+            raise ValueError(f"Unknown RETENTION_ORIGINALS: {policy}")
+        if image_format not in IMAGE_FORMATS:
+            raise ValueError(f"Unknown RETENTION_FORMAT: {image_format}")
+        self.policy = policy
+        self.image_format = image_format
+
+    async def _pending(self, db: AsyncSession, cutoff: datetime, after: Optional[Tuple[datetime, int]]) -> List:
+        """Пачка необработанных результатов (индекс ix_try_on_history_retention_pending)"""
+        result = await db.execute(_build_pending_query(cutoff, after))
+        return result.all()
+
+    async def _apply(self, db: AsyncSession, row, recompressed: Optional[Recompressed],
+                     report: RetentionReport) -> Optional[str]:
+        """
+        Обновить строку в транзакции вызывающего
+
+        Returns:
+            Ключ оригинала для переноса на холодный уровень
+        """
+        values = {"retention_applied_at": datetime.now(timezone.utc)}
+        new_keys = []
+        original = None
+
+        if recompressed:
+            _pil_format, content_type = IMAGE_FORMATS[self.image_format]
+            preview = await blob_store.put_bytes(db, recompressed.preview, content_type)
+            values["preview_file_path"] = preview.key
+            new_keys.append(preview.key)
+
+            if recompressed.result:
+                result = await blob_store.put_bytes(db, recompressed.result, content_type)
+                values["result_file_path"] = result.key
+                new_keys.append(result.key)
+                report.bytes_after += result.size
+                if self.policy != "delete":
+                    values["original_file_path"] = row.result_file_path
+                    original = row.result_file_path
+
+        # Строка могла быть удалена или получить новый результат, пока шла обработка
+        updated = await db.execute(
+            update(TryOnHistory)
+            .where(
+                TryOnHistory.id == row.id,
+                TryOnHistory.result_file_path == row.result_file_path,
+                TryOnHistory.retention_applied_at.is_(None),
+            )
+            .values(**values)
+            .returning(TryOnHistory.id)
+            .execution_options(synchronize_session=False)
+        )
+        if updated.scalar_one_or_none() is None:
+            # Ссылки на новые объекты уже взяты - снимаем их через outbox
+            db.add_all([FileDeletion(ref=key) for key in new_keys])
+            return None
+        if recompressed:
+            report.processed += 1
+        return original
+
+    async def process_batch(self, cutoff: datetime, after: Optional[Tuple[datetime, int]],
+                            report: RetentionReport) -> Optional[Tuple[datetime, int]]:
+        """
+        Обработать одну пачку
+
+        Returns:
+            (created_at, id) последней строки для следующей пачки, None - строк больше нет
+        """
+        async with AsyncSessionLocal() as db:
+            rows = await self._pending(db, cutoff, after)
+            await db.rollback()
+        if not rows:
+            return None
+
+        # Изображения пережимаются вне транзакции. Строки с ошибкой (в том числе
+        # временной ошибкой хранилища) не отмечаются и попадут в следующий проход;
+        # результаты не из blob store отмечаются без обработки
+        prepared = []
+        for row in rows:
+            recompressed = None
+            if row.result_file_path and is_blob_key(row.result_file_path):
+                try:
+                    data = await blob_store.read(row.result_file_path)
+                    recompressed = await run_in_threadpool(recompress, data, self.image_format)
+                except Exception as e:
+                    logger.warning(f"Retention: failed to recompress try-on {row.id}: {e}")
+                    report.failed += 1
+                    continue
+                report.bytes_before += len(data)
+                if not recompressed.result:
+                    report.bytes_after += len(data)
+            else:
+                report.skipped += 1
+            prepared.append((row, recompressed))
+
+        originals = []
+        async with AsyncSessionLocal() as db:
+            for row, recompressed in prepared:
+                original = await self._apply(db, row, recompressed, report)
+                if original:
+                    originals.append(original)
+            await db.commit()
+
+        if self.policy == "cold":
+            for key in originals:
+                if await blob_store.move_to_cold(key):
+                    report.moved_to_cold += 1
+
+        return rows[-1].created_at, rows[-1].id
+
+    async def run_once(self, after_days: int = RETENTION_AFTER_DAYS) -> Optional[RetentionReport]:
+        """Обработать все подходящие результаты; None - retention уже работает в другом процессе"""
+        async with engine.connect() as lock_conn:
+            locked = (await lock_conn.execute(
+                text("SELECT pg_try_advisory_lock(:id)"), {"id": RETENTION_LOCK_ID}
+            )).scalar()
+            if not locked:
+                return None
+
+            try:
+                report = RetentionReport()
+                cutoff = datetime.now(timezone.utc) - timedelta(days=after_days)
+                after = None
+                while True:
+                    after = await self.process_batch(cutoff, after, report)
+                    if after is None:
+                        break
+                    await asyncio.sleep(RETENTION_BATCH_PAUSE_SECONDS)
+                return report
+            finally:
+                await lock_conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": RETENTION_LOCK_ID})
+
+    async def run_forever(self, interval_hours: int = RETENTION_INTERVAL_HOURS):
+        """Фоновая задача периодического retention"""
+        logger.info(f"Retention worker started (interval: {interval_hours} h, originals: {self.policy})")
+
+        while True:
+            try:
+                report = await self.run_once()
+                if report and (report.processed or report.failed):
+                    before = report.bytes_before / (1024 * 1024)
+                    after = report.bytes_after / (1024 * 1024)
+                    logger.info(
+                        f"Retention: {report.processed} try-ons processed ({report.skipped} skipped, "
+                        f"{report.failed} failed), "
+                        f"results {before:.1f} MB -> {after:.1f} MB, {report.moved_to_cold} originals moved to cold tier"
+                    )
+            except asyncio.CancelledError:
+                logger.info("Retention worker stopped")
+                raise
+            except Exception as e:
+                logger.error(f"Error in retention worker: {e}", exc_info=True)
+
+            await asyncio.sleep(interval_hours * 3600)
+
+
+# Singleton instance
+retention_service = RetentionService()
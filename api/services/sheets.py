@@ -1,5 +1,9 @@
 """
 Сервис для работы с Google Sheets
+
+Подключение к таблице (аутентификация и open_by_key по сети) выполняется не
+при импорте, а при первом обращении или на прогреве API (api.services.warmup),
+поэтому медленный Google не задерживает старт процесса.
 """
 import gspread
 from google.oauth2.service_account import Credentials
@@ -7,6 +11,8 @@ from cachetools import TTLCache
 import os
 import logging
 import re
+import threading
+import time
 from typing import List, Optional, Dict
 
 logger = logging.getLogger(__name__)
@@ -46,9 +52,13 @@ def convert_google_drive_url(url: str) -> str:
     logger.debug(f"URL passed through without conversion: {url}")
     return url
 
+# Пауза перед повторной попыткой подключения после ошибки
+SHEETS_INIT_RETRY_SECONDS = int(os.getenv("SHEETS_INIT_RETRY_SECONDS", "60"))
+
 # Кеш для данных из Google Sheets
 categories_cache = TTLCache(maxsize=1, ttl=600)  # 10 минут
 products_cache = TTLCache(maxsize=100, ttl=300)  # 5 минут
+products_index_cache = TTLCache(maxsize=1, ttl=300)  # 5 минут
 size_tables_cache = TTLCache(maxsize=50, ttl=1800)  # 30 минут
 
 
@@ -121,8 +131,42 @@ class GoogleSheetsService:
 
     def __init__(self):
         self.client = None
-        self.spreadsheet = None
-        self._initialize()
+        self._spreadsheet = None
+        self._init_lock = threading.Lock()
+        self._last_init_attempt: Optional[float] = None
+
+    @property
+    def spreadsheet(self):
+        """
+        Таблица, None - Google Sheets еще не подключены
+
+        Методы сервиса вызываются в обработчиках прямо в event loop, поэтому
+        здесь нет подключения (аутентификация блокирует): подключается и
+        переподключается прогрев (WarmupService) в пуле потоков.
+        """
+        return self._spreadsheet
+
+    @property
+    def is_initialized(self) -> bool:
+        return self._spreadsheet is not None
+
+    def initialize(self, force: bool = False) -> bool:
+        """
+        Подключиться к таблице, если подключения еще нет (блокирует - только в пуле потоков)
+
+        После неудачной попытки следующая выполняется не раньше чем через
+        SHEETS_INIT_RETRY_SECONDS (force - сразу). Returns: True, если подключено.
+        """
+        with self._init_lock:
+            if self._spreadsheet is not None:
+                return True
+            now = time.monotonic()
+            if (not force and self._last_init_attempt is not None
+                    and now - self._last_init_attempt < SHEETS_INIT_RETRY_SECONDS):
+                return False
+            self._last_init_attempt = now
+            self._initialize()
+            return self._spreadsheet is not None
 
     def _initialize(self):
         """Инициализация подключения к Google Sheets"""
@@ -153,14 +197,14 @@ class GoogleSheetsService:
             self.client = gspread.authorize(credentials)
             
             logger.info("Authentication successful. Opening spreadsheet...")
-            self.spreadsheet = self.client.open_by_key(spreadsheet_id)
+            self._spreadsheet = self.client.open_by_key(spreadsheet_id)
 
             logger.info("Google Sheets initialized successfully")
 
         except Exception as e:
             logger.error(f"Failed to initialize Google Sheets: {e}", exc_info=True)
             self.client = None
-            self.spreadsheet = None
+            self._spreadsheet = None
     
     def _map_row(self, row: Dict, mapping: Dict) -> Dict:
         """
@@ -189,6 +233,32 @@ class GoogleSheetsService:
         
         return result
 
+    @staticmethod
+    def _is_active(mapped_row: Dict) -> bool:
+        return str(mapped_row.get('is_active', 'ДА')).upper() in ['ДА', 'TRUE', 'YES', '1']
+
+    def _build_product(self, mapped_row: Dict) -> Dict:
+        """Собрать словарь товара из строки листа 'Товары'"""
+        product_id = str(mapped_row.get('product_id', '')).strip()
+        ozon_id = mapped_row.get('ozon_url')
+        return {
+            'product_id': product_id,
+            'category': str(mapped_row.get('category', '')).strip(),
+            'name': mapped_row['name'],
+            'description': mapped_row['description'],
+            'wb_link': f"https://www.wildberries.ru/catalog/{product_id}/detail.aspx",
+            'ozon_url': f"https://www.ozon.ru/product/pidzhak-slavalook-brand-{ozon_id}" if ozon_id else None,
+            'available_sizes': mapped_row['available_sizes'],
+            'collage_url': convert_google_drive_url(mapped_row['collage_url']),
+            'photo_1_url': convert_google_drive_url(mapped_row['photo_1_url']),
+            'photo_2_url': convert_google_drive_url(mapped_row['photo_2_url']),
+            'photo_3_url': convert_google_drive_url(mapped_row['photo_3_url']),
+            'photo_4_url': convert_google_drive_url(mapped_row['photo_4_url']),
+            'photo_5_url': convert_google_drive_url(mapped_row['photo_5_url']),
+            'photo_6_url': convert_google_drive_url(mapped_row['photo_6_url']),
+            'is_active': self._is_active(mapped_row)
+        }
+
     def get_categories(self) -> List[Dict]:
         """Получить список категорий"""
         if 'categories' in categories_cache:
@@ -246,29 +316,9 @@ class GoogleSheetsService:
             products = []
             for row in records:
                 mapped_row = self._map_row(row, self.PRODUCTS_MAPPING)
-                
-                is_active = str(mapped_row.get('is_active', 'ДА')).upper() in ['ДА', 'TRUE', 'YES', '1']
-                
-                if str(mapped_row.get('category', '')).strip() == category_id and is_active:
-                    product_id = str(mapped_row['product_id']).strip()
-                    ozon_id = mapped_row.get('ozon_url')
-                    products.append({
-                        'product_id': product_id,
-                        'category': str(mapped_row['category']),
-                        'name': mapped_row['name'],
-                        'description': mapped_row['description'],
-                        'wb_link': f"https://www.wildberries.ru/catalog/{product_id}/detail.aspx",
-                        'ozon_url': f"https://www.ozon.ru/product/pidzhak-slavalook-brand-{ozon_id}" if ozon_id else None,
-                        'available_sizes': mapped_row['available_sizes'],
-                        'collage_url': convert_google_drive_url(mapped_row['collage_url']),
-                        'photo_1_url': convert_google_drive_url(mapped_row['photo_1_url']),
-                        'photo_2_url': convert_google_drive_url(mapped_row['photo_2_url']),
-                        'photo_3_url': convert_google_drive_url(mapped_row['photo_3_url']),
-                        'photo_4_url': convert_google_drive_url(mapped_row['photo_4_url']),
-                        'photo_5_url': convert_google_drive_url(mapped_row['photo_5_url']),
-                        'photo_6_url': convert_google_drive_url(mapped_row['photo_6_url']),
-                        'is_active': is_active
-                    })
+
+                if str(mapped_row.get('category', '')).strip() == category_id and self._is_active(mapped_row):
+                    products.append(self._build_product(mapped_row))
             
             logger.info(f"Found and filtered {len(products)} products for category {category_id}.")
 
@@ -302,60 +352,52 @@ class GoogleSheetsService:
             logger.info(f"Cache HIT for product_id: {product_id}")
             return products_cache[cache_key]
         
-        logger.info(f"Cache MISS for product_id: {product_id}. Fetching from Google Sheets.")
+        logger.info(f"Cache MISS for product_id: {product_id}. Looking up products index.")
 
-        if not self.spreadsheet:
-            logger.error("Google Sheets not initialized. Cannot fetch product.")
+        product = self.get_products_index().get(product_id)
+        if not product:
+            logger.warning(f"Product with ID: {product_id} not found in products index.")
             return None
 
+        products_cache[cache_key] = product
+        return product
+
+    def get_products_index(self) -> Dict[str, Dict]:
+        """
+        Получить все товары (включая неактивные) по product_id
+
+        Один проход по листу 'Товары' на все товары; используется для поиска
+        товара по ID и для сборки избранного без запроса на каждый товар.
+        """
+        if 'index' in products_index_cache:
+            return products_index_cache['index']
+
+        if not self.spreadsheet:
+            logger.error("Google Sheets not initialized. Cannot fetch products index.")
+            return {}
+
         try:
             worksheet = self.spreadsheet.worksheet("Товары")
             records = worksheet.get_all_records()
-            logger.info(f"Fetched {len(records)} total rows from 'Товары' sheet.")
+            logger.info(f"Fetched {len(records)} total rows from 'Товары' sheet for products index.")
 
+            index = {}
             for row in records:
-                mapped_row = self._map_row(row, self.PRODUCTS_MAPPING)
-                sheet_product_id = str(mapped_row.get('product_id', '')).strip()
-                
-                logger.debug(f"Checking sheet row with ID: '{sheet_product_id}' against requested ID: '{product_id}'")
-
-                if sheet_product_id == product_id:
-                    logger.info(f"Found match for product_id: {product_id} in sheet.")
-                    is_active = str(mapped_row.get('is_active', 'ДА')).upper() in ['ДА', 'TRUE', 'YES', '1']
-                    prod_id = sheet_product_id
-                    ozon_id = mapped_row.get('ozon_url')
-
-                    product = {
-                        'product_id': prod_id,
-                        'category': str(mapped_row.get('category', '')).strip(),
-                        'name': mapped_row['name'],
-                        'description': mapped_row['description'],
-                        'wb_link': f"https://www.wildberries.ru/catalog/{prod_id}/detail.aspx",
-                        'ozon_url': f"https://www.ozon.ru/product/pidzhak-slavalook-brand-{ozon_id}" if ozon_id else None,
-                        'available_sizes': mapped_row['available_sizes'],
-                        'collage_url': convert_google_drive_url(mapped_row['collage_url']),
-                        'photo_1_url': convert_google_drive_url(mapped_row['photo_1_url']),
-                        'photo_2_url': convert_google_drive_url(mapped_row['photo_2_url']),
-                        'photo_3_url': convert_google_drive_url(mapped_row['photo_3_url']),
-                        'photo_4_url': convert_google_drive_url(mapped_row['photo_4_url']),
-                        'photo_5_url': convert_google_drive_url(mapped_row['photo_5_url']),
-                        'photo_6_url': convert_google_drive_url(mapped_row['photo_6_url']),
-                        'is_active': is_active
-                    }
-                    products_cache[cache_key] = product
-                    return product
-            
-            logger.warning(f"Product with ID: {product_id} not found after scanning all sheet rows.")
-            return None
+                product = self._build_product(self._map_row(row, self.PRODUCTS_MAPPING))
+                # При дублях ID в таблице берется первая строка
+                if product['product_id']:
+                    index.setdefault(product['product_id'], product)
+
+            products_index_cache['index'] = index
+            return index
 
         except Exception as e:
-            logger.error(f"Error fetching product from Google Sheets: {e}", exc_info=True)
-            # Возвращаем кешированные данные, если они есть
-            if cache_key in products_cache:
-                logger.warning(f"Using cached product {product_id} due to Google Sheets error")
-                return products_cache[cache_key]
-            logger.error(f"No cached data available for product {product_id}")
-            return None
+            logger.error(f"Error fetching products index from Google Sheets: {e}", exc_info=True)
+            if 'index' in products_index_cache:
+                logger.warning("Using cached products index due to Google Sheets error")
+                return products_index_cache['index']
+            logger.error("No cached products index available, returning empty index")
+            return {}
 
     def get_size_table(self, table_id: str) -> List[Dict]:
         """Получить таблицу размеров"""
@@ -434,6 +476,7 @@ class GoogleSheetsService:
         """Очистить кеш"""
         categories_cache.clear()
         products_cache.clear()
+        products_index_cache.clear()
         size_tables_cache.clear()
         logger.info("Google Sheets cache cleared")
 
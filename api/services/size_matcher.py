@@ -4,8 +4,12 @@
 import logging
 from typing import Optional, Dict, List, Tuple
 
+from api.services.sheets import sheets_service
+
 logger = logging.getLogger(__name__)
 
+NO_MEASUREMENTS_MESSAGE = "📐 Укажи свои параметры, чтобы получить рекомендацию по размеру"
+
 
 class SizeMatcherService:
     """Сервис для подбора размера одежды"""
@@ -207,6 +211,40 @@ class SizeMatcherService:
             }
         }
 
+    def recommend_for_product(self, user_measurements: Optional[Dict[str, any]], product: Dict) -> Dict:
+        """
+        Подобрать размер товара каталога: таблица размеров по категории товара
+        и доступные размеры из карточки (user_measurements=None - параметры не указаны)
+        """
+        if user_measurements is None:
+            return {
+                "success": False,
+                "recommended_size": None,
+                "alternative_size": None,
+                "confidence": "none",
+                "message": NO_MEASUREMENTS_MESSAGE,
+                "details": {"reason": "no_measurements"}
+            }
+
+        size_table_id = product.get('category')
+        size_table = sheets_service.get_size_table(size_table_id) if size_table_id else []
+        if not size_table:
+            return {
+                "success": False,
+                "recommended_size": None,
+                "alternative_size": None,
+                "confidence": "none",
+                "message": "⚠️ Таблица размеров для данной категории не найдена",
+                "details": {"reason": "no_size_table_for_category"}
+            }
+
+        available_sizes = [s.strip() for s in (product.get('available_sizes') or '').split(',') if s.strip()]
+        return self.recommend_size(
+            user_measurements=user_measurements,
+            size_table=size_table,
+            available_sizes=available_sizes
+        )
+
 
 # Singleton instance
 size_matcher_service = SizeMatcherService()
@@ -0,0 +1,170 @@
+"""
+Сервис дневных агрегатов статистики (rollup)
+
+Закрытые дни сворачиваются в таблицы stats_daily / stats_daily_products,
+итоги по товарам за все дни ведутся в stats_product_totals, поэтому
+/admin/stats читает только агрегаты и строки за текущий день.
+"""
+import asyncio
+import logging
+import os
+from datetime import date, timedelta
+from typing import Optional
+
+from sqlalchemy import select, func, delete, text, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.database import AsyncSessionLocal
+from api.models import User, TryOnHistory, StatsDaily, StatsDailyProduct, StatsProductTotal
+from api.services.dates import day_bounds
+
+logger = logging.getLogger(__name__)
+
+# Интервал фонового пересчета агрегатов
+STATS_ROLLUP_INTERVAL_MINUTES = int(os.getenv("STATS_ROLLUP_INTERVAL_MINUTES", "15"))
+
+# Сколько последних свернутых дней пересчитывать повторно
+# (статус примерки может смениться уже после полуночи)
+STATS_ROLLUP_REWIND_DAYS = 1
+
+# Ключ advisory lock: пересчет выполняет один процесс (фоновый воркер или /admin/stats)
+STATS_ROLLUP_LOCK_ID = 7_290_004
+
+
+class StatsRollupService:
+    """Сервис инкрементального пересчета дневной статистики"""
+
+    async def rollup_day(self, db: AsyncSession, day: date):
+        """Пересчитать агрегаты за один день (идемпотентно)"""
+        start, end = day_bounds(day)
+        success = TryOnHistory.status == "success"
+
+        new_users = (await db.execute(
+            select(func.count()).select_from(User)
+            .where(User.created_at >= start, User.created_at < end)
+        )).scalar() or 0
+
+        tryons = (await db.execute(
+            select(
+                func.count().label("total"),
+                func.count().filter(success).label("success"),
+                func.coalesce(func.sum(TryOnHistory.generation_time).filter(success), 0).label("gen_sum"),
+                func.count(TryOnHistory.generation_time).filter(success).label("gen_count"),
+            )
+            .where(TryOnHistory.created_at >= start, TryOnHistory.created_at < end)
+        )).one()
+
+        values = {
+            "new_users": new_users,
+            "tryons_total": tryons.total,
+            "tryons_success": tryons.success,
+            "generation_time_sum": int(tryons.gen_sum),
+            "generation_time_count": tryons.gen_count,
+        }
+        stmt = insert(StatsDaily).values(day=day, **values)
+        await db.execute(stmt.on_conflict_do_update(
+            index_elements=[StatsDaily.day],
+            set_={**values, "updated_at": func.now()}
+        ))
+
+        # Агрегаты по товарам пересобираем целиком; итоги по товарам
+        # (stats_product_totals) меняются на разницу прежних и новых агрегатов дня
+        await db.execute(
+            update(StatsProductTotal)
+            .where(StatsProductTotal.product_id == StatsDailyProduct.product_id, StatsDailyProduct.day == day)
+            .values(tryons_success=StatsProductTotal.tryons_success - StatsDailyProduct.tryons_success)
+        )
+        await db.execute(delete(StatsDailyProduct).where(StatsDailyProduct.day == day))
+        product_rows = (await db.execute(
+            select(TryOnHistory.product_id, func.count().label("count"))
+            .where(success, TryOnHistory.created_at >= start, TryOnHistory.created_at < end)
+            .group_by(TryOnHistory.product_id)
+        )).all()
+        if product_rows:
+            await db.execute(insert(StatsDailyProduct).values([
+                {"day": day, "product_id": row.product_id, "tryons_success": row.count}
+                for row in product_rows
+            ]))
+            totals = insert(StatsProductTotal).values([
+                {"product_id": row.product_id, "tryons_success": row.count}
+                for row in product_rows
+            ])
+            await db.execute(totals.on_conflict_do_update(
+                index_elements=[StatsProductTotal.product_id],
+                set_={"tryons_success": StatsProductTotal.tryons_success + totals.excluded.tryons_success}
+            ))
+
+    async def _first_day(self, db: AsyncSession) -> Optional[date]:
+        """Первый день, с которого есть данные"""
+        result = await db.execute(
+            select(
+                select(func.min(User.created_at)).scalar_subquery(),
+                select(func.min(TryOnHistory.created_at)).scalar_subquery(),
+            )
+        )
+        candidates = [dt for dt in result.one() if dt is not None]
+        if not candidates:
+            return None
+        return min(candidates).astimezone().date()
+
+    async def run_pending(self, db: AsyncSession) -> int:
+        """
+        Свернуть все закрытые дни, которых еще нет в stats_daily.
+
+        Пересчет идет под транзакционным advisory lock: если его уже держит
+        другой процесс, ничего не делается.
+
+        Returns:
+            Количество пересчитанных дней
+        """
+        yesterday = date.today() - timedelta(days=1)
+
+        locked = (await db.execute(
+            text("SELECT pg_try_advisory_xact_lock(:id)"), {"id": STATS_ROLLUP_LOCK_ID}
+        )).scalar()
+        if not locked:
+            await db.rollback()
+            logger.info("Stats rollup is already running in another process, skipping")
+            return 0
+
+        last_day = (await db.execute(select(func.max(StatsDaily.day)))).scalar()
+        if last_day is None:
+            start_day = await self._first_day(db)
+            if start_day is None:
+                await db.rollback()
+                return 0
+        else:
+            start_day = last_day - timedelta(days=STATS_ROLLUP_REWIND_DAYS)
+
+        day = start_day
+        count = 0
+        while day <= yesterday:
+            await self.rollup_day(db, day)
+            day += timedelta(days=1)
+            count += 1
+
+        await db.commit()
+        if count:
+            logger.info(f"Stats rollup: recomputed {count} day(s) from {start_day} to {yesterday}")
+        return count
+
+    async def run_forever(self, interval_minutes: int = STATS_ROLLUP_INTERVAL_MINUTES):
+        """Фоновая задача периодического пересчета агрегатов"""
+        logger.info(f"Stats rollup worker started (interval: {interval_minutes} min)")
+
+        while True:
+            try:
+                async with AsyncSessionLocal() as db:
+                    await self.run_pending(db)
+            except asyncio.CancelledError:
+                logger.info("Stats rollup worker stopped")
+                raise
+            except Exception as e:
+                logger.error(f"Error in stats rollup worker: {e}", exc_info=True)
+
+            await asyncio.sleep(interval_minutes * 60)
+
+
+# Singleton instance
+stats_rollup_service = StatsRollupService()
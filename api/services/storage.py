@@ -0,0 +1,479 @@
+"""
+Бэкенды хранения объектов blob store
+
+- LocalStorage: файлы на локальном диске ({root}/ab/cd/abcd...)
+- S3Storage: S3-совместимое хранилище (AWS S3, MinIO). Загрузка идет
+  multipart-частями из временного файла, чтение - диапазонами (Range),
+  прочитанные целиком объекты кладутся в небольшой локальный кэш
+  (read-through, вытеснение самых давно использованных по общему размеру).
+
+boto3 синхронный, поэтому все вызовы S3 выполняются в пуле потоков.
+Бэкенд выбирается переменной STORAGE_BACKEND (local или s3).
+"""
+import logging
+import os
+import re
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import AsyncIterator, List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+# Бэкенд хранения: local или s3
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local")
+
+# Корневая директория локального хранилища
+BLOB_STORAGE_DIR = os.getenv("BLOB_STORAGE_DIR", "/app/storage/blobs")
+
+# S3-совместимое хранилище (для MinIO указывается S3_ENDPOINT_URL)
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL") or None
+S3_BUCKET = os.getenv("S3_BUCKET", "fitter-blobs")
+S3_REGION = os.getenv("S3_REGION", "us-east-1")
+S3_ACCESS_KEY_ID = os.getenv("S3_ACCESS_KEY_ID") or None
+S3_SECRET_ACCESS_KEY = os.getenv("S3_SECRET_ACCESS_KEY") or None
+S3_PREFIX = os.getenv("S3_PREFIX", "blobs/")
+
+# Файлы больше порога загружаются multipart-частями указанного размера
+S3_MULTIPART_THRESHOLD = int(os.getenv("S3_MULTIPART_THRESHOLD_MB", "8")) * 1024 * 1024
+S3_MULTIPART_CHUNK_SIZE = int(os.getenv("S3_MULTIPART_CHUNK_MB", "8")) * 1024 * 1024
+
+# Холодный уровень (оригиналы старых результатов примерок): none, local или s3
+COLD_STORAGE_BACKEND = os.getenv("COLD_STORAGE_BACKEND", "none")
+COLD_STORAGE_DIR = os.getenv("COLD_STORAGE_DIR", "/app/storage/cold")
+S3_COLD_PREFIX = os.getenv("S3_COLD_PREFIX", "cold/")
+# Класс хранения S3 для холодного уровня (например STANDARD_IA, GLACIER_IR)
+S3_COLD_STORAGE_CLASS = os.getenv("S3_COLD_STORAGE_CLASS", "STANDARD_IA")
+
+# Локальный кэш объектов S3
+BLOB_CACHE_DIR = os.getenv("BLOB_CACHE_DIR", "/app/storage/blob_cache")
+BLOB_CACHE_MAX_SIZE = int(os.getenv("BLOB_CACHE_MAX_MB", "512")) * 1024 * 1024
+# При превышении лимита кэш ужимается до этой доли лимита (запас до следующего обхода)
+BLOB_CACHE_TRIM_RATIO = 0.9
+
+# Размер части при чтении объекта
+READ_CHUNK_SIZE = 256 * 1024
+
+SHARD_RE = re.compile(r"^[0-9a-f]{2}$")
+
+
+@dataclass
+class StoredObject:
+    """Объект в хранилище (для сверки с БД)"""
+    key: str
+    size: int
+    modified_at: datetime
+
+
+def shard_path(root: str, key: str) -> str:
+    """Путь к объекту в шардированной директории"""
+    return os.path.join(root, key[:2], key[2:4], key)
+
+
+def _fsync_dir(directory: str):
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _file_size(path: str) -> Optional[int]:
+    try:
+        return os.path.getsize(path)
+    except FileNotFoundError:
+        return None
+
+
+async def iter_file(path: str, start: int = 0, end: Optional[int] = None) -> AsyncIterator[bytes]:
+    """
+    Читать файл частями вне event loop
+
+    Args:
+        start: первый байт
+        end: последний байт включительно (None - до конца файла)
+    """
+    f = await run_in_threadpool(open, path, "rb")
+    try:
+        await run_in_threadpool(f.seek, start)
+        remaining = None if end is None else end - start + 1
+        while remaining is None or remaining > 0:
+            size = READ_CHUNK_SIZE if remaining is None else min(READ_CHUNK_SIZE, remaining)
+            chunk = await run_in_threadpool(f.read, size)
+            if not chunk:
+                break
+            if remaining is not None:
+                remaining -= len(chunk)
+            yield chunk
+    finally:
+        await run_in_threadpool(f.close)
+
+
+class StorageBackend(ABC):
+    """Интерфейс бэкенда хранения объектов по ключу"""
+
+    @abstractmethod
+    async def put_file(self, key: str, tmp_path: str, content_type: Optional[str] = None):
+        """Сохранить временный файл под ключом (временный файл удаляется)"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def size(self, key: str) -> Optional[int]:
+        """Размер объекта или None, если объекта нет"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def iter_range(self, key: str, start: int = 0, end: Optional[int] = None) -> AsyncIterator[bytes]:
+        """Читать объект (или диапазон байт start..end включительно) частями"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def delete(self, key: str):
+        """Удалить объект, если он существует"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def list_objects(self) -> AsyncIterator[StoredObject]:
+        """Все объекты хранилища в порядке возрастания ключа"""
+        raise NotImplementedError
+
+
+class LocalStorage(StorageBackend):
+    """Объекты на локальном диске"""
+
+    def __init__(self, root: str = BLOB_STORAGE_DIR):
+        self.root = root
+
+    def path_for(self, key: str) -> str:
+        return shard_path(self.root, key)
+
+    def _place(self, key: str, tmp_path: str):
+        path = self.path_for(key)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        if os.path.exists(path):
+            # Такое содержимое уже хранится
+            os.remove(tmp_path)
+            return
+        os.replace(tmp_path, path)
+        _fsync_dir(directory)
+
+    async def put_file(self, key: str, tmp_path: str, content_type: Optional[str] = None):
+        await run_in_threadpool(self._place, key, tmp_path)
+
+    async def size(self, key: str) -> Optional[int]:
+        return await run_in_threadpool(_file_size, self.path_for(key))
+
+    def iter_range(self, key: str, start: int = 0, end: Optional[int] = None) -> AsyncIterator[bytes]:
+        return iter_file(self.path_for(key), start, end)
+
+    async def delete(self, key: str):
+        def _remove():
+            path = self.path_for(key)
+            if os.path.exists(path):
+                os.remove(path)
+
+        await run_in_threadpool(_remove)
+
+    def _list_shard(self, directory: str) -> List[StoredObject]:
+        objects = []
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if not entry.is_file(follow_symlinks=False):
+                    continue
+                stat = entry.stat(follow_symlinks=False)
+                objects.append(StoredObject(
+                    key=entry.name,
+                    size=stat.st_size,
+                    modified_at=datetime.fromtimestamp(stat.st_mtime, tz=timezone.utc)
+                ))
+        return sorted(objects, key=lambda obj: obj.key)
+
+    def _list_dirs(self, directory: str) -> List[str]:
+        if not os.path.isdir(directory):
+            return []
+        with os.scandir(directory) as entries:
+            return sorted(entry.name for entry in entries if entry.is_dir() and SHARD_RE.match(entry.name))
+
+    async def list_objects(self) -> AsyncIterator[StoredObject]:
+        # Ключ начинается с имен шардов, поэтому обход шардов по порядку дает порядок ключей;
+        # в памяти одновременно только одна директория шарда
+        for first in await run_in_threadpool(self._list_dirs, self.root):
+            first_dir = os.path.join(self.root, first)
+            for second in await run_in_threadpool(self._list_dirs, first_dir):
+                for obj in await run_in_threadpool(self._list_shard, os.path.join(first_dir, second)):
+                    yield obj
+
+
+class ReadThroughCache:
+    """
+    Локальный кэш объектов ограниченного размера
+
+    Время последнего использования хранится в mtime файла. Размер кэша
+    ведется счетчиком (директория обходится при первом добавлении и при
+    превышении лимита): тогда удаляются самые давно использованные объекты
+    до BLOB_CACHE_TRIM_RATIO лимита. Если директорию делят несколько
+    процессов, счетчик каждого приблизителен и уточняется при обходе.
+    """
+
+    def __init__(self, root: str = BLOB_CACHE_DIR, max_size: int = BLOB_CACHE_MAX_SIZE):
+        self.root = root
+        self.max_size = max_size
+        # Текущий размер кэша (None - еще не подсчитан)
+        self._size: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def path_for(self, key: str) -> str:
+        return shard_path(self.root, key)
+
+    def get(self, key: str) -> Optional[str]:
+        """Путь к закэшированному объекту (отмечается как использованный)"""
+        path = self.path_for(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def temp_path(self) -> str:
+        """Временный файл в директории кэша для скачивания объекта"""
+        tmp_dir = os.path.join(self.root, "tmp")
+        os.makedirs(tmp_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir, prefix=".cache-", suffix=".part")
+        os.close(fd)
+        return tmp_path
+
+    def add(self, key: str, tmp_path: str) -> str:
+        """Перенести скачанный файл в кэш и ужать кэш, если он превысил лимит"""
+        path = self.path_for(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        size = os.path.getsize(tmp_path)
+        with self._lock:
+            replaced = _file_size(path) or 0
+            os.replace(tmp_path, path)
+            if self._size is None:
+                self._size = self._scan()[1]
+            else:
+                self._size += size - replaced
+            if self._size > self.max_size:
+                self._trim()
+        return path
+
+    def evict(self, key: str):
+        path = self.path_for(key)
+        with self._lock:
+            size = _file_size(path)
+            if size is None:
+                return
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                return
+            if self._size is not None:
+                self._size = max(self._size - size, 0)
+
+    def trim(self):
+        """Удалить самые давно использованные объекты сверх лимита"""
+        with self._lock:
+            self._trim()
+
+    def _scan(self):
+        """Объекты кэша (mtime, размер, путь) и их общий размер"""
+        entries = []
+        total = 0
+        for directory, dirnames, filenames in os.walk(self.root):
+            if "tmp" in dirnames:
+                dirnames.remove("tmp")
+            for name in filenames:
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+        return entries, total
+
+    def _trim(self):
+        entries, total = self._scan()
+        if total > self.max_size:
+            target = int(self.max_size * BLOB_CACHE_TRIM_RATIO)
+            for _mtime, size, path in sorted(entries):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                if total <= target:
+                    break
+        self._size = total
+
+
+class S3Storage(StorageBackend):
+    """Объекты в S3-совместимом хранилище"""
+
+    def __init__(
+        self,
+        bucket: str = S3_BUCKET,
+        endpoint_url: Optional[str] = S3_ENDPOINT_URL,
+        region: str = S3_REGION,
+        access_key_id: Optional[str] = S3_ACCESS_KEY_ID,
+        secret_access_key: Optional[str] = S3_SECRET_ACCESS_KEY,
+        prefix: str = S3_PREFIX,
+        cache: Optional[ReadThroughCache] = None,
+        use_cache: bool = True,
+        storage_class: Optional[str] = None
+    ):
+        try:
+            import boto3
+            from boto3.s3.transfer import TransferConfig
+            from botocore.config import Config
+        except ImportError as e:
+            raise RuntimeError("STORAGE_BACKEND=s3 requires boto3 (pip install boto3)") from e
+
+        self.bucket = bucket
+        self.prefix = prefix
+        self.storage_class = storage_class
+        self.cache = (cache or ReadThroughCache()) if use_cache else None
+        # Клиент boto3 потокобезопасен и используется из пула потоков
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=endpoint_url,
+            region_name=region,
+            aws_access_key_id=access_key_id,
+            aws_secret_access_key=secret_access_key,
+            config=Config(retries={"max_attempts": 3, "mode": "standard"})
+        )
+        self.transfer_config = TransferConfig(
+            multipart_threshold=S3_MULTIPART_THRESHOLD,
+            multipart_chunksize=S3_MULTIPART_CHUNK_SIZE
+        )
+
+    def _object_key(self, key: str) -> str:
+        return f"{self.prefix}{key}"
+
+    def _head(self, key: str) -> Optional[int]:
+        from botocore.exceptions import ClientError
+
+        try:
+            response = self.client.head_object(Bucket=self.bucket, Key=self._object_key(key))
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+        return response["ContentLength"]
+
+    def _upload(self, key: str, tmp_path: str, content_type: Optional[str]):
+        try:
+            # Ключ - хеш содержимого: существующий объект не перезаписываем
+            if self._head(key) is None:
+                extra_args = {}
+                if content_type:
+                    extra_args["ContentType"] = content_type
+                if self.storage_class:
+                    extra_args["StorageClass"] = self.storage_class
+                self.client.upload_file(
+                    tmp_path, self.bucket, self._object_key(key),
+                    ExtraArgs=extra_args or None, Config=self.transfer_config
+                )
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    async def put_file(self, key: str, tmp_path: str, content_type: Optional[str] = None):
+        await run_in_threadpool(self._upload, key, tmp_path, content_type)
+
+    def _cached(self, key: str) -> Optional[str]:
+        return self.cache.get(key) if self.cache else None
+
+    async def size(self, key: str) -> Optional[int]:
+        cached = await run_in_threadpool(self._cached, key)
+        if cached:
+            return await run_in_threadpool(_file_size, cached)
+        return await run_in_threadpool(self._head, key)
+
+    def _download_to_cache(self, key: str) -> str:
+        tmp_path = self.cache.temp_path()
+        try:
+            self.client.download_file(
+                self.bucket, self._object_key(key), tmp_path, Config=self.transfer_config
+            )
+            return self.cache.add(key, tmp_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _get_range(self, key: str, start: int, end: Optional[int]):
+        byte_range = f"bytes={start}-{'' if end is None else end}"
+        response = self.client.get_object(Bucket=self.bucket, Key=self._object_key(key), Range=byte_range)
+        return response["Body"]
+
+    async def iter_range(self, key: str, start: int = 0, end: Optional[int] = None) -> AsyncIterator[bytes]:
+        cached = await run_in_threadpool(self._cached, key)
+
+        # Целиком читаемые объекты скачиваются в кэш, диапазоны читаются из S3 напрямую
+        if self.cache and not cached and start == 0 and end is None:
+            cached = await run_in_threadpool(self._download_to_cache, key)
+
+        if cached:
+            async for chunk in iter_file(cached, start, end):
+                yield chunk
+            return
+
+        body = await run_in_threadpool(self._get_range, key, start, end)
+        try:
+            while True:
+                chunk = await run_in_threadpool(body.read, READ_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            await run_in_threadpool(body.close)
+
+    async def delete(self, key: str):
+        def _delete():
+            self.client.delete_object(Bucket=self.bucket, Key=self._object_key(key))
+            if self.cache:
+                self.cache.evict(key)
+
+        await run_in_threadpool(_delete)
+
+    async def list_objects(self) -> AsyncIterator[StoredObject]:
+        # S3 отдает ключи в порядке возрастания (UTF-8), по одной странице за запрос
+        paginator = self.client.get_paginator("list_objects_v2")
+        pages = iter(paginator.paginate(Bucket=self.bucket, Prefix=self.prefix))
+        while True:
+            page = await run_in_threadpool(next, pages, None)
+            if page is None:
+                break
+            for item in page.get("Contents", []):
+                yield StoredObject(
+                    key=item["Key"][len(self.prefix):],
+                    size=item["Size"],
+                    modified_at=item["LastModified"]
+                )
+
+
+def create_storage(backend: str = STORAGE_BACKEND) -> StorageBackend:
+    """Создать бэкенд хранения по имени"""
+    if backend == "local":
+        return LocalStorage()
+    if backend == "s3":
+        return S3Storage()
+    raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
+
+
+def create_cold_storage(backend: str = COLD_STORAGE_BACKEND) -> Optional[StorageBackend]:
+    """Создать бэкенд холодного уровня, None - холодный уровень не настроен"""
+    if backend == "none":
+        return None
+    if backend == "local":
+        return LocalStorage(COLD_STORAGE_DIR)
+    if backend == "s3":
+        # Холодные объекты читаются редко, поэтому без локального кэша
+        return S3Storage(prefix=S3_COLD_PREFIX, use_cache=False, storage_class=S3_COLD_STORAGE_CLASS)
+    raise ValueError(f"Unknown COLD_STORAGE_BACKEND: {backend}")
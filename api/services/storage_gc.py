@@ -0,0 +1,344 @@
+"""
+Сборщик мусора хранилища: сверка файлов с БД
+
+Находит то, на что не ссылается ни одна запись БД:
+- объекты blob store без строки в blobs (загрузка откатилась или упала
+  между записью файла и commit);
+- старые файлы по пути (до blob store) без ссылок из user_photos /
+  try_on_history, в том числе копии фото, которые хранил бот;
+- брошенные временные файлы загрузок.
+
+Списки файлов и ссылки из БД читаются потоково, отсортированными в одном
+порядке (БД - серверным курсором), и сравниваются слиянием, поэтому память не
+зависит от числа файлов. Файлы моложе STORAGE_GC_GRACE_HOURS не трогаются:
+их загрузка может быть еще не закоммичена.
+
+Объекты blob store не удаляются напрямую: для них создается строка blobs с
+ref_count = 0, и объект удаляет сборщик blob store с его блокировками (если
+такое же содержимое загрузят снова, ссылка просто увеличится). Остальные файлы
+удаляются или переносятся в карантин пачками с паузами между ними, чтобы не
+мешать дисковым операциям запросов.
+
+Запуск вручную:
+    python -m api.services.storage_gc --mode dry-run
+"""
+import argparse
+import asyncio
+import logging
+import os
+import shutil
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Callable, List, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select, text, union_all, literal_column
+from sqlalchemy.dialects.postgresql import insert
+
+from api.database import AsyncSessionLocal, engine
+from api.models import Blob, UserPhoto, TryOnHistory
+from api.services.blob_store import blob_store, is_blob_key, BLOB_TMP_DIR
+from api.services.storage import StorageBackend, StoredObject
+
+logger = logging.getLogger(__name__)
+
+# Режим: delete - удалять, quarantine - переносить в карантин, dry-run - только отчет
+STORAGE_GC_MODE = os.getenv("STORAGE_GC_MODE", "quarantine")
+
+# Интервал запуска
+STORAGE_GC_INTERVAL_HOURS = int(os.getenv("STORAGE_GC_INTERVAL_HOURS", "24"))
+
+# Файлы моложе этого возраста не считаются мусором
+STORAGE_GC_GRACE_HOURS = int(os.getenv("STORAGE_GC_GRACE_HOURS", "24"))
+
+# Размер пачки и пауза между пачками
+STORAGE_GC_BATCH = int(os.getenv("STORAGE_GC_BATCH", "500"))
+STORAGE_GC_BATCH_PAUSE_SECONDS = float(os.getenv("STORAGE_GC_BATCH_PAUSE_SECONDS", "1"))
+
+# Директории старых файлов (до blob store) и временных файлов загрузок
+STORAGE_GC_LEGACY_DIRS = [
+    d for d in os.getenv("STORAGE_GC_LEGACY_DIRS", "/app/storage/user_photos,/app/storage/try_on_results").split(",") if d
+]
+STORAGE_GC_TMP_DIRS = [
+    d for d in os.getenv("STORAGE_GC_TMP_DIRS", f"{BLOB_TMP_DIR},/app/storage/tmp").split(",") if d
+]
+
+# Карантин: файлы хранятся STORAGE_GC_QUARANTINE_DAYS дней, потом удаляются
+STORAGE_GC_QUARANTINE_DIR = os.getenv("STORAGE_GC_QUARANTINE_DIR", "/app/storage/quarantine")
+STORAGE_GC_QUARANTINE_DAYS = int(os.getenv("STORAGE_GC_QUARANTINE_DAYS", "7"))
+
+# Одновременно работает только один сборщик (несколько воркеров API)
+STORAGE_GC_LOCK_ID = 7_290_002
+
+GC_MODES = ("delete", "quarantine", "dry-run")
+
+# Порядок путей, при котором обход директорий в глубину с сортировкой имен
+# совпадает с ORDER BY в БД: разделитель пути меньше любого символа имени
+PATH_SORT_SEPARATOR = "\x01"
+
+
+def path_sort_key(path: str) -> str:
+    return path.replace("/", PATH_SORT_SEPARATOR)
+
+
+@dataclass
+class GCReport:
+    """Итоги прохода сборщика"""
+    scanned: int = 0
+    orphans: int = 0
+    reclaimed_bytes: int = 0
+    missing: int = 0  # Ссылки из БД без файла
+
+    def add(self, other: "GCReport"):
+        self.scanned += other.scanned
+        self.orphans += other.orphans
+        self.reclaimed_bytes += other.reclaimed_bytes
+        self.missing += other.missing
+
+
+async def diff_sorted(
+    listed: AsyncIterator[StoredObject],
+    referenced: AsyncIterator[str],
+    report: GCReport,
+    sort_key: Callable[[str], str] = lambda key: key
+) -> AsyncIterator[StoredObject]:
+    """
+    Объекты из listed, ключей которых нет в referenced
+
+    Оба потока должны быть отсортированы по sort_key. Ссылки без объекта
+    учитываются в report.missing.
+    """
+    ref = await anext(referenced, None)
+    async for obj in listed:
+        report.scanned += 1
+        key = sort_key(obj.key)
+        while ref is not None and sort_key(ref) < key:
+            report.missing += 1
+            ref = await anext(referenced, None)
+        if ref is not None and sort_key(ref) == key:
+            continue
+        yield obj
+
+    while ref is not None:
+        report.missing += 1
+        ref = await anext(referenced, None)
+
+
+def _walk_sorted(root: str) -> List[Tuple[str, bool]]:
+    """Имена в директории (с признаком директории) в порядке сортировки"""
+    with os.scandir(root) as entries:
+        return sorted((entry.name, entry.is_dir(follow_symlinks=False)) for entry in entries)
+
+
+async def list_files(root: str) -> AsyncIterator[StoredObject]:
+    """
+    Файлы под root (ключ - полный путь) в порядке path_sort_key
+
+    Обход в глубину, в памяти только списки имен текущей ветки.
+    """
+    if not await run_in_threadpool(os.path.isdir, root):
+        return
+
+    for name, is_dir in await run_in_threadpool(_walk_sorted, root):
+        path = os.path.join(root, name)
+        if is_dir:
+            async for obj in list_files(path):
+                yield obj
+            continue
+        try:
+            stat = await run_in_threadpool(os.stat, path)
+        except FileNotFoundError:
+            continue
+        yield StoredObject(
+            key=path,
+            size=stat.st_size,
+            modified_at=datetime.fromtimestamp(stat.st_mtime, tz=timezone.utc)
+        )
+
+
+async def _stream_scalars(statement) -> AsyncIterator[str]:
+    """Значения запроса через серверный курсор"""
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(statement.execution_options(yield_per=STORAGE_GC_BATCH))
+        async for value in result.scalars():
+            yield value
+
+
+def _blob_keys_query():
+    # Ключи - hex одной длины: порядок любой сортировки совпадает с Python,
+    # поэтому ORDER BY идет по первичному ключу без сортировки
+    return select(Blob.key).order_by(Blob.key)
+
+
+def _legacy_refs_query(root: str):
+    """Ссылки-пути под root из обеих таблиц в порядке path_sort_key"""
+    prefix = root.rstrip("/") + "/"
+    refs = union_all(
+        select(UserPhoto.file_path.label("ref")).where(UserPhoto.file_path.startswith(prefix, autoescape=True)),
+        select(TryOnHistory.result_file_path.label("ref"))
+        .where(TryOnHistory.result_file_path.startswith(prefix, autoescape=True)),
+    ).subquery()
+    sort_key = literal_column(f"replace(ref, '/', chr({ord(PATH_SORT_SEPARATOR)})) COLLATE \"C\"")
+    return select(refs.c.ref).order_by(sort_key)
+
+
+async def _empty() -> AsyncIterator[str]:
+    return
+    yield
+
+
+class StorageGC:
+    """Сборщик мусора хранилища"""
+
+    def __init__(self, backend: StorageBackend, mode: str = STORAGE_GC_MODE):
+        if mode not in GC_MODES:
+            raise ValueError(f"Unknown STORAGE_GC_MODE: {mode}")
+        self.backend = backend
+        self.mode = mode
+
+    def _is_old_enough(self, obj: StoredObject, now: datetime) -> bool:
+        return obj.modified_at < now - timedelta(hours=STORAGE_GC_GRACE_HOURS)
+
+    async def _in_batches(self, orphans: AsyncIterator[StoredObject], handle, report: GCReport):
+        """Обработать мусор пачками с паузой между ними"""
+        now = datetime.now(timezone.utc)
+        batch: List[StoredObject] = []
+
+        async def flush():
+            if self.mode != "dry-run":
+                await handle(batch)
+            report.orphans += len(batch)
+            report.reclaimed_bytes += sum(obj.size for obj in batch)
+            batch.clear()
+            await asyncio.sleep(STORAGE_GC_BATCH_PAUSE_SECONDS)
+
+        async for obj in orphans:
+            if not self._is_old_enough(obj, now):
+                continue
+            batch.append(obj)
+            if len(batch) >= STORAGE_GC_BATCH:
+                await flush()
+        if batch:
+            await flush()
+
+    async def _adopt_blobs(self, batch: List[StoredObject]):
+        """Передать объекты без строки в blobs сборщику blob store (ref_count = 0)"""
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                insert(Blob)
+                .values([{"key": obj.key, "size": obj.size, "ref_count": 0} for obj in batch])
+                .on_conflict_do_nothing(index_elements=[Blob.key])
+            )
+            await db.commit()
+
+    async def _remove_files(self, batch: List[StoredObject]):
+        def _remove():
+            quarantine_root = os.path.join(STORAGE_GC_QUARANTINE_DIR, datetime.now().strftime("%Y%m%d"))
+            for obj in batch:
+                try:
+                    if self.mode == "quarantine":
+                        target = os.path.join(quarantine_root, obj.key.lstrip("/"))
+                        os.makedirs(os.path.dirname(target), exist_ok=True)
+                        shutil.move(obj.key, target)
+                    else:
+                        os.remove(obj.key)
+                except FileNotFoundError:
+                    pass
+
+        await run_in_threadpool(_remove)
+
+    async def collect_blobs(self) -> GCReport:
+        """Объекты blob store без строки в blobs"""
+        report = GCReport()
+        objects = (obj async for obj in self.backend.list_objects() if is_blob_key(obj.key))
+        orphans = diff_sorted(objects, _stream_scalars(_blob_keys_query()), report)
+        await self._in_batches(orphans, self._adopt_blobs, report)
+        return report
+
+    async def collect_legacy(self, root: str) -> GCReport:
+        """Старые файлы по пути без ссылок из БД"""
+        report = GCReport()
+        orphans = diff_sorted(
+            list_files(root), _stream_scalars(_legacy_refs_query(root)), report, sort_key=path_sort_key
+        )
+        await self._in_batches(orphans, self._remove_files, report)
+        return report
+
+    async def collect_tmp(self, root: str) -> GCReport:
+        """Брошенные временные файлы загрузок"""
+        report = GCReport()
+        await self._in_batches(diff_sorted(list_files(root), _empty(), report), self._remove_files, report)
+        return report
+
+    async def purge_quarantine(self):
+        """Удалить карантин старше STORAGE_GC_QUARANTINE_DAYS"""
+        def _purge():
+            if not os.path.isdir(STORAGE_GC_QUARANTINE_DIR):
+                return
+            cutoff = (datetime.now() - timedelta(days=STORAGE_GC_QUARANTINE_DAYS)).strftime("%Y%m%d")
+            for name in os.listdir(STORAGE_GC_QUARANTINE_DIR):
+                if name < cutoff:
+                    shutil.rmtree(os.path.join(STORAGE_GC_QUARANTINE_DIR, name), ignore_errors=True)
+
+        await run_in_threadpool(_purge)
+
+    async def run_once(self) -> Optional[GCReport]:
+        """Полный проход; None - сборщик уже работает в другом процессе"""
+        async with engine.connect() as lock_conn:
+            locked = (await lock_conn.execute(
+                text("SELECT pg_try_advisory_lock(:id)"), {"id": STORAGE_GC_LOCK_ID}
+            )).scalar()
+            if not locked:
+                return None
+
+            try:
+                total = GCReport()
+                parts = [("blobs", self.collect_blobs())]
+                parts += [(root, self.collect_legacy(root)) for root in STORAGE_GC_LEGACY_DIRS]
+                parts += [(root, self.collect_tmp(root)) for root in STORAGE_GC_TMP_DIRS]
+                for name, part in parts:
+                    report = await part
+                    logger.info(
+                        f"Storage GC [{self.mode}] {name}: scanned={report.scanned} orphans={report.orphans} "
+                        f"reclaimed={report.reclaimed_bytes} bytes missing={report.missing}"
+                    )
+                    total.add(report)
+
+                if self.mode == "quarantine":
+                    await self.purge_quarantine()
+                return total
+            finally:
+                await lock_conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": STORAGE_GC_LOCK_ID})
+
+    async def run_forever(self, interval_hours: int = STORAGE_GC_INTERVAL_HOURS):
+        """Фоновая задача периодической сборки мусора"""
+        logger.info(f"Storage GC started (interval: {interval_hours} h, mode: {self.mode})")
+
+        while True:
+            await asyncio.sleep(interval_hours * 3600)
+            try:
+                report = await self.run_once()
+                if report:
+                    logger.info(
+                        f"Storage GC finished: {report.orphans} orphans, "
+                        f"{report.reclaimed_bytes / (1024 * 1024):.1f} MB reclaimed, {report.missing} missing files"
+                    )
+            except asyncio.CancelledError:
+                logger.info("Storage GC stopped")
+                raise
+            except Exception as e:
+                logger.error(f"Error in storage GC: {e}", exc_info=True)
+
+
+# Singleton instance
+storage_gc = StorageGC(blob_store.backend)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Сверка хранилища с БД")
+    parser.add_argument("--mode", choices=GC_MODES, default=STORAGE_GC_MODE)
+    args = parser.parse_args()
+
+    result = asyncio.run(StorageGC(blob_store.backend, args.mode).run_once())
+    print(result or "Storage GC is already running")
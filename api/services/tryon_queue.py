@@ -0,0 +1,220 @@
+"""
+Очередь генерации примерок на Postgres
+
+Строки try_on_history одновременно являются задачами очереди:
+- queued: задача ждет воркера (не раньше available_at);
+- processing: задачу выполняет воркер locked_by до lease_expires_at, воркер
+  продлевает аренду heartbeat-запросами;
+- success / failed: задача завершена.
+
+Воркеры забирают задачи одной командой UPDATE ... WHERE id = (SELECT ...
+FOR UPDATE SKIP LOCKED), поэтому параллельные воркеры не ждут друг друга и не
+берут одну задачу дважды - пропускная способность растет с числом воркеров.
+Аренды, которые не продлили (воркер упал или перезапустился), сборщик
+возвращает в очередь, а после TRYON_JOB_MAX_ATTEMPTS попыток завершает
+задачу ошибкой и возвращает примерку в дневной лимит.
+"""
+import asyncio
+import logging
+import os
+from datetime import timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import select, update, func, case, and_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.database import AsyncSessionLocal
+from api.models import TryOnHistory
+from api.services.tryon_quota import tryon_quota_service
+
+logger = logging.getLogger(__name__)
+
+# Длительность аренды задачи (воркер продлевает ее, пока генерирует)
+TRYON_JOB_LEASE_SECONDS = int(os.getenv("TRYON_JOB_LEASE_SECONDS", "90"))
+
+# Сколько раз задача может быть взята воркерами
+TRYON_JOB_MAX_ATTEMPTS = int(os.getenv("TRYON_JOB_MAX_ATTEMPTS", "3"))
+
+# Задержка перед повтором: TRYON_JOB_RETRY_DELAY_SECONDS * номер попытки
+TRYON_JOB_RETRY_DELAY_SECONDS = int(os.getenv("TRYON_JOB_RETRY_DELAY_SECONDS", "30"))
+
+# Интервал проверки просроченных аренд
+TRYON_JOB_REAPER_INTERVAL_SECONDS = int(os.getenv("TRYON_JOB_REAPER_INTERVAL_SECONDS", "30"))
+
+# Сколько просроченных аренд обрабатывать за одну транзакцию
+TRYON_JOB_REAPER_BATCH = 100
+
+# Столбцы задачи, которые получает воркер
+JOB_COLUMNS = (
+    TryOnHistory.id,
+    TryOnHistory.user_id,
+    TryOnHistory.product_id,
+    TryOnHistory.user_photo_id,
+    TryOnHistory.wb_link,
+    TryOnHistory.ozon_url,
+    TryOnHistory.job_payload,
+    TryOnHistory.attempts,
+    TryOnHistory.lease_expires_at,
+)
+
+
+def _lease_interval(seconds: int):
+    return func.now() + timedelta(seconds=seconds)
+
+
+def _build_claim_query(worker_id: str, lease_seconds: int):
+    """Аренда следующей задачи одной командой (кандидат блокируется SKIP LOCKED)"""
+    candidate = (
+        select(TryOnHistory.id)
+        .where(TryOnHistory.status == "queued", TryOnHistory.available_at <= func.now())
+        .order_by(TryOnHistory.available_at, TryOnHistory.id)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    return (
+        update(TryOnHistory)
+        .where(TryOnHistory.id == candidate)
+        .values(
+            status="processing",
+            locked_by=worker_id,
+            lease_expires_at=_lease_interval(lease_seconds),
+            attempts=TryOnHistory.attempts + 1,
+        )
+        .returning(*JOB_COLUMNS)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _build_reap_query(max_attempts: int):
+    """Возврат в очередь (или завершение ошибкой) пачки задач с просроченной арендой"""
+    expired = (
+        select(TryOnHistory.id)
+        .where(TryOnHistory.status == "processing", TryOnHistory.lease_expires_at < func.now())
+        .limit(TRYON_JOB_REAPER_BATCH)
+        .with_for_update(skip_locked=True)
+    )
+    requeue = and_(TryOnHistory.job_payload.isnot(None), TryOnHistory.attempts < max_attempts)
+    return (
+        update(TryOnHistory)
+        .where(TryOnHistory.id.in_(expired))
+        .values(
+            status=case((requeue, "queued"), else_="failed"),
+            available_at=func.now(),
+            locked_by=None,
+            lease_expires_at=None,
+            last_error="lease expired",
+        )
+        .returning(TryOnHistory.id, TryOnHistory.user_id, TryOnHistory.created_at, TryOnHistory.status)
+        .execution_options(synchronize_session=False)
+    )
+
+
+class TryOnQueue:
+    """Операции очереди генерации примерок"""
+
+    def __init__(self, lease_seconds: int = TRYON_JOB_LEASE_SECONDS, max_attempts: int = TRYON_JOB_MAX_ATTEMPTS):
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+
+    async def claim(self, db: AsyncSession, worker_id: str) -> Optional[Dict]:
+        """Взять следующую задачу и арендовать ее за воркером (None - очередь пуста)"""
+        result = await db.execute(_build_claim_query(worker_id, self.lease_seconds))
+        row = result.first()
+        await db.commit()
+        return dict(row._mapping) if row else None
+
+    async def heartbeat(self, db: AsyncSession, tryon_id: int, worker_id: str) -> Optional[Dict]:
+        """Продлить аренду задачи (None - аренда потеряна, задачу нужно бросить)"""
+        result = await db.execute(
+            update(TryOnHistory)
+            .where(
+                TryOnHistory.id == tryon_id,
+                TryOnHistory.status == "processing",
+                TryOnHistory.locked_by == worker_id,
+            )
+            .values(lease_expires_at=_lease_interval(self.lease_seconds))
+            .returning(TryOnHistory.lease_expires_at)
+            .execution_options(synchronize_session=False)
+        )
+        lease_expires_at = result.scalar_one_or_none()
+        await db.commit()
+        return {"lease_expires_at": lease_expires_at} if lease_expires_at else None
+
+    async def fail(self, db: AsyncSession, tryon_id: int, worker_id: str, error: str,
+                   retry: bool) -> Optional[str]:
+        """
+        Завершить попытку ошибкой
+
+        Returns:
+            Новый статус (queued - задача будет повторена, failed) или None,
+            если аренда воркером уже потеряна
+        """
+        status = case((TryOnHistory.attempts < self.max_attempts, "queued"), else_="failed") if retry else "failed"
+        result = await db.execute(
+            update(TryOnHistory)
+            .where(
+                TryOnHistory.id == tryon_id,
+                TryOnHistory.status == "processing",
+                TryOnHistory.locked_by == worker_id,
+            )
+            .values(
+                status=status,
+                available_at=func.now() + TryOnHistory.attempts * timedelta(seconds=TRYON_JOB_RETRY_DELAY_SECONDS),
+                locked_by=None,
+                lease_expires_at=None,
+                last_error=error[:1000],
+            )
+            .returning(TryOnHistory.user_id, TryOnHistory.created_at, TryOnHistory.status)
+            .execution_options(synchronize_session=False)
+        )
+        row = result.first()
+        await db.commit()
+        if row is None:
+            return None
+
+        # Неудачная генерация не расходует дневной лимит
+        if row.status == "failed":
+            await tryon_quota_service.refund(row.user_id, row.created_at.astimezone().date())
+        return row.status
+
+    async def reap_expired(self, db: AsyncSession) -> List[Dict]:
+        """
+        Вернуть в очередь задачи с просроченной арендой
+
+        Задачи без параметров генерации (созданные до очереди) и исчерпавшие
+        попытки завершаются ошибкой. Returns: обработанные задачи.
+        """
+        result = await db.execute(_build_reap_query(self.max_attempts))
+        rows = result.all()
+        await db.commit()
+
+        for row in rows:
+            if row.status == "failed":
+                await tryon_quota_service.refund(row.user_id, row.created_at.astimezone().date())
+        return [dict(row._mapping) for row in rows]
+
+    async def run_forever(self, interval_seconds: int = TRYON_JOB_REAPER_INTERVAL_SECONDS):
+        """Фоновая задача возврата просроченных аренд"""
+        logger.info(f"Try-on lease reaper started (interval: {interval_seconds} s, lease: {self.lease_seconds} s)")
+
+        while True:
+            try:
+                async with AsyncSessionLocal() as db:
+                    reaped = await self.reap_expired(db)
+                if reaped:
+                    failed = sum(1 for job in reaped if job["status"] == "failed")
+                    logger.warning(
+                        f"Try-on lease reaper: {len(reaped) - failed} jobs requeued, {failed} failed"
+                    )
+            except asyncio.CancelledError:
+                logger.info("Try-on lease reaper stopped")
+                raise
+            except Exception as e:
+                logger.error(f"Error in try-on lease reaper: {e}", exc_info=True)
+
+            await asyncio.sleep(interval_seconds)
+
+
+# Singleton instance
+tryon_queue = TryOnQueue()
@@ -0,0 +1,156 @@
+"""
+Сервис дневной квоты примерок на Redis
+
+Счетчик примерок пользователя за день хранится в Redis и изменяется атомарно
+(Lua-скрипт: проверка лимита + INCR), ключ истекает в локальную полночь.
+Если ключа нет (новый день или Redis потерял данные), он заполняется
+количеством примерок за сегодня из Postgres. При недоступности Redis
+квота проверяется напрямую по Postgres.
+"""
+import logging
+import os
+from datetime import date, timedelta
+from typing import Dict, Tuple
+
+from redis.exceptions import RedisError
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.models import TryOnHistory
+from api.redis_client import redis_client
+from api.services.dates import day_bounds, local_day_start
+
+logger = logging.getLogger(__name__)
+
+# Лимит примерок в день по умолчанию
+TRYON_DAILY_LIMIT = int(os.getenv("TRYON_DAILY_LIMIT", "10"))
+
+# Индивидуальные лимиты: "tg_id:limit,tg_id:limit"
+TRYON_DAILY_LIMIT_OVERRIDES = os.getenv("TRYON_DAILY_LIMIT_OVERRIDES", "")
+
+# Ключ отсутствует -> -2, лимит исчерпан -> -1, иначе новое значение счетчика
+RESERVE_SCRIPT = """
+local current = redis.call('GET', KEYS[1])
+if not current then
+    return -2
+end
+if tonumber(current) >= tonumber(ARGV[1]) then
+    return -1
+end
+return redis.call('INCR', KEYS[1])
+"""
+
+# Возврат примерки: уменьшаем счетчик, только если ключ существует и > 0
+REFUND_SCRIPT = """
+local current = redis.call('GET', KEYS[1])
+if current and tonumber(current) > 0 then
+    return redis.call('DECR', KEYS[1])
+end
+return -1
+"""
+
+
+def _parse_overrides(raw: str) -> Dict[int, int]:
+    """Разобрать строку индивидуальных лимитов"""
+    overrides = {}
+    for item in raw.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        try:
+            tg_id, limit = item.split(':')
+            overrides[int(tg_id)] = int(limit)
+        except ValueError:
+            logger.warning(f"Invalid TRYON_DAILY_LIMIT_OVERRIDES entry: {item!r}")
+    return overrides
+
+
+def _build_usage_query(user_id: int, day: date):
+    start, end = day_bounds(day)
+    return select(func.count(TryOnHistory.id)).where(
+        TryOnHistory.user_id == user_id,
+        TryOnHistory.created_at >= start,
+        TryOnHistory.created_at < end,
+        TryOnHistory.status != "failed"
+    )
+
+
+class TryOnQuotaService:
+    """Сервис атомарного учета дневного лимита примерок"""
+
+    def __init__(self, default_limit: int = TRYON_DAILY_LIMIT, overrides: str = TRYON_DAILY_LIMIT_OVERRIDES):
+        self.default_limit = default_limit
+        self.overrides = _parse_overrides(overrides)
+        self._reserve = redis_client.register_script(RESERVE_SCRIPT)
+        self._refund = redis_client.register_script(REFUND_SCRIPT)
+
+    def get_limit(self, user_id: int) -> int:
+        """Дневной лимит примерок пользователя"""
+        return self.overrides.get(user_id, self.default_limit)
+
+    @staticmethod
+    def _key(user_id: int, day: date) -> str:
+        return f"tryon_quota:{user_id}:{day.isoformat()}"
+
+    async def _count_from_db(self, db: AsyncSession, user_id: int, day: date) -> int:
+        """Количество незавершившихся ошибкой примерок за день по Postgres"""
+        result = await db.execute(_build_usage_query(user_id, day))
+        return result.scalar() or 0
+
+    async def _seed(self, db: AsyncSession, user_id: int, day: date) -> int:
+        """Заполнить счетчик из Postgres, если ключа еще нет"""
+        count = await self._count_from_db(db, user_id, day)
+        expire_at = int(local_day_start(day + timedelta(days=1)).timestamp())
+        await redis_client.set(self._key(user_id, day), count, nx=True, exat=expire_at)
+        return count
+
+    async def reserve(self, db: AsyncSession, user_id: int) -> Tuple[bool, int]:
+        """
+        Атомарно занять одну примерку из дневного лимита
+
+        Returns:
+            (успех, количество примерок за сегодня с учетом занятой)
+        """
+        today = date.today()
+        limit = self.get_limit(user_id)
+        key = self._key(user_id, today)
+
+        try:
+            result = await self._reserve(keys=[key], args=[limit])
+            if result == -2:
+                await self._seed(db, user_id, today)
+                result = await self._reserve(keys=[key], args=[limit])
+        except RedisError as e:
+            logger.warning(f"Redis unavailable for try-on quota, falling back to Postgres: {e}")
+            count = await self._count_from_db(db, user_id, today)
+            if count >= limit:
+                return False, count
+            return True, count + 1
+
+        if result < 0:
+            return False, limit
+        return True, result
+
+    async def refund(self, user_id: int, day: date):
+        """Вернуть примерку в лимит (например, если генерация не удалась)"""
+        try:
+            await self._refund(keys=[self._key(user_id, day)])
+        except RedisError as e:
+            # Без ключа в Redis квота будет пересчитана из Postgres, где failed не учитываются
+            logger.warning(f"Failed to refund try-on quota for user {user_id}: {e}")
+
+    async def get_usage(self, db: AsyncSession, user_id: int) -> int:
+        """Количество использованных примерок за сегодня"""
+        today = date.today()
+        try:
+            value = await redis_client.get(self._key(user_id, today))
+            if value is None:
+                return await self._seed(db, user_id, today)
+            return int(value)
+        except RedisError as e:
+            logger.warning(f"Redis unavailable for try-on quota, falling back to Postgres: {e}")
+            return await self._count_from_db(db, user_id, today)
+
+
+# Singleton instance
+tryon_quota_service = TryOnQuotaService()
@@ -0,0 +1,109 @@
+"""
+Потоковое сохранение загружаемых файлов
+
+Файл читается из UploadFile частями и пишется во временный файл в целевой
+директории через пул потоков (event loop не блокируется), по ходу считаются
+размер и SHA-256. Превышение лимита прерывает загрузку сразу. После записи
+файл синхронизируется на диск (fsync) и атомарно переименовывается в итоговый
+путь, поэтому недописанный файл никогда не виден под итоговым именем.
+"""
+import hashlib
+import logging
+import os
+import tempfile
+from dataclasses import dataclass
+from typing import BinaryIO
+
+from fastapi import UploadFile
+from fastapi.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+# Максимальный размер загружаемого файла
+MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE_MB", "10")) * 1024 * 1024
+
+# Размер части при чтении загрузки
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+class UploadTooLargeError(Exception):
+    """Загружаемый файл больше допустимого размера"""
+
+    def __init__(self, max_size: int):
+        super().__init__(f"File is larger than {max_size // (1024 * 1024)} MB")
+        self.max_size = max_size
+
+
+@dataclass
+class SavedUpload:
+    """Результат сохранения загрузки"""
+    path: str
+    sha256: str
+    size: int
+
+
+def _fsync_and_close(f: BinaryIO):
+    f.flush()
+    os.fsync(f.fileno())
+    f.close()
+
+
+def _fsync_dir(directory: str):
+    """Синхронизировать директорию, чтобы переименование пережило сбой питания"""
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _discard(f: BinaryIO, tmp_path: str):
+    if not f.closed:
+        f.close()
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+
+async def save_upload(upload: UploadFile, dest_path: str, max_size: int = MAX_UPLOAD_SIZE) -> SavedUpload:
+    """
+    Сохранить загрузку в dest_path потоково
+
+    Raises:
+        UploadTooLargeError: файл больше max_size (временный файл удаляется)
+    """
+    directory = os.path.dirname(dest_path)
+    await run_in_threadpool(os.makedirs, directory, exist_ok=True)
+
+    fd, tmp_path = await run_in_threadpool(tempfile.mkstemp, dir=directory, prefix=".upload-", suffix=".part")
+    f = os.fdopen(fd, "wb")
+    digest = hashlib.sha256()
+    size = 0
+
+    try:
+        while True:
+            chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_size:
+                raise UploadTooLargeError(max_size)
+            digest.update(chunk)
+            await run_in_threadpool(f.write, chunk)
+
+        await run_in_threadpool(_fsync_and_close, f)
+        await run_in_threadpool(os.replace, tmp_path, dest_path)
+        await run_in_threadpool(_fsync_dir, directory)
+    except BaseException:
+        await run_in_threadpool(_discard, f, tmp_path)
+        raise
+
+    return SavedUpload(path=dest_path, sha256=digest.hexdigest(), size=size)
+
+
+async def remove_file(path: str):
+    """Удалить файл, если он существует, вне event loop"""
+    def _remove():
+        if path and os.path.exists(path):
+            os.remove(path)
+
+    await run_in_threadpool(_remove)
@@ -0,0 +1,174 @@
+"""
+Прогрев API после старта
+
+uvicorn принимает соединения сразу, а медленные шаги выполняются в фоне:
+- migrations: миграции Alembic (повторяются, пока БД недоступна);
+- db_pool: заполнение пулов соединений (и реплики), чтобы первые запросы не открывали их;
+- sheets: аутентификация и подключение к Google Sheets (после ошибки
+  повторяется в фоне каждые SHEETS_INIT_RETRY_SECONDS);
+- catalog: загрузка категорий и индекса товаров в кеш.
+
+/health отвечает сразу (процесс жив), /ready - только когда обязательные
+шаги (миграции и пул БД) выполнены, а остальные завершились хотя бы с
+ошибкой: без Google Sheets API работает с пустым каталогом, как и раньше.
+"""
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, Optional
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import text
+
+from api.database import engine, read_engine, init_db
+from api.services.sheets import sheets_service, SHEETS_INIT_RETRY_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Пауза между попытками применить миграции, пока БД недоступна
+WARMUP_DB_RETRY_SECONDS = int(os.getenv("WARMUP_DB_RETRY_SECONDS", "3"))
+
+# Сколько соединений пула открыть заранее
+WARMUP_DB_CONNECTIONS = int(os.getenv("WARMUP_DB_CONNECTIONS", "5"))
+
+# Шаги, без которых API не готов принимать запросы
+REQUIRED_STEPS = ("migrations", "db_pool")
+
+
+@dataclass
+class WarmupStep:
+    """Состояние шага прогрева"""
+    status: str = "pending"  # pending, running, ok, failed
+    duration_ms: Optional[int] = None
+    error: Optional[str] = None
+
+
+@dataclass
+class WarmupState:
+    """Состояние прогрева для /ready"""
+    started_at: float = field(default_factory=time.monotonic)
+    steps: Dict[str, WarmupStep] = field(default_factory=lambda: {
+        name: WarmupStep() for name in ("migrations", "db_pool", "sheets", "catalog")
+    })
+
+    @property
+    def ready(self) -> bool:
+        return (all(self.steps[name].status == "ok" for name in REQUIRED_STEPS)
+                and all(step.status in ("ok", "failed") for step in self.steps.values()))
+
+
+async def _prefill_pool(connections: int):
+    """Открыть соединения пулов (основной БД и реплики) одновременно и вернуть их в пул"""
+    async def _touch(pool_engine):
+        async with pool_engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+    engines = [engine] if read_engine is None else [engine, read_engine]
+    await asyncio.gather(*(_touch(pool_engine) for pool_engine in engines for _ in range(connections)))
+
+
+def _load_catalog():
+    sheets_service.get_categories()
+    sheets_service.get_products_index()
+
+
+class WarmupService:
+    """Фоновый прогрев API"""
+
+    def __init__(self):
+        self.state = WarmupState()
+        # Миграции применены - можно запускать фоновые задачи, работающие с БД
+        self.migrated = asyncio.Event()
+
+    async def _step(self, name: str, action: Callable[[], Awaitable], retry_seconds: Optional[int] = None):
+        """Выполнить шаг с замером времени (retry_seconds - повторять до успеха)"""
+        step = self.state.steps[name]
+        step.status = "running"
+        started = time.monotonic()
+        while True:
+            try:
+                await action()
+                step.status = "ok"
+                step.error = None
+                break
+            except Exception as e:
+                step.error = str(e)
+                if retry_seconds is None:
+                    step.status = "failed"
+                    logger.error(f"Warmup step {name} failed: {e}")
+                    break
+                logger.warning(f"Warmup step {name} failed, retrying in {retry_seconds} s: {e}")
+                await asyncio.sleep(retry_seconds)
+        step.duration_ms = int((time.monotonic() - started) * 1000)
+
+    async def _init_sheets(self):
+        if not await run_in_threadpool(sheets_service.initialize, True):
+            raise RuntimeError("Google Sheets not available")
+
+    async def run(self):
+        """Выполнить прогрев (фоновая задача lifespan)"""
+        logger.info("Warmup started")
+
+        async def _migrations_and_pool():
+            await self._step("migrations", init_db, retry_seconds=WARMUP_DB_RETRY_SECONDS)
+            self.migrated.set()
+            await self._step("db_pool", lambda: _prefill_pool(WARMUP_DB_CONNECTIONS))
+
+        async def _sheets_and_catalog():
+            await self._step("sheets", self._init_sheets)
+            if self.state.steps["sheets"].status == "ok":
+                await self._step("catalog", lambda: run_in_threadpool(_load_catalog))
+            else:
+                self.state.steps["catalog"].status = "failed"
+                self.state.steps["catalog"].error = "Google Sheets not available"
+
+        # БД и Google Sheets прогреваются параллельно
+        await asyncio.gather(_migrations_and_pool(), _sheets_and_catalog())
+
+        elapsed = time.monotonic() - self.state.started_at
+        statuses = ", ".join(f"{name}={step.status}" for name, step in self.state.steps.items())
+        logger.info(f"Warmup finished in {elapsed:.1f}s ({statuses})")
+
+        if not sheets_service.is_initialized:
+            await self._reconnect_sheets()
+
+    async def _reconnect_sheets(self):
+        """
+        Переподключаться к Google Sheets в фоне, пока не удастся
+
+        Шаги остаются failed (API готов и без каталога) и становятся ok после
+        подключения и загрузки каталога.
+        """
+        while not sheets_service.is_initialized:
+            await asyncio.sleep(SHEETS_INIT_RETRY_SECONDS)
+            try:
+                await run_in_threadpool(sheets_service.initialize, True)
+            except Exception as e:
+                logger.warning(f"Google Sheets reconnect failed: {e}")
+
+        logger.info("Google Sheets connected after warmup, loading catalog")
+        self.state.steps["sheets"].status = "ok"
+        self.state.steps["sheets"].error = None
+        try:
+            await run_in_threadpool(_load_catalog)
+            self.state.steps["catalog"].status = "ok"
+            self.state.steps["catalog"].error = None
+        except Exception as e:
+            logger.error(f"Catalog load after Google Sheets reconnect failed: {e}")
+
+    def report(self) -> Dict:
+        """Состояние прогрева для /ready"""
+        return {
+            "status": "ready" if self.state.ready else "warming_up",
+            "uptime_seconds": round(time.monotonic() - self.state.started_at, 1),
+            "steps": {
+                name: {"status": step.status, "duration_ms": step.duration_ms, "error": step.error}
+                for name, step in self.state.steps.items()
+            },
+        }
+
+
+# Singleton instance
+warmup_service = WarmupService()
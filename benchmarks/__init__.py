@@ -0,0 +1,3 @@
+"""
+Бенчмарки сервисов API
+"""
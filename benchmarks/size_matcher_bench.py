@@ -0,0 +1,299 @@
+"""
+Бенчмарк и golden-проверка сервиса подбора размеров
+
+Запуск:
+    python -m benchmarks.size_matcher_bench                  # golden-проверка + замеры
+    python -m benchmarks.size_matcher_bench --golden-only    # только golden-проверка
+    python -m benchmarks.size_matcher_bench --update-golden  # перегенерировать корпус
+
+Golden-корпус (size_matcher_golden.jsonl) хранит входные данные целиком
+(параметры пользователя, таблица размеров, доступные размеры) и ожидаемый ответ
+`recommend_size`. Проверка выполняется при каждом запуске, поэтому любая
+оптимизация сервиса должна давать побайтно те же ответы.
+"""
+import argparse
+import json
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from api.services.size_matcher import SizeMatcherService
+
+GOLDEN_PATH = Path(__file__).with_name("size_matcher_golden.jsonl")
+
+# Числовые параметры таблицы размеров (russian_size задается строкой-диапазоном)
+NUMERIC_PARAMS = [p for p in SizeMatcherService.ALL_PARAMS if p != 'russian_size']
+
+# Базовые значения и шаг между соседними размерами для правдоподобных таблиц
+PARAM_BASE = {
+    'shoulder_length': (34, 1), 'back_width': (32, 1), 'sleeve_length': (56, 1),
+    'back_length': (62, 2), 'chest': (78, 4), 'waist': (58, 4), 'hips': (84, 4),
+    'pants_length': (96, 1), 'waist_girth': (62, 4), 'rise_height': (22, 1),
+    'back_rise_height': (32, 1),
+}
+
+ROW_COUNTS = [5, 10, 20, 50]
+PARAM_COUNTS = [1, 3, 6, 12]
+
+
+# === Генерация синтетических данных ===
+
+def make_size_table(rng: random.Random, rows: int, params: List[str]) -> List[Dict]:
+    """Сгенерировать таблицу размеров в формате GoogleSheetsService.get_size_table"""
+    table = []
+    for i in range(rows):
+        size = str(40 + 2 * i)
+        row = {'table_id': 'BENCH', 'size': size, 'russian_size': None}
+        for param in NUMERIC_PARAMS:
+            row[f'{param}_min'] = None
+            row[f'{param}_max'] = None
+
+        for param in params:
+            if param == 'russian_size':
+                # Иногда одиночное значение, иногда пустая ячейка
+                roll = rng.random()
+                if roll < 0.1:
+                    row['russian_size'] = None
+                elif roll < 0.2:
+                    row['russian_size'] = size
+                else:
+                    row['russian_size'] = f"{size}-{int(size) + 2}"
+                continue
+
+            base, step = PARAM_BASE[param]
+            if rng.random() < 0.05:
+                continue  # Пропуск значения в таблице
+            low = base + step * i + rng.randint(-1, 1)
+            row[f'{param}_min'] = low
+            row[f'{param}_max'] = low + step + rng.randint(-1, 1)
+        table.append(row)
+    return table
+
+
+def make_measurements(rng: random.Random, table: List[Dict], params: List[str]) -> Dict:
+    """Сгенерировать параметры пользователя около/за пределами таблицы"""
+    measurements = {param: None for param in SizeMatcherService.ALL_PARAMS}
+    anchor = rng.randrange(len(table))
+    for param in params:
+        roll = rng.random()
+        if roll < 0.1:
+            continue  # Параметр не заполнен
+        if param == 'russian_size':
+            measurements[param] = str(40 + 2 * anchor + rng.choice([0, 0, 1, 2]))
+            continue
+
+        base, step = PARAM_BASE[param]
+        if roll < 0.15:
+            measurements[param] = base - 10  # Меньше минимума таблицы
+        elif roll < 0.2:
+            measurements[param] = base + step * (len(table) + 3)  # Больше максимума
+        elif roll < 0.22:
+            measurements[param] = "abc"  # Мусор из старых записей
+        else:
+            measurements[param] = base + step * anchor + rng.randint(-step, 2 * step)
+    return measurements
+
+
+def make_available_sizes(rng: random.Random, table: List[Dict]) -> List[str]:
+    """Случайное подмножество размеров таблицы (иногда с размером не из таблицы)"""
+    sizes = [row['size'] for row in table]
+    available = rng.sample(sizes, rng.randint(1, len(sizes)))
+    if rng.random() < 0.1:
+        available.append("ONE SIZE")
+    return available
+
+
+def make_case(rng: random.Random, rows: int, param_count: int) -> Dict:
+    """Сгенерировать один вход recommend_size"""
+    params = rng.sample(SizeMatcherService.ALL_PARAMS, param_count)
+    table = make_size_table(rng, rows, params)
+    return {
+        'user_measurements': make_measurements(rng, table, params),
+        'size_table': table,
+        'available_sizes': make_available_sizes(rng, table),
+    }
+
+
+def edge_cases() -> List[Dict]:
+    """Граничные случаи, которые обязаны оставаться неизменными"""
+    rng = random.Random(7)
+    table = make_size_table(rng, 5, ['chest', 'waist', 'russian_size'])
+    sizes = [row['size'] for row in table]
+    return [
+        {'user_measurements': {}, 'size_table': table, 'available_sizes': sizes},
+        {'user_measurements': {'chest': 90}, 'size_table': [], 'available_sizes': sizes},
+        {'user_measurements': {'chest': 90}, 'size_table': table, 'available_sizes': ['XXL']},
+        {'user_measurements': {'hips': 90}, 'size_table': table, 'available_sizes': sizes},
+        {'user_measurements': {'chest': 10, 'waist': 500}, 'size_table': table, 'available_sizes': sizes},
+        {'user_measurements': {'chest': '', 'waist': None, 'russian_size': '44'},
+         'size_table': table, 'available_sizes': sizes},
+        {'user_measurements': {'chest': 'n/a', 'unknown_param': 5}, 'size_table': table, 'available_sizes': sizes},
+    ]
+
+
+def build_corpus(seed: int) -> List[Dict]:
+    """Собрать golden-корпус: граничные случаи + синтетика по всей сетке размеров"""
+    rng = random.Random(seed)
+    cases = edge_cases()
+    for rows in ROW_COUNTS:
+        for param_count in PARAM_COUNTS:
+            for _ in range(3):
+                cases.append(make_case(rng, rows, param_count))
+    return cases
+
+
+# === Golden-проверка ===
+
+def normalize(result: Dict) -> Dict:
+    """Привести ответ к детерминированному виду (matched_parameters строится из set)"""
+    result = json.loads(json.dumps(result))
+    details = result.get('details') or {}
+    if 'matched_parameters' in details:
+        details['matched_parameters'] = sorted(details['matched_parameters'])
+    return result
+
+
+def compact_case(case: Dict) -> Dict:
+    """Убрать пустые ячейки таблицы, чтобы корпус оставался компактным"""
+    table = [{k: v for k, v in row.items() if v is not None} for row in case['size_table']]
+    return dict(case, size_table=table)
+
+
+def expand_case(case: Dict) -> Dict:
+    """Восстановить полную форму строк таблицы (как в get_size_table)"""
+    table = []
+    for row in case['size_table']:
+        full_row = {'russian_size': None}
+        for param in NUMERIC_PARAMS:
+            full_row[f'{param}_min'] = None
+            full_row[f'{param}_max'] = None
+        full_row.update(row)
+        table.append(full_row)
+    return dict(case, size_table=table)
+
+
+def run_case(service: SizeMatcherService, case: Dict) -> Dict:
+    return normalize(service.recommend_size(
+        user_measurements=case['user_measurements'],
+        size_table=case['size_table'],
+        available_sizes=case['available_sizes'],
+    ))
+
+
+def update_golden(service: SizeMatcherService, seed: int) -> int:
+    """Перезаписать golden-корпус ответами текущей реализации"""
+    cases = build_corpus(seed)
+    with GOLDEN_PATH.open('w', encoding='utf-8') as f:
+        for case in cases:
+            entry = dict(compact_case(case), expected=run_case(service, case))
+            f.write(json.dumps(entry, ensure_ascii=False, separators=(',', ':')) + '\n')
+    return len(cases)
+
+
+def check_golden(service: SizeMatcherService) -> Tuple[int, List[str]]:
+    """Сверить ответы сервиса с golden-корпусом. Возвращает (кол-во случаев, ошибки)"""
+    failures = []
+    total = 0
+    with GOLDEN_PATH.open(encoding='utf-8') as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            total += 1
+            entry = json.loads(line)
+            actual = run_case(service, expand_case(entry))
+            if actual != entry['expected']:
+                failures.append(
+                    f"case #{line_no}: expected {entry['expected']!r}, got {actual!r}"
+                )
+    return total, failures
+
+
+# === Замеры ===
+
+def time_calls(func, args_list: List[tuple], iterations: int) -> List[float]:
+    """Время одного вызова (сек) для каждой итерации"""
+    timings = []
+    n = len(args_list)
+    perf = time.perf_counter
+    for i in range(iterations):
+        args = args_list[i % n]
+        start = perf()
+        func(*args)
+        timings.append(perf() - start)
+    return timings
+
+
+def summarize(name: str, timings: List[float]) -> str:
+    timings_us = sorted(t * 1e6 for t in timings)
+    p95 = timings_us[int(len(timings_us) * 0.95) - 1]
+    total = sum(timings)
+    throughput = len(timings) / total if total else float('inf')
+    return (
+        f"{name:<34} mean {statistics.fmean(timings_us):9.1f} µs | "
+        f"p50 {statistics.median(timings_us):9.1f} µs | "
+        f"p95 {p95:9.1f} µs | {throughput:11,.0f} calls/s"
+    )
+
+
+def run_benchmarks(service: SizeMatcherService, seed: int, iterations: int, variants: int):
+    rng = random.Random(seed)
+
+    print("recommend_size / _get_param_boundaries")
+    for rows in ROW_COUNTS:
+        for param_count in PARAM_COUNTS:
+            cases = [make_case(rng, rows, param_count) for _ in range(variants)]
+            recommend_args = [
+                (c['user_measurements'], c['size_table'], c['available_sizes']) for c in cases
+            ]
+            boundaries_args = [(c['size_table'],) for c in cases]
+
+            print(summarize(
+                f"recommend rows={rows:<2} params={param_count:<2}",
+                time_calls(service.recommend_size, recommend_args, iterations),
+            ))
+            print(summarize(
+                f"boundaries rows={rows:<2} params={param_count:<2}",
+                time_calls(service._get_param_boundaries, boundaries_args, iterations),
+            ))
+
+    print("\n_parse_size_range")
+    parse_args = [(v,) for v in ["42-44", "46", 48, None, "abc", " 50-52 ", "", "54-"]]
+    print(summarize("parse_size_range (mixed)", time_calls(
+        service._parse_size_range, parse_args, iterations * 10
+    )))
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Size matcher benchmark")
+    parser.add_argument("--seed", type=int, default=20240601, help="Seed для синтетических данных")
+    parser.add_argument("--iterations", type=int, default=2000, help="Вызовов на каждую точку сетки")
+    parser.add_argument("--variants", type=int, default=20, help="Разных таблиц на каждую точку сетки")
+    parser.add_argument("--golden-only", action="store_true", help="Только golden-проверка")
+    parser.add_argument("--update-golden", action="store_true", help="Перегенерировать golden-корпус")
+    args = parser.parse_args(argv)
+
+    service = SizeMatcherService()
+
+    if args.update_golden:
+        count = update_golden(service, args.seed)
+        print(f"Golden corpus written: {count} cases -> {GOLDEN_PATH}")
+        return 0
+
+    total, failures = check_golden(service)
+    if failures:
+        print(f"Golden check FAILED: {len(failures)}/{total} cases differ")
+        for failure in failures[:10]:
+            print(f"  {failure}")
+        return 1
+    print(f"Golden check passed: {total} cases\n")
+
+    if not args.golden_only:
+        run_benchmarks(service, args.seed, args.iterations, args.variants)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
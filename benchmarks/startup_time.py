@@ -0,0 +1,84 @@
+"""
+Замер времени старта API (time-to-healthy / time-to-ready)
+
+Запуск (для CI - с порогами, при превышении код возврата 1):
+    python -m benchmarks.startup_time --max-healthy 5 --max-ready 60
+
+Скрипт запускает uvicorn api.main:app отдельным процессом и опрашивает
+/health (процесс принимает соединения) и /ready (прогрев завершен: миграции,
+пул БД, Google Sheets). Печатает оба времени и состояние шагов прогрева.
+Без --max-ready готовность не обязательна (например, в CI без Postgres).
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from typing import Optional, Tuple
+
+POLL_INTERVAL_SECONDS = 0.05
+
+
+def _get(url: str) -> Tuple[Optional[int], Optional[dict]]:
+    try:
+        with urllib.request.urlopen(url, timeout=1) as response:
+            return response.status, json.loads(response.read() or b"null")
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read() or b"null")
+    except (urllib.error.URLError, ConnectionError, TimeoutError):
+        return None, None
+
+
+def wait_for(url: str, started: float, timeout: float) -> Tuple[Optional[float], Optional[dict]]:
+    """Секунды от запуска процесса до ответа 200 (None - не дождались)"""
+    body = None
+    while time.monotonic() - started < timeout:
+        status, body = _get(url)
+        if status == 200:
+            return time.monotonic() - started, body
+        time.sleep(POLL_INTERVAL_SECONDS)
+    return None, body
+
+
+def main(port: int, timeout: float, max_healthy: Optional[float], max_ready: Optional[float]) -> int:
+    base_url = f"http://127.0.0.1:{port}"
+    started = time.monotonic()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api.main:app", "--host", "127.0.0.1", "--port", str(port)],
+        env=os.environ.copy(),
+    )
+    try:
+        healthy, _ = wait_for(f"{base_url}/health", started, timeout)
+        ready, report = wait_for(f"{base_url}/ready", started, timeout if max_ready is not None else 0)
+        if report is None:
+            _status, report = _get(f"{base_url}/ready")
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+    print(f"time-to-healthy: {f'{healthy:.2f}s' if healthy is not None else 'timeout'}")
+    print(f"time-to-ready:   {f'{ready:.2f}s' if ready is not None else 'not ready'}")
+    if report:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+
+    failures = 0
+    if max_healthy is not None and (healthy is None or healthy > max_healthy):
+        print(f"FAIL: /health not up within {max_healthy}s")
+        failures += 1
+    if max_ready is not None and (ready is None or ready > max_ready):
+        print(f"FAIL: /ready not up within {max_ready}s")
+        failures += 1
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Замер времени старта API")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--timeout", type=float, default=120, help="Сколько ждать каждого endpoint")
+    parser.add_argument("--max-healthy", type=float, help="Порог time-to-healthy в секундах")
+    parser.add_argument("--max-ready", type=float, help="Порог time-to-ready в секундах (ждать /ready)")
+    args = parser.parse_args()
+    sys.exit(main(args.port, args.timeout, args.max_healthy, args.max_ready))
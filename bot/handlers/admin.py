@@ -64,6 +64,14 @@ async def format_stats_text(stats: dict) -> str:
             for i, item in enumerate(top_tryons[:5], 1):
                 text += f"\n{i}. {item.get('name', item.get('product_id'))} - {item.get('count', 0)} примерок"
 
+    # Объединение одинаковых одновременных GET-запросов бота к API
+    coalesce = api_client.get_coalesce_stats()
+    text += f"""
+
+🔁 Запросы к API:
+GET-вызовов: {coalesce['requests']}
+Объединено: {coalesce['coalesced']}"""
+
     return text
 
 
@@ -113,26 +113,21 @@ async def get_product_photo(product: dict, prefer_collage: bool = True) -> Optio
     return await get_optimized_photo(photo_url)
 
 
-async def format_product_message(product: dict, user_id: int, current_index: int, total_count: int):
-    """Форматировать сообщение карточки товара"""
-    measurements = await api_client.get_measurements(user_id)
-    size_recommendation = ""
-
-    if measurements:
-        recommendation = await api_client.recommend_size(user_id, product['product_id'])
-        if recommendation and recommendation.get('success') and recommendation.get('recommended_size'):
-            size_recommendation = f"\n\n✅ Рекомендуемый размер: {recommendation['recommended_size']}"
-            # Optionally, add alternative size if available
-            if recommendation.get('alternative_size'):
-                size_recommendation += f" (возможно, подойдет {recommendation['alternative_size']})"
-        elif recommendation:
-            # Use the message from the recommendation service if it fails
-            size_recommendation = f"\n\n⚠️ {recommendation.get('message', 'Не удалось подобрать размер')}"
-        else:
-            # Fallback if API call fails
-            size_recommendation = "\n\n⚠️ Не удалось получить рекомендацию по размеру"
-    else:
-        size_recommendation = "\n\n📐 Укажи свои параметры, чтобы получить рекомендацию по размеру"
+def format_size_recommendation(recommendation: Optional[dict]) -> str:
+    """Текст рекомендации размера из ответа API"""
+    if not recommendation:
+        return "⚠️ Не удалось получить рекомендацию по размеру"
+    if recommendation.get('success') and recommendation.get('recommended_size'):
+        text = f"✅ Рекомендуемый размер: {recommendation['recommended_size']}"
+        if recommendation.get('alternative_size'):
+            text += f" (возможно, подойдет {recommendation['alternative_size']})"
+        return text
+    return recommendation.get('message') or "⚠️ Не удалось подобрать размер"
+
+
+def format_product_message(card: dict) -> str:
+    """Форматировать сообщение карточки товара (ответ /api/cards)"""
+    product = card['product']
 
     # Ограничиваем описание (Telegram caption max 1024 символов)
     description = product.get('description', '')
@@ -140,13 +135,17 @@ async def format_product_message(product: dict, user_id: int, current_index: int
     if len(description) > max_description_length:
         description = description[:max_description_length].rsplit(' ', 1)[0] + '...'
 
+    size_recommendation = format_size_recommendation(card.get('size_recommendation'))
+
     message_text = f"""🧥 {product.get('name', 'Без названия')}
 
 {description}
 
-Размеры: {product.get('available_sizes', 'Нет данных')}{size_recommendation}
+Размеры: {product.get('available_sizes', 'Нет данных')}
+
+{size_recommendation}
 
-Товар {current_index + 1} из {total_count}"""
+Товар {card['index'] + 1} из {card['total']}"""
 
     return message_text
 
@@ -176,15 +175,15 @@ async def show_category_products(callback: CallbackQuery):
     category_id = callback.data.split(":")[1]
     user_id = callback.from_user.id
 
-    products = await api_client.get_products_by_category(category_id)
+    card = await api_client.get_product_card(user_id, category_id, 0)
 
-    if not products:
+    if not card:
         await callback.answer("В этой категории пока нет товаров", show_alert=True)
         return
 
-    product = products[0]
-    message_text = await format_product_message(product, user_id, 0, len(products))
-    is_fav = await api_client.check_favorite(user_id, product['product_id'])
+    product = card['product']
+    message_text = format_product_message(card)
+    is_fav = card['is_favorite']
 
     try:
         await callback.message.delete()
@@ -197,7 +196,7 @@ async def show_category_products(callback: CallbackQuery):
             photo=photo,
             caption=message_text,
             reply_markup=get_product_keyboard(
-                product, category_id, 0, len(products), is_fav
+                product, category_id, 0, card['total'], is_fav
             ),
         )
     else:
@@ -208,7 +207,7 @@ async def show_category_products(callback: CallbackQuery):
                 product,
                 category_id,
                 0,
-                len(products),
+                card['total'],
                 is_fav
             )
         )
@@ -224,19 +223,17 @@ async def navigate_products(callback: CallbackQuery):
     action = parts[3]
     user_id = callback.from_user.id
 
-    products = await api_client.get_products_by_category(category_id)
-    if not products:
+    # API переводит позицию по кругу: -1 - последний товар, total - первый
+    step = 1 if action == "next" else -1
+    card = await api_client.get_product_card(user_id, category_id, current_index + step)
+    if not card:
         await callback.answer("Товары не найдены", show_alert=True)
         return
 
-    if action == "next":
-        new_index = (current_index + 1) % len(products)
-    else:  # prev
-        new_index = (current_index - 1 + len(products)) % len(products)
-
-    product = products[new_index]
-    message_text = await format_product_message(product, user_id, new_index, len(products))
-    is_fav = await api_client.check_favorite(user_id, product['product_id'])
+    product = card['product']
+    new_index = card['index']
+    message_text = format_product_message(card)
+    is_fav = card['is_favorite']
 
     photo = await get_product_photo(product)
     if not photo:
@@ -253,7 +250,7 @@ async def navigate_products(callback: CallbackQuery):
                 product,
                 category_id,
                 new_index,
-                len(products),
+                card['total'],
                 is_fav
             )
         )
@@ -267,7 +264,7 @@ async def navigate_products(callback: CallbackQuery):
                 product,
                 category_id,
                 new_index,
-                len(products),
+                card['total'],
                 is_fav
             )
         )
@@ -311,15 +308,16 @@ async def back_to_product(callback: CallbackQuery):
     index = int(parts[4])
     user_id = callback.from_user.id
 
-    product = await api_client.get_product_by_id(product_id)
-    products = await api_client.get_products_by_category(category_id)
+    card = await api_client.get_product_card(user_id, category_id, index, product_id=product_id)
 
-    if not product or not products:
+    if not card or card['product']['product_id'] != product_id:
         await callback.answer("Товар или категория не найдены.", show_alert=True)
         return
 
-    message_text = await format_product_message(product, user_id, index, len(products))
-    is_fav = await api_client.check_favorite(user_id, product_id)
+    product = card['product']
+    index = card['index']
+    message_text = format_product_message(card)
+    is_fav = card['is_favorite']
 
     await callback.message.delete()
 
@@ -329,7 +327,7 @@ async def back_to_product(callback: CallbackQuery):
             photo=photo,
             caption=message_text,
             reply_markup=get_product_keyboard(
-                product, category_id, index, len(products), is_fav
+                product, category_id, index, card['total'], is_fav
             ),
         )
     else:
@@ -340,7 +338,7 @@ async def back_to_product(callback: CallbackQuery):
                 product,
                 category_id,
                 index,
-                len(products),
+                card['total'],
                 is_fav
             )
         )
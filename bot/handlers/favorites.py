@@ -5,59 +5,21 @@ from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery, URLInputFile, InputMediaPhoto, BufferedInputFile
 
 from bot.keyboards.catalog import get_favorites_product_keyboard, get_go_to_catalog_keyboard
-from bot.keyboards.main_menu import get_main_menu
 from bot.utils.api_client import api_client
-from bot.handlers.catalog import get_valid_photo_url
+from bot.handlers.catalog import get_valid_photo_url, format_product_message
 from bot.utils.image_processor import get_optimized_photo
 
 router = Router()
 
 
-async def format_favorite_product_message(product: dict, user_id: int, current_index: int, total_count: int):
-    """Форматировать сообщение карточки товара в избранном"""
-    measurements = await api_client.get_measurements(user_id)
-    size_recommendation = ""
-
-    if measurements:
-        recommendation = await api_client.recommend_size(user_id, product['product_id'])
-        if recommendation and recommendation.get('success') and recommendation.get('recommended_size'):
-            size_recommendation = f"\n\n✅ Рекомендуемый размер: {recommendation['recommended_size']}"
-            # Optionally, add alternative size if available
-            if recommendation.get('alternative_size'):
-                size_recommendation += f" (возможно, подойдет {recommendation['alternative_size']})"
-        elif recommendation:
-            # Use the message from the recommendation service if it fails
-            size_recommendation = f"\n\n{recommendation.get('message', '⚠️ Не удалось подобрать размер')}"
-        else:
-            # Fallback if API call fails
-            size_recommendation = "\n\n⚠️ Не удалось получить рекомендацию по размеру"
-    else:
-        size_recommendation = "\n\n📐 Укажи свои параметры, чтобы получить рекомендацию по размеру"
-
-    # Ограничиваем описание (Telegram caption max 1024 символов)
-    description = product.get('description', '')
-    max_description_length = 600
-    if len(description) > max_description_length:
-        description = description[:max_description_length].rsplit(' ', 1)[0] + '...'
-
-    message_text = f"""🧥 {product.get('name', 'Без названия')}
-
-{description}
-
-Размеры: {product.get('available_sizes', 'Нет данных')}{size_recommendation}
-
-Товар {current_index + 1} из {total_count}"""
-
-    return message_text
-
-
 @router.callback_query(F.data == "favorites")
 async def show_favorites(callback: CallbackQuery):
     """Показать избранное"""
     user_id = callback.from_user.id
-    favorites = await api_client.get_favorites(user_id)
+    # Первая карточка избранного, недоступные товары API пропускает
+    card = await api_client.get_favorite_card(user_id, 0)
 
-    if not favorites:
+    if not card:
         await callback.message.edit_text(
             "⭐️ Избранное\n\nТвое избранное пока пусто. Добавь понравившиеся товары из каталога! 💫",
             reply_markup=get_go_to_catalog_keyboard()
@@ -65,19 +27,8 @@ async def show_favorites(callback: CallbackQuery):
         await callback.answer()
         return
 
-    # API возвращает список словарей, нам нужен ID
-    product_id = favorites[0]['product_id']
-    product = await api_client.get_product_by_id(product_id)
-
-    if not product:
-        await callback.message.edit_text(
-            "⭐️ Избранное\n\nТовар не найден",
-            reply_markup=get_main_menu()
-        )
-        await callback.answer()
-        return
-
-    message_text = await format_favorite_product_message(product, user_id, 0, len(favorites))
+    product = card['product']
+    message_text = format_product_message(card)
 
     await callback.message.delete()
 
@@ -88,17 +39,17 @@ async def show_favorites(callback: CallbackQuery):
             await callback.message.answer_photo(
                 photo=optimized_photo,
                 caption=message_text,
-                reply_markup=get_favorites_product_keyboard(product, 0, len(favorites))
+                reply_markup=get_favorites_product_keyboard(product, 0, card['total'])
             )
         else:
             await callback.message.answer(
                 f"📷 Не удалось загрузить фото\n\n{message_text}",
-                reply_markup=get_favorites_product_keyboard(product, 0, len(favorites))
+                reply_markup=get_favorites_product_keyboard(product, 0, card['total'])
             )
     else:
         await callback.message.answer(
             f"📷 Фото недоступно\n\n{message_text}",
-            reply_markup=get_favorites_product_keyboard(product, 0, len(favorites))
+            reply_markup=get_favorites_product_keyboard(product, 0, card['total'])
         )
     await callback.answer()
 
@@ -151,24 +102,23 @@ async def remove_favorite(callback: CallbackQuery):
             )
 
             if is_in_favorites_view:
-                favorites = await api_client.get_favorites(user_id)
-                if not favorites:
+                card = await api_client.get_favorite_card(user_id, 0)
+                if not card:
                     await callback.message.delete()
                     await callback.message.answer(
                         "⭐️ Избранное\n\nТвое избранное пусто. Добавь понравившиеся товары из каталога! 💫",
                         reply_markup=get_go_to_catalog_keyboard()
                     )
                 else:
-                    product_id = favorites[0]['product_id']
-                    product = await api_client.get_product_by_id(product_id)
-                    message_text = await format_favorite_product_message(product, user_id, 0, len(favorites))
+                    product = card['product']
+                    message_text = format_product_message(card)
                     
                     photo_url = get_valid_photo_url(product)
                     if not photo_url:
                         await callback.message.delete()
                         await callback.message.answer(
                             f"📷 Фото недоступно\n\n{message_text}",
-                            reply_markup=get_favorites_product_keyboard(product, 0, len(favorites))
+                            reply_markup=get_favorites_product_keyboard(product, 0, card['total'])
                         )
                         return
 
@@ -182,7 +132,7 @@ async def remove_favorite(callback: CallbackQuery):
                             media=optimized_photo,
                             caption=message_text
                         ),
-                        reply_markup=get_favorites_product_keyboard(product, 0, len(favorites))
+                        reply_markup=get_favorites_product_keyboard(product, 0, card['total'])
                     )
             else:
                 new_keyboard[0] = [
@@ -208,25 +158,17 @@ async def navigate_favorites(callback: CallbackQuery):
     action = parts[2]
 
     user_id = callback.from_user.id
-    favorites = await api_client.get_favorites(user_id)
+    # API переводит позицию по кругу: -1 - последний товар, total - первый
+    step = 1 if action == "next" else -1
+    card = await api_client.get_favorite_card(user_id, current_index + step)
 
-    if not favorites:
+    if not card:
         await callback.answer("Избранное пусто", show_alert=True)
         return
 
-    if action == "next":
-        new_index = (current_index + 1) % len(favorites)
-    else:  # prev
-        new_index = (current_index - 1 + len(favorites)) % len(favorites)
-
-    product_id = favorites[new_index]['product_id']
-    product = await api_client.get_product_by_id(product_id)
-
-    if not product:
-        await callback.answer("Товар не найден", show_alert=True)
-        return
-
-    message_text = await format_favorite_product_message(product, user_id, new_index, len(favorites))
+    product = card['product']
+    new_index = card['index']
+    message_text = format_product_message(card)
     photo_url = get_valid_photo_url(product)
 
     if not photo_url:
@@ -234,7 +176,7 @@ async def navigate_favorites(callback: CallbackQuery):
         await callback.message.delete()
         await callback.message.answer(
             f"📷 Фото недоступно\n\n{message_text}",
-            reply_markup=get_favorites_product_keyboard(product, new_index, len(favorites))
+            reply_markup=get_favorites_product_keyboard(product, new_index, card['total'])
         )
         await callback.answer()
         return
@@ -250,14 +192,14 @@ async def navigate_favorites(callback: CallbackQuery):
                 media=optimized_photo,
                 caption=message_text
             ),
-            reply_markup=get_favorites_product_keyboard(product, new_index, len(favorites))
+            reply_markup=get_favorites_product_keyboard(product, new_index, card['total'])
         )
     except:
         await callback.message.delete()
         await callback.message.answer_photo(
             photo=optimized_photo,
             caption=message_text,
-            reply_markup=get_favorites_product_keyboard(product, new_index, len(favorites))
+            reply_markup=get_favorites_product_keyboard(product, new_index, card['total'])
         )
     await callback.answer()
 
@@ -305,10 +247,15 @@ async def back_to_favorite_product(callback: CallbackQuery):
     index = int(parts[2])
 
     user_id = callback.from_user.id
-    favorites = await api_client.get_favorites(user_id)
-    product = await api_client.get_product_by_id(product_id)
+    # Индекс мог сдвинуться, если избранное изменилось: позицию определяет API по product_id
+    card = await api_client.get_favorite_card(user_id, index, product_id=product_id)
+    if not card or card['product']['product_id'] != product_id:
+        await callback.answer("Товар больше не в избранном", show_alert=True)
+        return
+    product = card['product']
+    index = card['index']
 
-    message_text = await format_favorite_product_message(product, user_id, index, len(favorites))
+    message_text = format_product_message(card)
 
     await callback.message.delete()
     
@@ -319,16 +266,16 @@ async def back_to_favorite_product(callback: CallbackQuery):
             await callback.message.answer_photo(
                 photo=optimized_photo,
                 caption=message_text,
-                reply_markup=get_favorites_product_keyboard(product, index, len(favorites))
+                reply_markup=get_favorites_product_keyboard(product, index, card['total'])
             )
         else:
             await callback.message.answer(
                 f"📷 Не удалось загрузить фото\n\n{message_text}",
-                reply_markup=get_favorites_product_keyboard(product, index, len(favorites))
+                reply_markup=get_favorites_product_keyboard(product, index, card['total'])
             )
     else:
         await callback.message.answer(
             f"📷 Фото недоступно\n\n{message_text}",
-            reply_markup=get_favorites_product_keyboard(product, index, len(favorites))
+            reply_markup=get_favorites_product_keyboard(product, index, card['total'])
         )
     await callback.answer()
@@ -219,13 +219,12 @@ async def _update_single_measurement(message: Message, state: FSMContext, param_
     """Вспомогательная функция для обновления одного параметра через API"""
     user_id = message.from_user.id
 
-    # Сохраняем только этот параметр через API
-    await api_client.save_measurements(user_id, **{param_name: value})
+    # Сохраняем только этот параметр через API (в ответе - все параметры)
+    measurements = await api_client.save_measurements(user_id, **{param_name: value})
 
     await state.clear()
-    measurements = await api_client.get_measurements(user_id)
     if not measurements:
-        measurements = {}
+        measurements = await api_client.get_measurements(user_id) or {}
 
     await message.answer(
         f"✅ Параметр обновлен!\n\n{format_measurements_text(measurements)}",
@@ -2,7 +2,7 @@
 Обработчики онбординга новых пользователей
 """
 from aiogram import Router, F
-from aiogram.types import Message, CallbackQuery
+from aiogram.types import Message, CallbackQuery, User
 from aiogram.fsm.context import FSMContext
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 import logging
@@ -20,7 +20,8 @@ router = Router()
 logger = logging.getLogger(__name__)
 
 STORAGE_PATH = Path(os.getenv("STORAGE_PATH", "storage"))
-USER_PHOTOS_PATH = STORAGE_PATH / "user_photos"
+# Временные файлы до загрузки в хранилище API
+UPLOAD_TMP_PATH = STORAGE_PATH / "tmp"
 
 
 ONBOARDING_WELCOME = """Добро пожаловать! 👋
@@ -174,13 +175,11 @@ async def onboarding_photo_received(message: Message, state: FSMContext):
     tg_id = message.from_user.id
     photo = message.photo[-1]  # Берем самое большое фото
     status_msg = await message.answer("Проверяем фото... 🔍")
+    UPLOAD_TMP_PATH.mkdir(parents=True, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    file_path = UPLOAD_TMP_PATH / f"photo_{tg_id}_{timestamp}.jpg"
 
     try:
-        user_dir = USER_PHOTOS_PATH / str(tg_id)
-        user_dir.mkdir(parents=True, exist_ok=True)
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        file_path = user_dir / f"photo_{timestamp}.jpg"
-
         if not await download_telegram_file(message.bot, photo.file_id, str(file_path)):
             await status_msg.edit_text("❌ Не удалось скачать фото. Попробуй еще раз")
             return
@@ -200,8 +199,6 @@ async def onboarding_photo_received(message: Message, state: FSMContext):
                 f"❌ {reason}\n\nМожешь попробовать загрузить другое фото или пропустить этот шаг.",
                 reply_markup=get_skip_photo_keyboard()
             )
-            if file_path.exists():
-                file_path.unlink()
             return
 
         # Сохраняем фото в БД
@@ -213,11 +210,15 @@ async def onboarding_photo_received(message: Message, state: FSMContext):
         await status_msg.edit_text("✅ Фото принято!")
 
         # Завершаем онбординг
-        await finish_onboarding(message, state)
+        await finish_onboarding(message, state, message.from_user)
 
     except Exception as e:
         logger.error(f"Failed to process onboarding photo: {e}", exc_info=True)
         await status_msg.edit_text("❌ Ошибка обработки фото. Попробуй еще раз")
+    finally:
+        # Фото хранится в API, локальная копия больше не нужна
+        if file_path.exists():
+            file_path.unlink()
 
 
 @router.message(OnboardingStates.waiting_photo, ~F.photo)
@@ -234,17 +235,22 @@ async def skip_photo(callback: CallbackQuery, state: FSMContext):
     """Пропуск загрузки фото"""
     await callback.message.edit_text("Хорошо, ты сможешь добавить фото позже в разделе '📐 Мои параметры'")
     await callback.answer()
-    await finish_onboarding(callback.message, state)
+    await finish_onboarding(callback.message, state, callback.from_user)
 
 
 # === Завершение онбординга ===
 
-async def finish_onboarding(message: Message, state: FSMContext):
-    """Завершение онбординга и переход в главное меню"""
+async def finish_onboarding(message: Message, state: FSMContext, user: User):
+    """
+    Завершение онбординга и переход в главное меню
+
+    user - пользователь из апдейта: у message бота (callback.message)
+    from_user - сам бот.
+    """
     await state.clear()
 
     # Проверяем наличие истории примерок
-    has_history = await api_client.has_tryon_history(message.from_user.id)
+    has_history = await api_client.has_tryon_history(user.id)
 
     await message.answer(
         ONBOARDING_COMPLETE,
@@ -53,26 +53,22 @@ async def cmd_start(message: Message, state: FSMContext):
     # Сбрасываем любое активное состояние FSM
     await state.clear()
 
-    # Регистрируем или обновляем пользователя
-    await api_client.register_user(
+    # Регистрация и данные для выбора экрана одним запросом
+    session = await api_client.bootstrap_session(
         tg_id=message.from_user.id,
         username=message.from_user.username,
         first_name=message.from_user.first_name
     )
 
-    # Проверяем, является ли пользователь новым (нет обязательного параметра russian_size)
-    measurements = await api_client.get_measurements(message.from_user.id)
-
-    # Если параметров нет или нет обязательного russian_size - запускаем онбординг
-    if not measurements or not measurements.get("russian_size"):
+    # Если нет обязательного параметра russian_size - запускаем онбординг
+    if not session or not session["has_russian_size"]:
         await start_onboarding(message, state)
         return
 
     # Для существующих пользователей - показываем главное меню
-    has_history = await api_client.has_tryon_history(message.from_user.id)
     await message.answer(
         WELCOME_BACK_TEXT,
-        reply_markup=get_main_menu(has_tryon_history=has_history)
+        reply_markup=get_main_menu(has_tryon_history=session["tryon_count"] > 0)
     )
 
 
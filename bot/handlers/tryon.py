@@ -2,31 +2,29 @@
 Обработчики AI-примерки одежды
 """
 from aiogram import Router, F
-from aiogram.types import Message, CallbackQuery, FSInputFile
+from aiogram.types import Message, CallbackQuery, BufferedInputFile
 from aiogram.fsm.context import FSMContext
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 import logging
 import os
 from datetime import datetime
 from pathlib import Path
+from typing import Optional, Tuple
 from PIL import Image
 import io
-import base64
 
 from bot.keyboards.main_menu import get_main_menu
 from bot.states.tryon import TryOnStates
 from bot.utils.api_client import api_client
 from gpt_integration.photo_processing.validator import validate_photo
-from gpt_integration.photo_processing.generator import generate_tryon
-from gpt_integration.photo_processing.prompts import TRYON_SINGLE_ITEM, TRYON_FULL_OUTFIT
 from bot.services.photo_preloader import photo_preloader
 
 router = Router()
 logger = logging.getLogger(__name__)
 
 STORAGE_PATH = Path(os.getenv("STORAGE_PATH", "storage"))
-USER_PHOTOS_PATH = STORAGE_PATH / "user_photos"
-TRYON_RESULTS_PATH = STORAGE_PATH / "try_on_results"
+# Временные файлы до загрузки в хранилище API
+UPLOAD_TMP_PATH = STORAGE_PATH / "tmp"
 
 
 # === Вспомогательные функции ===
@@ -42,6 +40,17 @@ async def download_telegram_file(bot, file_id: str, save_path: str) -> bool:
         return False
 
 
+def tryon_result_filename(tryon_id: int, image_data: bytes) -> str:
+    """Имя файла результата с расширением по содержимому (после retention это JPEG/WebP)"""
+    if image_data.startswith(b"\xff\xd8"):
+        ext = "jpg"
+    elif image_data[:4] == b"RIFF" and image_data[8:12] == b"WEBP":
+        ext = "webp"
+    else:
+        ext = "png"
+    return f"tryon_{tryon_id}.{ext}"
+
+
 def compress_image(image_path: str, max_size_mb: int = 10):
     """Сжать изображение если оно больше max_size_mb"""
     if not os.path.exists(image_path): return
@@ -122,44 +131,6 @@ def get_tryon_mode_keyboard():
     ])
 
 
-def get_tryon_result_keyboard(tryon_id: int, product_id: str, wb_link: str, ozon_url: str = None,
-                              source: str = 'catalog', category_id: str = '', index: int = 0):
-    """Клавиатура после успешной примерки"""
-    keyboard = []
-
-    # Кнопки магазинов в одну строку если есть обе ссылки
-    shop_buttons = []
-    if wb_link:
-        shop_buttons.append(InlineKeyboardButton(text="Wildberries", url=wb_link))
-    if ozon_url:
-        shop_buttons.append(InlineKeyboardButton(text="Ozon", url=ozon_url))
-
-    if shop_buttons:
-        if len(shop_buttons) == 2:
-            keyboard.append(shop_buttons)
-        else:
-            keyboard.append([shop_buttons[0]])
-
-    # Формируем коллбэк для возврата
-    if source == 'catalog':
-        back_callback = f"back:product:{product_id}:{category_id}:{index}"
-    elif source == 'favorites':
-        back_callback = f"back_fav:{product_id}:{index}"
-    else:
-        # Фоллбэк на старое поведение, если источник неизвестен
-        back_callback = f"product:{product_id}"
-        
-    retry_callback = f"tryon:retry:{source}:{product_id}:{category_id}:{index}"
-
-    keyboard.extend([
-        [InlineKeyboardButton(text="💾 Сохранить результат", callback_data=f"tryon:save_result:{tryon_id}")],
-        [InlineKeyboardButton(text="🔄 Другое фото", callback_data=retry_callback)],
-        [InlineKeyboardButton(text="◀️ К товару", callback_data=back_callback)]
-    ])
-
-    return InlineKeyboardMarkup(inline_keyboard=keyboard)
-
-
 def get_my_photos_keyboard():
     return InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="📤 Загрузить фото", callback_data="tryon:upload_new")],
@@ -202,7 +173,8 @@ async def start_tryon(callback: CallbackQuery, state: FSMContext):
         # Проверяем лимит примерок
         limit_result = await api_client.check_tryon_limit(tg_id)
         if limit_result and limit_result.get("limit_reached"):
-            await callback.answer(f"Ты достиг лимита примерок на сегодня ({limit_result.get('count', 10)}/10). Попробуй завтра! 😊", show_alert=True)
+            limit = limit_result.get('limit', 10)
+            await callback.answer(f"Ты достиг лимита примерок на сегодня ({limit}/{limit}). Попробуй завтра! 😊", show_alert=True)
             return
 
         # Сразу запрашиваем режим примерки
@@ -245,7 +217,8 @@ async def retry_tryon(callback: CallbackQuery, state: FSMContext):
         )
         limit_result = await api_client.check_tryon_limit(tg_id)
         if limit_result and limit_result.get("limit_reached"):
-            await callback.answer(f"Ты достиг лимита примерок на сегодня ({limit_result.get('count', 10)}/10). Попробуй завтра! 😊", show_alert=True)
+            limit = limit_result.get('limit', 10)
+            await callback.answer(f"Ты достиг лимита примерок на сегодня ({limit}/{limit}). Попробуй завтра! 😊", show_alert=True)
             return
 
         photos_result = await api_client.get_user_photos(tg_id)
@@ -313,11 +286,10 @@ async def photo_received(message: Message, state: FSMContext):
     tg_id = message.from_user.id
     photo = message.photo[-1]  # Берем самое большое фото
     status_msg = await message.answer("Проверяем фото... 🔍")
+    UPLOAD_TMP_PATH.mkdir(parents=True, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    file_path = UPLOAD_TMP_PATH / f"photo_{tg_id}_{timestamp}.jpg"
     try:
-        user_dir = USER_PHOTOS_PATH / str(tg_id)
-        user_dir.mkdir(parents=True, exist_ok=True)
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        file_path = user_dir / f"photo_{timestamp}.jpg"
         if not await download_telegram_file(message.bot, photo.file_id, str(file_path)):
             await status_msg.edit_text("❌ Не удалось скачать фото. Попробуй еще раз")
             return
@@ -336,7 +308,6 @@ async def photo_received(message: Message, state: FSMContext):
                     [InlineKeyboardButton(text="◀️ Отмена", callback_data="tryon:cancel")]
                 ])
             )
-            if file_path.exists(): file_path.unlink()
             return
 
         upload_result = await api_client.upload_photo(tg_id, photo.file_id, str(file_path), True)
@@ -358,6 +329,10 @@ async def photo_received(message: Message, state: FSMContext):
     except Exception as e:
         logger.error(f"Failed to process photo: {e}", exc_info=True)
         await status_msg.edit_text("❌ Ошибка обработки фото. Попробуй еще раз")
+    finally:
+        # Фото хранится в API, локальная копия больше не нужна
+        if file_path.exists():
+            file_path.unlink()
 
 
 @router.message(TryOnStates.waiting_photo, ~F.photo)
@@ -440,121 +415,48 @@ async def tryon_mode_selected(callback: CallbackQuery, state: FSMContext):
 # === Генерация примерки ===
 
 async def start_generation(message: Message, state: FSMContext, product_id: str, photo_id: int, model: str, model_name: str, tryon_mode: str):
+    """
+    Поставить примерку в очередь генерации
+
+    Генерацию выполняет воркер (bot.services.tryon_worker), он же отправит
+    результат пользователю и удалит сообщение о статусе.
+    """
     tg_id = message.chat.id
-    tryon_create_result = await api_client.create_tryon(tg_id, product_id, photo_id)
-    if not tryon_create_result or not tryon_create_result.get("success"):
-        error_msg = tryon_create_result.get("message") if tryon_create_result else "Ошибка создания примерки"
-        await message.answer(f"❌ {error_msg}")
-        await state.clear()
+    fsm_data = await state.get_data()
+    await state.clear()
+
+    product_name = fsm_data.get("product_name")
+    if not product_name:
+        await message.answer("❌ Ошибка: данные о товаре (название) не найдены в сессии.")
+        return
+
+    # Проверка наличия фото товара для примерки до постановки в очередь
+    product_photo_path = photo_preloader.get_photo_path(product_id, '1')
+    if not product_photo_path or not product_photo_path.exists():
+        await message.answer("❌ К сожалению, для этого товара нельзя сделать примерку, так как отсутствует эталонное фото в локальном хранилище.")
         return
 
-    tryon_id = tryon_create_result["tryon_id"]
     time_estimate = "1-2 минуты" if model == "gemini-2.5-flash-image" else "3-4 минуты"
     status_msg = await message.answer(f"🎨 Создаем твою примерку с помощью {model_name} модели...\nЭто займет около {time_estimate} ⏳")
 
-    try:
-        fsm_data = await state.get_data()
-        product_name = fsm_data.get("product_name")
-        product_category = fsm_data.get("product_category", "одежда")
-        wb_link = fsm_data.get("wb_link", "https://www.wildberries.ru/")
-        ozon_url = fsm_data.get("ozon_url")
-        product_id_fsm = fsm_data.get("product_id")
-        source = fsm_data.get("source", "catalog")
-
-        # Get local path for product photo
-        product_photo_path = photo_preloader.get_photo_path(product_id_fsm, '1') # Assuming '1' is the photo_type for the main product photo
-        product_photo_sources = []
-        if product_photo_path and product_photo_path.exists():
-            product_photo_sources.append(str(product_photo_path))
-
-        # Проверка наличия фото товара для примерки
-        if not product_photo_sources:
-            await status_msg.edit_text("❌ К сожалению, для этого товара нельзя сделать примерку, так как отсутствует эталонное фото в локальном хранилище.")
-            await api_client.update_tryon(tryon_id, status="failed")
-            await state.clear()
-            return
-
-        category_id = fsm_data.get("category_id", "")
-        index = fsm_data.get("index", 0)
-
-        if not product_name:
-            await status_msg.edit_text("❌ Ошибка: данные о товаре (название) не найдены в сессии.")
-            await api_client.update_tryon(tryon_id, status="failed")
-            await state.clear()
-            return
-
-        photos_result = await api_client.get_user_photos(tg_id)
-        user_photo = next((p for p in photos_result.get("photos", []) if p["id"] == photo_id), None) if photos_result else None
-        if not user_photo:
-            await status_msg.edit_text("❌ Фото не найдено")
-            await api_client.update_tryon(tryon_id, status="failed")
-            await state.clear()
-            return
-
-        # Use local file path for user photo
-        user_photo_source = user_photo["file_path"]
-        api_key = os.getenv("IMAGE_GEN_API_KEY") or os.getenv("COMET_API_KEY")
-        base_url = os.getenv("IMAGE_GEN_BASE_URL", "https://api.cometapi.com")
-
-        # Determine the prompt for logging
-        if tryon_mode == "single_item":
-            prompt_str = TRYON_SINGLE_ITEM.format(category=product_category)
-        elif tryon_mode == "full_outfit":
-            prompt_str = TRYON_FULL_OUTFIT
-        else:
-            prompt_str = f"Unsupported tryon_mode: '{tryon_mode}'. This should not happen due to prior validation."
-
-        logger.info(f"""Generating try-on with:
-    Image 1 (User Photo): {user_photo_source}
-    Images 2-3 (Product Photos): {product_photo_sources}
-    Try-on Mode: {tryon_mode}
-    Prompt: {prompt_str}""")
-
-        generation_result = await generate_tryon(
-            user_photo_source=user_photo_source,
-            product_photo_sources=product_photo_sources,
-            api_key=api_key,
-            base_url=base_url,
-            model=model,
-            tryon_mode=tryon_mode,
-            item_name=product_name,
-            category=product_category
-        )
-        if not generation_result.get("success"):
-            error_msg = generation_result.get("error", {}).get("message", "Не удалось создать примерку")
-            await status_msg.edit_text(f"❌ {error_msg}")
-            await api_client.update_tryon(tryon_id, status="failed")
-            await state.clear()
-            return
+    job = {
+        "model": model,
+        "tryon_mode": tryon_mode,
+        "product_name": product_name,
+        "product_category": fsm_data.get("product_category", "одежда"),
+        "chat_id": message.chat.id,
+        "status_message_id": status_msg.message_id,
+        "source": fsm_data.get("source", "catalog"),
+        "category_id": fsm_data.get("category_id", ""),
+        "index": fsm_data.get("index", 0),
+    }
+    tryon_create_result = await api_client.create_tryon(tg_id, product_id, photo_id, job)
+    if not tryon_create_result or not tryon_create_result.get("success"):
+        error_msg = tryon_create_result.get("message") if tryon_create_result else "Ошибка создания примерки"
+        await status_msg.edit_text(f"❌ {error_msg}")
+        return
 
-        result_data_uri = generation_result["result"]["photo_url"]
-        generation_time = generation_result["result"]["processing_time"]
-        base64_data = result_data_uri.split(",")[1]
-        image_data = base64.b64decode(base64_data)
-        results_dir = TRYON_RESULTS_PATH / str(tg_id)
-        results_dir.mkdir(parents=True, exist_ok=True)
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        result_path = results_dir / f"tryon_{product_id}_{timestamp}.png"
-        with open(result_path, "wb") as f: f.write(image_data)
-
-        # Сохраняем абсолютный путь в БД
-        absolute_path = str(result_path.resolve())
-        logger.info(f"Saving try-on result to: {absolute_path}")
-        await api_client.update_tryon(tryon_id, "success", absolute_path, generation_time)
-
-        result_photo = FSInputFile(result_path)
-        await message.answer_photo(
-            photo=result_photo,
-            caption=f"Вот как на тебе будет смотреться {product_name}! 💫",
-            reply_markup=get_tryon_result_keyboard(tryon_id, product_id, wb_link, ozon_url, source, category_id, index)
-        )
-        await status_msg.delete()
-    except Exception as e:
-        logger.error(f"Failed to generate try-on: {e}", exc_info=True)
-        await status_msg.edit_text("❌ Ошибка генерации примерки")
-        await api_client.update_tryon(tryon_id, status="failed")
-    finally:
-        await state.clear()
+    logger.info(f"Try-on {tryon_create_result['tryon_id']} queued for user {tg_id} (model: {model}, mode: {tryon_mode})")
 
 
 # === Сохранение результата и История ===
@@ -566,33 +468,15 @@ async def save_tryon_result(callback: CallbackQuery, state: FSMContext):
     tg_id = callback.from_user.id
 
     try:
-        # Получаем всю историю примерок пользователя
-        history_result = await api_client.get_tryon_history(tg_id)
-        history = history_result.get("history", []) if history_result else []
-
-        # Ищем конкретную примерку по tryon_id
-        current_tryon = next((t for t in history if t["id"] == tryon_id), None)
-
-        if current_tryon:
-            result_path = current_tryon.get("result_file_path")
-
-            logger.info(f"Trying to send result file for tryon_id {tryon_id}: {result_path}")
-
-            # Если путь относительный, преобразуем в абсолютный
-            if result_path and not os.path.isabs(result_path):
-                result_path = str((Path.cwd() / result_path).resolve())
-                logger.info(f"Converted to absolute path: {result_path}")
-
-            if result_path and os.path.exists(result_path):
-                result_file = FSInputFile(result_path)
-                await callback.message.answer_document(document=result_file, caption="Результат примерки сохранен! 📥")
-                await callback.answer("✅ Отправлено!")
-            else:
-                logger.error(f"Result file not found for tryon_id {tryon_id}. Path: {result_path}")
-                await callback.answer("❌ Файл результата не найден.", show_alert=True)
+        image_data = await api_client.download_tryon_result(tryon_id, variant="original")
+
+        if image_data:
+            result_file = BufferedInputFile(image_data, filename=tryon_result_filename(tryon_id, image_data))
+            await callback.message.answer_document(document=result_file, caption="Результат примерки сохранен! 📥")
+            await callback.answer("✅ Отправлено!")
         else:
-            logger.warning(f"Try-on record with ID {tryon_id} not found in history for user {tg_id}.")
-            await callback.answer("❌ Не удалось найти результат примерки.", show_alert=True)
+            logger.error(f"Result file not found for tryon_id {tryon_id} (user {tg_id})")
+            await callback.answer("❌ Файл результата не найден.", show_alert=True)
     except Exception as e:
         logger.error(f"Failed to save try-on result for user {tg_id}, tryon_id {tryon_id}: {e}", exc_info=True)
         await callback.answer("❌ Произошла ошибка при сохранении результата.", show_alert=True)
@@ -659,7 +543,7 @@ async def view_photo(callback: CallbackQuery):
 async def delete_photo_handler(callback: CallbackQuery):
     photo_id = int(callback.data.split(":")[2])
     try:
-        success = await api_client.delete_photo(photo_id)
+        success = await api_client.delete_photo(photo_id, callback.from_user.id)
         if success:
             await callback.message.delete()
             await callback.answer("✅ Фото удалено")
@@ -670,13 +554,22 @@ async def delete_photo_handler(callback: CallbackQuery):
         await callback.answer("❌ Ошибка", show_alert=True)
 
 
+async def fetch_history_item(tg_id: int, before: Optional[str]) -> Tuple[Optional[dict], Optional[str]]:
+    """Одна запись истории (страница из одного элемента) и курсор следующей записи"""
+    history_result = await api_client.get_tryon_history(tg_id, limit=1, before=before, expand="product")
+    if not history_result or not history_result.get("history"):
+        return None, None
+    return history_result["history"][0], history_result.get("next_cursor")
+
+
 @router.callback_query(F.data == "tryon_history")
 async def show_tryon_history(callback: CallbackQuery, state: FSMContext):
     tg_id = callback.from_user.id
     try:
-        history_result = await api_client.get_tryon_history(tg_id)
-        history = history_result.get("history", []) if history_result else []
-        if not history:
+        count_result = await api_client.get_tryon_history_count(tg_id)
+        total = count_result.get("count", 0) if count_result else 0
+        tryon, next_cursor = await fetch_history_item(tg_id, None) if total else (None, None)
+        if not tryon:
             await callback.message.edit_text(
                 "📜 История примерок\n\nУ тебя пока нет примерок. Попробуй примерить что-нибудь из каталога! 👗",
                 reply_markup=InlineKeyboardMarkup(inline_keyboard=[
@@ -685,32 +578,35 @@ async def show_tryon_history(callback: CallbackQuery, state: FSMContext):
                 ])
             )
         else:
-            await state.update_data(history=history, history_index=0)
-            await show_tryon_card(callback.message, history, 0, edit=True)
+            # В состоянии только курсоры просмотренных записей: history_cursors[i] - before для записи i
+            await state.update_data(
+                history_cursors=[None, next_cursor] if next_cursor else [None],
+                history_index=0,
+                history_total=total
+            )
+            await show_tryon_card(callback.message, tryon, 0, total, edit=True)
         await callback.answer()
     except Exception as e:
         logger.error(f"Failed to show history: {e}", exc_info=True)
         await callback.answer("❌ Ошибка загрузки истории", show_alert=True)
 
 
-async def show_tryon_card(message: Message, history: list, index: int, edit: bool = False):
-    if not (0 <= index < len(history)): return
-    tryon = history[index]
-    result_path = tryon.get("result_file_path")
+async def show_tryon_card(message: Message, tryon: dict, index: int, total: int, edit: bool = False):
+    # Для карточки достаточно уменьшенной копии, если retention ее уже сделал
+    image_url = tryon.get("preview_url") or tryon.get("result_url")
+    image_data = await api_client.download_file(image_url) if image_url else None
 
-    if not result_path or not os.path.exists(result_path):
-        text = f"❌ Файл примерки не найден\n\nПримерка {index+1} из {len(history)}"
-        keyboard = get_history_navigation_keyboard(index, len(history), tryon)
+    if not image_data:
+        text = f"❌ Файл примерки не найден\n\nПримерка {index+1} из {total}"
+        keyboard = get_history_navigation_keyboard(index, total, tryon)
         if edit: await message.edit_text(text, reply_markup=keyboard)
         else: await message.answer(text, reply_markup=keyboard)
         return
 
-    product_id = tryon["product_id"]
-    product_data = await api_client.get_product_by_id(product_id)
-    product_name = product_data["name"] if product_data else product_id
-    result_photo = FSInputFile(result_path)
-    caption = f"👗 {product_name}\n\n📅 {datetime.fromisoformat(tryon['created_at']).strftime('%d.%m.%Y')}\n\nПримерка {index+1} из {len(history)}"
-    keyboard = get_history_navigation_keyboard(index, len(history), tryon)
+    product_name = tryon.get("product_name") or tryon["product_id"]
+    result_photo = BufferedInputFile(image_data, filename=tryon_result_filename(tryon["id"], image_data))
+    caption = f"👗 {product_name}\n\n📅 {datetime.fromisoformat(tryon['created_at']).strftime('%d.%m.%Y')}\n\nПримерка {index+1} из {total}"
+    keyboard = get_history_navigation_keyboard(index, total, tryon)
     if edit: await message.delete()
     await message.answer_photo(photo=result_photo, caption=caption, reply_markup=keyboard)
 
@@ -750,39 +646,56 @@ def get_history_navigation_keyboard(index: int, total: int, tryon: dict):
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 
+async def open_history_item(message: Message, state: FSMContext, tg_id: int, index: int, total: int) -> bool:
+    """Показать запись истории с номером index по сохраненным курсорам"""
+    data = await state.get_data()
+    cursors = data.get("history_cursors", [None])
+    if not (0 <= index < len(cursors)):
+        return False
+
+    tryon, next_cursor = await fetch_history_item(tg_id, cursors[index])
+    if not tryon:
+        return False
+
+    cursors = cursors[:index + 1] + ([next_cursor] if next_cursor else [])
+    await state.update_data(history_cursors=cursors, history_index=index, history_total=total)
+    await show_tryon_card(message, tryon, index, total, edit=True)
+    return True
+
+
 @router.callback_query(F.data.startswith("tryon_hist:"))
 async def handle_history_navigation(callback: CallbackQuery, state: FSMContext):
     action, *params = callback.data.split(":")[1:]
+    tg_id = callback.from_user.id
     data = await state.get_data()
-    history = data.get("history", [])
     current_index = data.get("history_index", 0)
+    total = data.get("history_total", 0)
 
     if action in ["prev", "next"]:
         new_index = current_index + (-1 if action == "prev" else 1)
-        await state.update_data(history_index=new_index)
-        await show_tryon_card(callback.message, history, new_index, edit=True)
+        if not await open_history_item(callback.message, state, tg_id, new_index, total):
+            await callback.answer("❌ Примерка не найдена", show_alert=True)
     elif action == "download":
         tryon_id = int(params[0])
-        tryon = next((t for t in history if t["id"] == tryon_id), None)
-        if tryon and os.path.exists(tryon["result_file_path"]):
-            await callback.message.answer_document(document=FSInputFile(tryon["result_file_path"]), caption="📥 Результат примерки")
+        image_data = await api_client.download_tryon_result(tryon_id, variant="original")
+        if image_data:
+            result_file = BufferedInputFile(image_data, filename=tryon_result_filename(tryon_id, image_data))
+            await callback.message.answer_document(document=result_file, caption="📥 Результат примерки")
             await callback.answer("✅ Отправлено!")
         else:
             await callback.answer("❌ Файл не найден", show_alert=True)
     elif action == "delete":
         tryon_id = int(params[0])
-        if await api_client.delete_tryon(tryon_id):
+        if await api_client.delete_tryon(tryon_id, tg_id):
             await callback.answer("✅ Примерка удалена")
-            history = [t for t in history if t["id"] != tryon_id]
-            if not history:
+            total = max(total - 1, 0)
+            # На место удаленной встает следующая запись, иначе показываем предыдущую
+            if not await open_history_item(callback.message, state, tg_id, current_index, total) and \
+                    not await open_history_item(callback.message, state, tg_id, current_index - 1, total):
                 await callback.message.delete()
                 await callback.message.answer("История примерок пуста", reply_markup=InlineKeyboardMarkup(inline_keyboard=[
                     [InlineKeyboardButton(text="◀️ В главное меню", callback_data="main_menu")]
                 ]))
-            else:
-                new_index = min(current_index, len(history) - 1)
-                await state.update_data(history=history, history_index=new_index)
-                await show_tryon_card(callback.message, history, new_index, edit=True)
         else:
             await callback.answer("❌ Ошибка удаления", show_alert=True)
 
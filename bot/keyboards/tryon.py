@@ -0,0 +1,42 @@
+"""
+Клавиатуры для примерки
+"""
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+
+
+def get_tryon_result_keyboard(tryon_id: int, product_id: str, wb_link: str, ozon_url: str = None,
+                              source: str = 'catalog', category_id: str = '', index: int = 0):
+    """Клавиатура после успешной примерки"""
+    keyboard = []
+
+    # Кнопки магазинов в одну строку если есть обе ссылки
+    shop_buttons = []
+    if wb_link:
+        shop_buttons.append(InlineKeyboardButton(text="Wildberries", url=wb_link))
+    if ozon_url:
+        shop_buttons.append(InlineKeyboardButton(text="Ozon", url=ozon_url))
+
+    if shop_buttons:
+        if len(shop_buttons) == 2:
+            keyboard.append(shop_buttons)
+        else:
+            keyboard.append([shop_buttons[0]])
+
+    # Формируем коллбэк для возврата
+    if source == 'catalog':
+        back_callback = f"back:product:{product_id}:{category_id}:{index}"
+    elif source == 'favorites':
+        back_callback = f"back_fav:{product_id}:{index}"
+    else:
+        # Фоллбэк на старое поведение, если источник неизвестен
+        back_callback = f"product:{product_id}"
+        
+    retry_callback = f"tryon:retry:{source}:{product_id}:{category_id}:{index}"
+
+    keyboard.extend([
+        [InlineKeyboardButton(text="💾 Сохранить результат", callback_data=f"tryon:save_result:{tryon_id}")],
+        [InlineKeyboardButton(text="🔄 Другое фото", callback_data=retry_callback)],
+        [InlineKeyboardButton(text="◀️ К товару", callback_data=back_callback)]
+    ])
+
+    return InlineKeyboardMarkup(inline_keyboard=keyboard)
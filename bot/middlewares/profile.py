@@ -0,0 +1,30 @@
+"""
+Middleware кеша профиля пользователя
+"""
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from bot.utils.profile_cache import profile_cache
+
+
+class ProfileMiddleware(BaseMiddleware):
+    """
+    Кеш профиля в памяти на время обработки апдейта
+
+    Поля профиля загружаются при первом чтении (из Redis или API) и дальше
+    в этом апдейте берутся из памяти.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        token = profile_cache.begin_update()
+        try:
+            return await handler(event, data)
+        finally:
+            profile_cache.end_update(token)
@@ -0,0 +1,275 @@
+"""
+Воркер генерации примерок
+
+Обработчик бота только ставит примерку в очередь API (POST /api/tryon/create)
+и сразу отвечает пользователю. Воркер забирает задачи из очереди под аренду,
+генерирует примерку, продлевая аренду heartbeat-запросами, загружает
+результат в API и отправляет его пользователю.
+
+Если воркер упадет или перезапустится, API вернет задачу в очередь по
+истечении аренды, и ее возьмет другой воркер. Пропускная способность
+масштабируется числом слотов (TRYON_WORKER_CONCURRENCY) и процессов:
+    python -m bot.services.tryon_worker
+"""
+import asyncio
+import base64
+import logging
+import os
+import socket
+import time
+from typing import Dict, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError
+from aiogram.types import BufferedInputFile
+
+from bot.keyboards.tryon import get_tryon_result_keyboard
+from bot.services.photo_preloader import photo_preloader
+from bot.utils.api_client import api_client, CONFLICT
+from bot.utils.profile_cache import profile_cache
+from bot.utils.redis_client import connect_redis
+from gpt_integration.photo_processing.generator import generate_tryon
+
+logger = logging.getLogger(__name__)
+
+# Сколько задач процесс выполняет одновременно
+TRYON_WORKER_CONCURRENCY = int(os.getenv("TRYON_WORKER_CONCURRENCY", "2"))
+
+# Пауза между запросами к пустой очереди
+TRYON_WORKER_POLL_SECONDS = float(os.getenv("TRYON_WORKER_POLL_SECONDS", "2"))
+
+# Интервал продления аренды (должен быть заметно меньше TRYON_JOB_LEASE_SECONDS)
+TRYON_WORKER_HEARTBEAT_SECONDS = int(os.getenv("TRYON_WORKER_HEARTBEAT_SECONDS", "30"))
+
+# Длительность аренды в API: без успешного heartbeat дольше этого задача брошена
+TRYON_JOB_LEASE_SECONDS = int(os.getenv("TRYON_JOB_LEASE_SECONDS", "90"))
+
+# Ошибки генерации, после которых задачу стоит повторить
+RETRYABLE_ERROR_TYPES = {"timeout", "api_error"}
+
+
+class TryOnJobError(Exception):
+    """Ошибка выполнения задачи генерации"""
+
+    def __init__(self, message: str, retry: bool = False):
+        super().__init__(message)
+        self.message = message
+        self.retry = retry
+
+
+class LeaseLostError(Exception):
+    """Аренда задачи потеряна - задачу, возможно, уже выполняет другой воркер"""
+
+
+class TryOnWorker:
+    """Пул слотов, выполняющих задачи генерации из очереди API"""
+
+    def __init__(self, bot: Bot, concurrency: int = TRYON_WORKER_CONCURRENCY, worker_id: Optional[str] = None):
+        self.bot = bot
+        self.concurrency = concurrency
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+
+    async def _heartbeat(self, tryon_id: int, slot_id: str):
+        """
+        Продлевать аренду, пока задачу не отменят; LeaseLostError - аренда потеряна
+
+        Отказ API (409) - аренда уже у другого воркера, задача бросается сразу.
+        Сетевые ошибки терпятся, пока аренда еще может быть действительна.
+        """
+        last_ok = time.monotonic()
+        while True:
+            await asyncio.sleep(TRYON_WORKER_HEARTBEAT_SECONDS)
+            lease = await api_client.heartbeat_tryon_job(tryon_id, slot_id)
+            if lease is CONFLICT:
+                raise LeaseLostError(f"Lease for try-on job {tryon_id} rejected by API")
+            if lease:
+                last_ok = time.monotonic()
+            elif time.monotonic() - last_ok >= TRYON_JOB_LEASE_SECONDS:
+                raise LeaseLostError(f"Lease for try-on job {tryon_id} lost")
+
+    async def _generate(self, job: Dict) -> Tuple[bytes, int]:
+        """Сгенерировать примерку, возвращает (PNG, время генерации в секундах)"""
+        payload = job["job_payload"]
+
+        product_photo_path = photo_preloader.get_photo_path(job["product_id"], '1')
+        if not product_photo_path or not product_photo_path.exists():
+            raise TryOnJobError(
+                "К сожалению, для этого товара нельзя сделать примерку, "
+                "так как отсутствует эталонное фото в локальном хранилище."
+            )
+
+        # Фото пользователя скачивается из хранилища API по URL
+        user_photo_source = api_client.file_url(job["user_photo_url"])
+        logger.info(
+            f"Generating try-on {job['id']} (attempt {job['attempts']}): model={payload['model']}, "
+            f"mode={payload['tryon_mode']}, product={job['product_id']}"
+        )
+
+        generation_result = await generate_tryon(
+            user_photo_source=user_photo_source,
+            product_photo_sources=[str(product_photo_path)],
+            api_key=os.getenv("IMAGE_GEN_API_KEY") or os.getenv("COMET_API_KEY"),
+            base_url=os.getenv("IMAGE_GEN_BASE_URL", "https://api.cometapi.com"),
+            model=payload["model"],
+            tryon_mode=payload["tryon_mode"],
+            item_name=payload["product_name"],
+            category=payload["product_category"]
+        )
+        if not generation_result.get("success"):
+            error = generation_result.get("error", {})
+            raise TryOnJobError(
+                error.get("message", "Не удалось создать примерку"),
+                retry=error.get("type") in RETRYABLE_ERROR_TYPES
+            )
+
+        result_data_uri = generation_result["result"]["photo_url"]
+        image_data = base64.b64decode(result_data_uri.split(",")[1])
+        return image_data, generation_result["result"]["processing_time"]
+
+    async def _delete_status_message(self, payload: Dict):
+        if not payload.get("status_message_id"):
+            return
+        try:
+            await self.bot.delete_message(payload["chat_id"], payload["status_message_id"])
+        except TelegramAPIError as e:
+            logger.warning(f"Failed to delete try-on status message: {e}")
+
+    async def _notify(self, payload: Dict, text: str):
+        """Сообщить пользователю о состоянии примерки (в сообщении статуса, если оно есть)"""
+        try:
+            if payload.get("status_message_id"):
+                await self.bot.edit_message_text(
+                    text, chat_id=payload["chat_id"], message_id=payload["status_message_id"]
+                )
+            else:
+                await self.bot.send_message(payload["chat_id"], text)
+        except TelegramAPIError as e:
+            logger.warning(f"Failed to notify user about try-on: {e}")
+
+    async def _deliver(self, job: Dict, image_data: bytes, generation_time: int, slot_id: str):
+        """Сохранить результат в API и отправить пользователю"""
+        payload = job["job_payload"]
+        tryon_id = job["id"]
+        filename = f"tryon_{job['product_id']}_{tryon_id}.png"
+
+        # Результат принимается, только пока слот держит аренду задачи
+        upload_result = await api_client.upload_tryon_result(
+            tryon_id, image_data, filename, generation_time, worker_id=slot_id, user_tg_id=job["user_id"]
+        )
+        if not upload_result or not upload_result.get("success"):
+            raise TryOnJobError("Не удалось сохранить результат примерки", retry=True)
+
+        await self.bot.send_photo(
+            payload["chat_id"],
+            photo=BufferedInputFile(image_data, filename=filename),
+            caption=f"Вот как на тебе будет смотреться {payload['product_name']}! 💫",
+            reply_markup=get_tryon_result_keyboard(
+                tryon_id, job["product_id"], job.get("wb_link") or "https://www.wildberries.ru/",
+                job.get("ozon_url"), payload["source"], payload["category_id"], payload["index"]
+            )
+        )
+        await self._delete_status_message(payload)
+
+    async def process(self, job: Dict, slot_id: str):
+        """Выполнить задачу под арендой"""
+        tryon_id = job["id"]
+        payload = job["job_payload"]
+
+        generation = asyncio.create_task(self._generate(job))
+        heartbeat = asyncio.create_task(self._heartbeat(tryon_id, slot_id))
+        try:
+            await asyncio.wait({generation, heartbeat}, return_when=asyncio.FIRST_COMPLETED)
+            if not generation.done():
+                # Heartbeat завершился только с LeaseLostError: задачу выполнит другой воркер
+                generation.cancel()
+                heartbeat.result()
+
+            try:
+                image_data, generation_time = generation.result()
+                await self._deliver(job, image_data, generation_time, slot_id)
+                logger.info(f"Try-on job {tryon_id} done by {slot_id} in {generation_time}s")
+                return
+            except TryOnJobError as e:
+                error = e
+            except Exception as e:
+                logger.error(f"Try-on job {tryon_id} failed: {e}", exc_info=True)
+                error = TryOnJobError("Ошибка генерации примерки", retry=True)
+        except LeaseLostError as e:
+            logger.warning(f"{e}, dropping it on {slot_id}")
+            return
+        finally:
+            # При остановке воркера задача вернется в очередь по истечении аренды
+            generation.cancel()
+            heartbeat.cancel()
+
+        result = await api_client.fail_tryon_job(tryon_id, slot_id, error.message, error.retry)
+        status = result.get("status") if result else None
+        if status == "queued":
+            await self._notify(payload, "⏳ Не получилось с первого раза, пробуем еще раз...")
+        elif status == "failed":
+            await self._notify(payload, f"❌ {error.message}")
+
+    async def _run_slot(self, slot: int):
+        slot_id = f"{self.worker_id}:{slot}"
+        while True:
+            try:
+                claimed = await api_client.claim_tryon_job(slot_id)
+                job = claimed.get("job") if claimed else None
+                if job is None:
+                    await asyncio.sleep(TRYON_WORKER_POLL_SECONDS)
+                    continue
+                await self.process(job, slot_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error in try-on worker slot {slot_id}: {e}", exc_info=True)
+                await asyncio.sleep(TRYON_WORKER_POLL_SECONDS)
+
+    async def run_forever(self):
+        """Фоновая задача: TRYON_WORKER_CONCURRENCY слотов, забирающих задачи из очереди"""
+        logger.info(f"Try-on worker {self.worker_id} started ({self.concurrency} slots)")
+        slots = [asyncio.create_task(self._run_slot(n)) for n in range(self.concurrency)]
+        try:
+            await asyncio.gather(*slots)
+        except asyncio.CancelledError:
+            logger.info(f"Try-on worker {self.worker_id} stopped")
+            raise
+        finally:
+            for slot in slots:
+                slot.cancel()
+
+
+async def main():
+    """Отдельный процесс воркера (без обработки обновлений Telegram)"""
+    bot_token = os.getenv("TELEGRAM_BOT_TOKEN")
+    if not bot_token:
+        logger.error("TELEGRAM_BOT_TOKEN not found in environment variables!")
+        return
+
+    # Тот же Redis, что у бота: сброс кеша профиля (число примерок) виден боту
+    profile_cache.redis = await connect_redis()
+    if profile_cache.redis is None:
+        logger.warning("Profile cache invalidations stay local to this worker until it is restarted with Redis")
+
+    bot = Bot(token=bot_token)
+    try:
+        await TryOnWorker(bot).run_forever()
+    finally:
+        await api_client.close()
+        await bot.session.close()
+        if profile_cache.redis is not None:
+            await profile_cache.redis.aclose()
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        logger.info("Try-on worker stopped by user")
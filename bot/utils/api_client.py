@@ -5,35 +5,77 @@ import aiohttp
 import logging
 import os
 import asyncio
+import time
 from functools import wraps
-from typing import Optional, Dict, List, Any, Callable, Coroutine
+from typing import Optional, Dict, List, Any, Callable, Coroutine, Set, NamedTuple
+
+from cachetools import TTLCache
+
+from bot.utils.profile_cache import profile_cache
 
 logger = logging.getLogger(__name__)
 
 API_URL = os.getenv("API_URL", "http://localhost:8000")
 
+# Допустимое отставание локальной копии каталога (сек): после него чтение
+# каталога делает условные запросы (If-None-Match), обычно с ответом 304
+CATALOG_SYNC_SECONDS = int(os.getenv("CATALOG_SYNC_SECONDS", "60"))
+# Пауза перед повторной синхронизацией каталога, если API недоступен
+CATALOG_RETRY_SECONDS = 5
+
+# Возвращается декоратором на ответ 304 Not Modified
+NOT_MODIFIED = object()
+
+# Возвращается декоратором на ответ 409 Conflict (если conflict=True)
+CONFLICT = object()
+
+
+class Versioned(NamedTuple):
+    """JSON ответа вместе с его ETag"""
+    etag: Optional[str]
+    data: Any
+
 # --- Decorator for Error Handling ---
 
-def _handle_api_exceptions(default_return: Any = None):
+def _handle_api_exceptions(default_return: Any = None, coalesce: bool = False, conflict: bool = False):
     """
     Декоратор для обработки исключений при запросах к API.
     Ловит сетевые ошибки и плохие статусы HTTP.
+
+    conflict=True - ответ 409 возвращается как CONFLICT, а не default_return:
+    отказ API отличим от сетевой ошибки.
+
+    coalesce=True - только для идемпотентных GET: одинаковые одновременные
+    вызовы (тот же метод и аргументы) ждут один запрос к API и получают
+    один и тот же объект результата.
     """
     def decorator(func: Callable[..., Coroutine[Any, Any, Any]]):
-        @wraps(func)
-        async def wrapper(self: "APIClient", *args, **kwargs) -> Any:
+        async def request(self: "APIClient", *args, **kwargs) -> Any:
             method_name = func.__name__
             try:
                 session = await self._get_session()
                 response: Optional[aiohttp.ClientResponse] = await func(self, session, *args, **kwargs)
 
+                # Условный запрос: данные не изменились
+                if response and response.status == 304:
+                    return NOT_MODIFIED
+
+                if conflict and response and response.status == 409:
+                    return CONFLICT
+
                 # Успешные статусы (2xx)
                 if response and 200 <= response.status < 300:
                     # Если функция должна вернуть bool, успешный запрос означает True
                     if func.__annotations__.get('return') == bool:
                         return True
-                    
+
+                    # Файлы возвращаются как байты
+                    if func.__annotations__.get('return') == Optional[bytes]:
+                        return await response.read()
+
                     if response.content_type == 'application/json':
+                        if func.__annotations__.get('return') == Optional[Versioned]:
+                            return Versioned(response.headers.get("ETag"), await response.json())
                         return await response.json()
                     
                     # Для запросов без тела (например, 204 No Content)
@@ -61,16 +103,76 @@ def _handle_api_exceptions(default_return: Any = None):
             except Exception as e:
                 logger.error(f"Unexpected Error in {method_name}: {type(e).__name__} - {e}", exc_info=True)
                 return default_return
+
+        @wraps(func)
+        async def wrapper(self: "APIClient", *args, **kwargs) -> Any:
+            if not coalesce:
+                return await request(self, *args, **kwargs)
+            key = (func.__name__, args, frozenset(kwargs.items()))
+            try:
+                hash(key)
+            except TypeError:
+                # Нехешируемые аргументы - запрос без объединения
+                return await request(self, *args, **kwargs)
+            return await self._coalesce(key, lambda: request(self, *args, **kwargs))
         return wrapper
     return decorator
 
 
+class CatalogReplica:
+    """
+    Локальная копия каталога: категории, активные товары по product_id и по категориям
+
+    Каталог меняется вместе с Google Sheets несколько раз в день, поэтому
+    чтения каталога в обработчиках - поиск в памяти. Копия считается
+    актуальной CATALOG_SYNC_SECONDS, затем обновляется условными запросами.
+    """
+
+    def __init__(self):
+        self.categories: List[Dict] = []
+        self.products: Dict[str, Dict] = {}
+        self.products_by_category: Dict[str, List[Dict]] = {}
+        self.etags: Dict[str, Optional[str]] = {}
+        self.next_sync_at = 0.0
+        # Одновременные чтения устаревшей копии синхронизируют ее один раз
+        self.lock = asyncio.Lock()
+
+    def is_fresh(self) -> bool:
+        return time.monotonic() < self.next_sync_at
+
+    def invalidate(self):
+        """Синхронизировать при следующем чтении (ETag остаются: без изменений будет 304)"""
+        self.next_sync_at = 0.0
+
+    def update(self, categories: Any, products: Any):
+        """Применить ответы синхронизации (Versioned или NOT_MODIFIED)"""
+        if categories is not NOT_MODIFIED:
+            self.categories = categories.data
+            self.etags["categories"] = categories.etag
+
+        if products is not NOT_MODIFIED:
+            products_by_category: Dict[str, List[Dict]] = {}
+            for product in products.data:
+                products_by_category.setdefault(product['category'], []).append(product)
+            self.products = {product['product_id']: product for product in products.data}
+            self.products_by_category = products_by_category
+            self.etags["products"] = products.etag
+
+        self.next_sync_at = time.monotonic() + CATALOG_SYNC_SECONDS
+
+
 class APIClient:
     """Клиент для работы с FastAPI backend"""
 
     def __init__(self, base_url: str = API_URL):
         self.base_url = base_url.rstrip('/')
         self.session: Optional[aiohttp.ClientSession] = None
+        # tg_id -> (ETag, набор product_id избранного)
+        self._favorite_ids: TTLCache = TTLCache(maxsize=10000, ttl=3600)
+        self._catalog = CatalogReplica()
+        # Выполняющиеся GET-запросы: (метод, аргументы) -> задача
+        self._in_flight: Dict[Any, asyncio.Task] = {}
+        self.coalesce_stats = {"requests": 0, "coalesced": 0}
 
     async def _get_session(self) -> aiohttp.ClientSession:
         """Получить или создать сессию"""
@@ -80,11 +182,59 @@ class APIClient:
             self.session = aiohttp.ClientSession(timeout=timeout)
         return self.session
 
+    async def _coalesce(self, key: Any, request: Callable[[], Coroutine[Any, Any, Any]]) -> Any:
+        """Одинаковые одновременные GET-запросы - один запрос к API с общим результатом"""
+        self.coalesce_stats["requests"] += 1
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(request())
+            self._in_flight[key] = task
+
+            def forget(done: asyncio.Task):
+                # Ключ мог быть сброшен и занят новым запросом
+                if self._in_flight.get(key) is done:
+                    del self._in_flight[key]
+            task.add_done_callback(forget)
+        else:
+            self.coalesce_stats["coalesced"] += 1
+        # Отмена одного из ожидающих не отменяет общий запрос
+        return await asyncio.shield(task)
+
+    async def _invalidate_profile(self, user_tg_id: int, *fields: str):
+        """
+        Сбросить поля профиля после изменения
+
+        Выполняющиеся GET-запросы пользователя больше не объединяются с
+        новыми вызовами: они начаты до изменения.
+        """
+        stale = [
+            key for key in self._in_flight
+            if user_tg_id in key[1] or any(value == user_tg_id for _, value in key[2])
+        ]
+        for key in stale:
+            del self._in_flight[key]
+        await profile_cache.invalidate(user_tg_id, *fields)
+
+    def get_coalesce_stats(self) -> Dict[str, int]:
+        """Счетчики объединения GET-запросов"""
+        return {**self.coalesce_stats, "in_flight": len(self._in_flight)}
+
     async def close(self):
         """Закрыть сессию"""
         if self.session and not self.session.closed:
             await self.session.close()
 
+    async def _read_profile(
+        self, user_tg_id: int, field: str, fetch: Callable[[], Coroutine[Any, Any, Any]]
+    ) -> Optional[Dict]:
+        """Поле профиля из кеша профиля, при промахе - из API (успешный ответ кешируется)"""
+        value = await profile_cache.get(user_tg_id, field)
+        if value is None:
+            value = await fetch()
+            if isinstance(value, dict):
+                await profile_cache.set(user_tg_id, field, value)
+        return value
+
     # --- Users endpoints ---
 
     @_handle_api_exceptions(default_return=None)
@@ -94,60 +244,243 @@ class APIClient:
             json={"tg_id": tg_id, "username": username, "first_name": first_name}
         )
 
+    async def bootstrap_session(self, tg_id: int, username: Optional[str], first_name: Optional[str]) -> Optional[Dict]:
+        """Регистрация и данные главного меню (russian_size, число примерок) одним запросом"""
+        result = await self._bootstrap_session(tg_id, username, first_name)
+        if isinstance(result, dict):
+            await profile_cache.set(tg_id, "tryon_count", {"count": result["tryon_count"]})
+        return result
+
     @_handle_api_exceptions(default_return=None)
+    async def _bootstrap_session(self, session: aiohttp.ClientSession, tg_id: int, username: Optional[str], first_name: Optional[str]) -> Optional[Dict]:
+        return await session.post(
+            f"{self.base_url}/api/session/bootstrap",
+            json={"tg_id": tg_id, "username": username, "first_name": first_name}
+        )
+
+    @_handle_api_exceptions(default_return=None, coalesce=True)
     async def get_user_by_tg_id(self, session: aiohttp.ClientSession, tg_id: int) -> Optional[Dict]:
         return await session.get(f"{self.base_url}/api/users/by-tg-id/{tg_id}")
 
     # --- Measurements endpoints ---
 
+    async def save_measurements(self, user_tg_id: int, **measurements) -> Optional[Dict]:
+        """Сохранить параметры (ответ API - все параметры - сразу пишется в кеш профиля)"""
+        result = await self._save_measurements(user_tg_id, **measurements)
+        await self._invalidate_profile(user_tg_id, "measurements")
+        if isinstance(result, dict):
+            await profile_cache.set(user_tg_id, "measurements", result)
+        return result
+
     @_handle_api_exceptions(default_return=None)
-    async def save_measurements(self, session: aiohttp.ClientSession, user_tg_id: int, **measurements) -> Optional[Dict]:
+    async def _save_measurements(self, session: aiohttp.ClientSession, user_tg_id: int, **measurements) -> Optional[Dict]:
         return await session.post(
             f"{self.base_url}/api/measurements/{user_tg_id}",
             json=measurements
         )
 
-    @_handle_api_exceptions(default_return=None)
-    async def get_measurements(self, session: aiohttp.ClientSession, user_tg_id: int) -> Optional[Dict]:
+    async def get_measurements(self, user_tg_id: int) -> Optional[Dict]:
+        return await self._read_profile(user_tg_id, "measurements", lambda: self._get_measurements(user_tg_id))
+
+    @_handle_api_exceptions(default_return=None, coalesce=True)
+    async def _get_measurements(self, session: aiohttp.ClientSession, user_tg_id: int) -> Optional[Dict]:
         return await session.get(f"{self.base_url}/api/measurements/{user_tg_id}")
 
     # --- Favorites endpoints ---
 
+    async def add_to_favorites(self, user_id: int, product_id: str) -> Optional[Dict]:
+        self._favorite_ids.pop(user_id, None)
+        result = await self._add_to_favorites(user_id, product_id)
+        await self._invalidate_profile(user_id, "favorite_ids")
+        return result
+
     @_handle_api_exceptions(default_return=None)
-    async def add_to_favorites(self, session: aiohttp.ClientSession, user_id: int, product_id: str) -> Optional[Dict]:
+    async def _add_to_favorites(self, session: aiohttp.ClientSession, user_id: int, product_id: str) -> Optional[Dict]:
         return await session.post(
             f"{self.base_url}/api/favorites/",
             json={"user_id": user_id, "product_id": product_id}
         )
 
+    async def remove_from_favorites(self, user_tg_id: int, product_id: str) -> bool:
+        self._favorite_ids.pop(user_tg_id, None)
+        result = await self._remove_from_favorites(user_tg_id, product_id)
+        await self._invalidate_profile(user_tg_id, "favorite_ids")
+        return result
+
     @_handle_api_exceptions(default_return=False)
-    async def remove_from_favorites(self, session: aiohttp.ClientSession, user_tg_id: int, product_id: str) -> bool:
+    async def _remove_from_favorites(self, session: aiohttp.ClientSession, user_tg_id: int, product_id: str) -> bool:
         return await session.delete(f"{self.base_url}/api/favorites/{user_tg_id}/{product_id}")
 
-    @_handle_api_exceptions(default_return=[])
+    @_handle_api_exceptions(default_return=[], coalesce=True)
     async def get_favorites(self, session: aiohttp.ClientSession, user_tg_id: int) -> List[Dict]:
         return await session.get(f"{self.base_url}/api/favorites/{user_tg_id}")
 
-    @_handle_api_exceptions(default_return=False)
-    async def check_favorite(self, session: aiohttp.ClientSession, user_tg_id: int, product_id: str) -> bool:
-        response = await session.get(f"{self.base_url}/api/favorites/{user_tg_id}/check/{product_id}")
-        data = await response.json()
-        return data.get("is_favorite", False)
+    @_handle_api_exceptions(default_return=None, coalesce=True)
+    async def _get_favorites_page(self, session: aiohttp.ClientSession, user_tg_id: int, cursor: Optional[str], limit: int) -> Optional[Dict]:
+        params = {"expand": "product", "limit": limit}
+        if cursor:
+            params["cursor"] = cursor
+        return await session.get(f"{self.base_url}/api/favorites/{user_tg_id}", params=params)
+
+    async def get_favorite_products(self, user_tg_id: int, page_size: int = 100) -> List[Dict]:
+        """
+        Товары из избранного пользователя (новые первыми)
+
+        Данные товаров приходят вместе с избранным; товары, которых больше нет
+        в каталоге, API не возвращает. Обычно это один запрос.
+        """
+        products = []
+        cursor = None
+        while True:
+            page = await self._get_favorites_page(user_tg_id, cursor, page_size)
+            if not isinstance(page, dict):
+                break
+            products.extend(item["product"] for item in page.get("items", []) if item.get("product"))
+            cursor = page.get("next_cursor")
+            if not cursor:
+                break
+        return products
+
+    @_handle_api_exceptions(default_return=None, coalesce=True)
+    async def _fetch_favorite_ids(self, session: aiohttp.ClientSession, user_tg_id: int, etag: Optional[str]) -> Optional[Dict]:
+        headers = {"If-None-Match": etag} if etag else None
+        return await session.get(f"{self.base_url}/api/favorites/{user_tg_id}/ids", headers=headers)
+
+    async def get_favorite_ids(self, user_tg_id: int) -> Set[str]:
+        """
+        Набор product_id избранного пользователя
+
+        Свежий набор берется из кеша профиля. Иначе запрос условный
+        (If-None-Match с ETag последнего ответа), при 304 используется последний
+        набор. При ошибке API возвращается последний известный набор.
+        """
+        profile_ids = await profile_cache.get(user_tg_id, "favorite_ids")
+        if profile_ids is not None:
+            return set(profile_ids)
+
+        cached = self._favorite_ids.get(user_tg_id)
+        result = await self._fetch_favorite_ids(user_tg_id, cached[0] if cached else None)
+
+        if result is NOT_MODIFIED and cached:
+            product_ids = cached[1]
+        elif isinstance(result, dict):
+            product_ids = set(result.get("product_ids", []))
+            self._favorite_ids[user_tg_id] = (result.get("etag", ""), product_ids)
+        else:
+            return cached[1] if cached else set()
+
+        await profile_cache.set(user_tg_id, "favorite_ids", sorted(product_ids))
+        return product_ids
+
+    async def check_favorite(self, user_tg_id: int, product_id: str) -> bool:
+        return product_id in await self.get_favorite_ids(user_tg_id)
 
-    # --- Catalog endpoints ---
+    @_handle_api_exceptions(default_return=None)
+    async def _check_favorites(self, session: aiohttp.ClientSession, user_tg_id: int, product_ids: List[str]) -> Optional[Dict]:
+        return await session.post(
+            f"{self.base_url}/api/favorites/{user_tg_id}/check",
+            json={"product_ids": product_ids}
+        )
 
-    @_handle_api_exceptions(default_return=[])
-    async def get_categories(self, session: aiohttp.ClientSession) -> List[Dict]:
-        return await session.get(f"{self.base_url}/api/catalog/categories")
+    async def check_favorites(self, user_tg_id: int, product_ids: List[str]) -> Dict[str, bool]:
+        """Проверить несколько товаров на наличие в избранном одним запросом"""
+        result = await self._check_favorites(user_tg_id, product_ids)
+        if not isinstance(result, dict):
+            return {product_id: False for product_id in product_ids}
+        return result.get("favorites", {})
 
-    @_handle_api_exceptions(default_return=[])
-    async def get_products_by_category(self, session: aiohttp.ClientSession, category: str) -> List[Dict]:
-        return await session.get(f"{self.base_url}/api/catalog/products?category={category}")
+    # --- Catalog endpoints ---
 
-    @_handle_api_exceptions(default_return=None)
-    async def get_product_by_id(self, session: aiohttp.ClientSession, product_id: str) -> Optional[Dict]:
+    @_handle_api_exceptions(default_return=None, coalesce=True)
+    async def _fetch_catalog(self, session: aiohttp.ClientSession, resource: str, etag: Optional[str]) -> Optional[Versioned]:
+        headers = {"If-None-Match": etag} if etag else None
+        return await session.get(f"{self.base_url}/api/catalog/{resource}", headers=headers)
+
+    async def _sync_catalog(self):
+        """Обновить локальную копию каталога, если она устарела"""
+        catalog = self._catalog
+        if catalog.is_fresh():
+            return
+
+        async with catalog.lock:
+            if catalog.is_fresh():
+                return
+
+            categories = await self._fetch_catalog("categories", catalog.etags.get("categories"))
+            products = await self._fetch_catalog("products", catalog.etags.get("products"))
+            if categories is None or products is None:
+                # Остается последняя копия, синхронизация повторится позже
+                logger.warning("Catalog sync failed, serving the last known catalog")
+                catalog.next_sync_at = time.monotonic() + CATALOG_RETRY_SECONDS
+                return
+
+            catalog.update(categories, products)
+
+    def invalidate_catalog(self):
+        """Сбросить актуальность локальной копии каталога (после очистки кеша API)"""
+        self._catalog.invalidate()
+
+    async def get_categories(self) -> List[Dict]:
+        """Категории из локальной копии каталога"""
+        await self._sync_catalog()
+        return self._catalog.categories
+
+    async def get_products_by_category(self, category: str) -> List[Dict]:
+        """Активные товары категории из локальной копии каталога"""
+        await self._sync_catalog()
+        return self._catalog.products_by_category.get(category, [])
+
+    async def get_product_by_id(self, product_id: str) -> Optional[Dict]:
+        """
+        Товар по ID из локальной копии каталога
+
+        Неактивных и только что добавленных товаров в копии нет - они
+        запрашиваются у API.
+        """
+        await self._sync_catalog()
+        product = self._catalog.products.get(product_id)
+        if product is None:
+            product = await self._get_product_by_id(product_id)
+        return product
+
+    @_handle_api_exceptions(default_return=None, coalesce=True)
+    async def _get_product_by_id(self, session: aiohttp.ClientSession, product_id: str) -> Optional[Dict]:
         return await session.get(f"{self.base_url}/api/catalog/products/{product_id}")
 
+    # --- Product cards ---
+
+    @_handle_api_exceptions(default_return=None, coalesce=True)
+    async def get_product_card(
+        self,
+        session: aiohttp.ClientSession,
+        user_tg_id: int,
+        category: str,
+        index: int = 0,
+        product_id: Optional[str] = None
+    ) -> Optional[Dict]:
+        """
+        Карточка товара категории одним запросом: товар, позиция и количество,
+        флаг избранного и рекомендация размера (index по кругу, product_id важнее index)
+        """
+        params = {"category": category, "index": index}
+        if product_id:
+            params["product_id"] = product_id
+        return await session.get(f"{self.base_url}/api/cards/{user_tg_id}", params=params)
+
+    @_handle_api_exceptions(default_return=None, coalesce=True)
+    async def get_favorite_card(
+        self,
+        session: aiohttp.ClientSession,
+        user_tg_id: int,
+        index: int = 0,
+        product_id: Optional[str] = None
+    ) -> Optional[Dict]:
+        """Карточка товара из избранного (None - избранное пусто или ошибка API)"""
+        params = {"index": index}
+        if product_id:
+            params["product_id"] = product_id
+        return await session.get(f"{self.base_url}/api/cards/{user_tg_id}/favorites", params=params)
+
     # --- Size recommendation ---
 
     @_handle_api_exceptions(default_return=None)
@@ -159,22 +492,31 @@ class APIClient:
 
     # --- Admin endpoints ---
 
-    @_handle_api_exceptions(default_return=None)
+    @_handle_api_exceptions(default_return=None, coalesce=True)
     async def get_admin_stats(self, session: aiohttp.ClientSession) -> Optional[Dict]:
         return await session.get(f"{self.base_url}/api/admin/stats")
 
     # --- Try-on endpoints ---
 
-    @_handle_api_exceptions(default_return=None)
+    @_handle_api_exceptions(default_return=None, coalesce=True)
     async def check_tryon_limit(self, session: aiohttp.ClientSession, user_tg_id: int) -> Optional[Dict]:
         return await session.get(f"{self.base_url}/api/tryon/check-limit/{user_tg_id}")
 
-    @_handle_api_exceptions(default_return=None)
-    async def get_user_photos(self, session: aiohttp.ClientSession, user_tg_id: int) -> Optional[Dict]:
+    async def get_user_photos(self, user_tg_id: int) -> Optional[Dict]:
+        return await self._read_profile(user_tg_id, "photos", lambda: self._get_user_photos(user_tg_id))
+
+    @_handle_api_exceptions(default_return=None, coalesce=True)
+    async def _get_user_photos(self, session: aiohttp.ClientSession, user_tg_id: int) -> Optional[Dict]:
         return await session.get(f"{self.base_url}/api/photos/{user_tg_id}")
 
+    async def upload_photo(self, tg_id: int, file_id: str, file_path: str, consent_given: bool) -> Optional[Dict]:
+        result = await self._upload_photo(tg_id, file_id, file_path, consent_given)
+        # При лимите фото API удаляет самое старое вместе с его примерками
+        await self._invalidate_profile(tg_id, "photos", "tryon_count")
+        return result
+
     @_handle_api_exceptions(default_return=None)
-    async def upload_photo(self, session: aiohttp.ClientSession, tg_id: int, file_id: str, file_path: str, consent_given: bool) -> Optional[Dict]:
+    async def _upload_photo(self, session: aiohttp.ClientSession, tg_id: int, file_id: str, file_path: str, consent_given: bool) -> Optional[Dict]:
         data = aiohttp.FormData()
         data.add_field('user_id', str(tg_id))
         data.add_field('file_id', file_id)
@@ -201,19 +543,50 @@ class APIClient:
             timeout=timeout
         )
 
+    async def delete_photo(self, photo_id: int, user_tg_id: int) -> bool:
+        result = await self._delete_photo(photo_id)
+        # Вместе с фото удаляются его примерки
+        await self._invalidate_profile(user_tg_id, "photos", "tryon_count")
+        return result
+
     @_handle_api_exceptions(default_return=False)
-    async def delete_photo(self, session: aiohttp.ClientSession, photo_id: int) -> bool:
+    async def _delete_photo(self, session: aiohttp.ClientSession, photo_id: int) -> bool:
         return await session.delete(f"{self.base_url}/api/photos/{photo_id}")
 
     @_handle_api_exceptions(default_return=None)
-    async def create_tryon(self, session: aiohttp.ClientSession, tg_id: int, product_id: str, photo_id: int) -> Optional[Dict]:
+    async def create_tryon(self, session: aiohttp.ClientSession, tg_id: int, product_id: str, photo_id: int, job: Dict) -> Optional[Dict]:
+        """Поставить примерку в очередь генерации (job - параметры генерации и доставки)"""
         payload = {
             "user_id": tg_id,
             "product_id": product_id,
-            "user_photo_id": photo_id
+            "user_photo_id": photo_id,
+            "job": job
         }
         return await session.post(f"{self.base_url}/api/tryon/create", json=payload)
-    
+
+    # --- Try-on job queue (воркеры генерации) ---
+
+    @_handle_api_exceptions(default_return=None)
+    async def claim_tryon_job(self, session: aiohttp.ClientSession, worker_id: str) -> Optional[Dict]:
+        """Взять задачу генерации под аренду ({"job": null} - очередь пуста)"""
+        return await session.post(f"{self.base_url}/api/tryon/jobs/claim", json={"worker_id": worker_id})
+
+    @_handle_api_exceptions(default_return=None, conflict=True)
+    async def heartbeat_tryon_job(self, session: aiohttp.ClientSession, tryon_id: int, worker_id: str) -> Optional[Dict]:
+        """Продлить аренду задачи (CONFLICT - аренда потеряна, None - API недоступен)"""
+        return await session.post(
+            f"{self.base_url}/api/tryon/jobs/{tryon_id}/heartbeat",
+            json={"worker_id": worker_id}
+        )
+
+    @_handle_api_exceptions(default_return=None)
+    async def fail_tryon_job(self, session: aiohttp.ClientSession, tryon_id: int, worker_id: str, error: str, retry: bool) -> Optional[Dict]:
+        """Завершить попытку ошибкой (retry - вернуть задачу в очередь)"""
+        return await session.post(
+            f"{self.base_url}/api/tryon/jobs/{tryon_id}/fail",
+            json={"worker_id": worker_id, "error": error, "retry": retry}
+        )
+
     @_handle_api_exceptions(default_return=False)
     async def update_tryon(self, session: aiohttp.ClientSession, tryon_id: int, status: str, result_file_path: Optional[str] = None, generation_time: Optional[int] = None) -> bool:
         payload = {"status": status}
@@ -223,20 +596,98 @@ class APIClient:
             payload["generation_time"] = generation_time
         return await session.put(f"{self.base_url}/api/tryon/{tryon_id}", json=payload)
 
+    async def upload_tryon_result(
+        self,
+        tryon_id: int,
+        image_data: bytes,
+        filename: str,
+        generation_time: Optional[int] = None,
+        worker_id: Optional[str] = None,
+        user_tg_id: Optional[int] = None
+    ) -> Optional[Dict]:
+        """Загрузить результат примерки в хранилище API (примерка помечается успешной)"""
+        result = await self._upload_tryon_result(tryon_id, image_data, filename, generation_time, worker_id)
+        if user_tg_id is not None:
+            await self._invalidate_profile(user_tg_id, "tryon_count")
+        return result
+
     @_handle_api_exceptions(default_return=None)
-    async def get_tryon_history(self, session: aiohttp.ClientSession, user_tg_id: int) -> Optional[Dict]:
-        return await session.get(f"{self.base_url}/api/tryon/history/{user_tg_id}")
+    async def _upload_tryon_result(self, session: aiohttp.ClientSession, tryon_id: int, image_data: bytes, filename: str, generation_time: Optional[int] = None, worker_id: Optional[str] = None) -> Optional[Dict]:
+        data = aiohttp.FormData()
+        if generation_time:
+            data.add_field('generation_time', str(generation_time))
+        if worker_id:
+            data.add_field('worker_id', worker_id)
+        data.add_field('file', image_data, filename=filename, content_type='image/png')
+
+        timeout = aiohttp.ClientTimeout(total=60)
+        return await session.post(
+            f"{self.base_url}/api/tryon/{tryon_id}/result",
+            data=data,
+            timeout=timeout
+        )
+
+    def file_url(self, path: str) -> str:
+        """Полный URL файла по file_url/result_url из ответа API"""
+        return f"{self.base_url}{path}"
+
+    @_handle_api_exceptions(default_return=None, coalesce=True)
+    async def download_file(self, session: aiohttp.ClientSession, path: str) -> Optional[bytes]:
+        """Скачать файл из хранилища API (path - file_url/result_url из ответа API)"""
+        timeout = aiohttp.ClientTimeout(total=60)
+        return await session.get(self.file_url(path), timeout=timeout)
+
+    @_handle_api_exceptions(default_return=None, coalesce=True)
+    async def get_tryon_history(
+        self,
+        session: aiohttp.ClientSession,
+        user_tg_id: int,
+        limit: int = 20,
+        before: Optional[str] = None,
+        expand: Optional[str] = None
+    ) -> Optional[Dict]:
+        """Страница истории примерок (before - next_cursor предыдущей страницы)"""
+        params = {"limit": limit}
+        if before:
+            params["before"] = before
+        if expand:
+            params["expand"] = expand
+        return await session.get(f"{self.base_url}/api/tryon/history/{user_tg_id}", params=params)
+
+    async def get_tryon_history_count(self, user_tg_id: int) -> Optional[Dict]:
+        return await self._read_profile(user_tg_id, "tryon_count", lambda: self._get_tryon_history_count(user_tg_id))
+
+    @_handle_api_exceptions(default_return=None, coalesce=True)
+    async def _get_tryon_history_count(self, session: aiohttp.ClientSession, user_tg_id: int) -> Optional[Dict]:
+        return await session.get(f"{self.base_url}/api/tryon/history/{user_tg_id}/count")
+
+    async def download_tryon_result(self, tryon_id: int, variant: Optional[str] = None) -> Optional[bytes]:
+        """
+        Скачать файл результата примерки
+
+        variant: preview - уменьшенная копия, original - оригинал до пережатия
+        (если их нет, API отдает сам результат)
+        """
+        path = f"/api/tryon/{tryon_id}/result"
+        return await self.download_file(f"{path}?variant={variant}" if variant else path)
 
     async def has_tryon_history(self, user_tg_id: int) -> bool:
-        """Проверить, есть ли у пользователя история примерок"""
+        """
+        Есть ли у пользователя успешные примерки (кнопка истории в главном меню)
+
+        Число примерок читается через кеш профиля (его обновляет и bootstrap при /start).
+        """
         # Эта функция вызывает другую, уже обернутую, поэтому здесь декоратор не нужен
-        history_result = await self.get_tryon_history(user_tg_id)
-        if history_result and "history" in history_result:
-            return len(history_result["history"]) > 0
-        return False
+        count_result = await self.get_tryon_history_count(user_tg_id)
+        return bool(count_result and count_result.get("count"))
+
+    async def delete_tryon(self, tryon_id: int, user_tg_id: int) -> bool:
+        result = await self._delete_tryon(tryon_id)
+        await self._invalidate_profile(user_tg_id, "tryon_count")
+        return result
 
     @_handle_api_exceptions(default_return=False)
-    async def delete_tryon(self, session: aiohttp.ClientSession, tryon_id: int) -> bool:
+    async def _delete_tryon(self, session: aiohttp.ClientSession, tryon_id: int) -> bool:
         return await session.delete(f"{self.base_url}/api/tryon/{tryon_id}")
 
 
@@ -0,0 +1,101 @@
+"""
+Кеш профиля пользователя
+
+Параметры, избранное, фото и число примерок пользователя хранятся в Redis с
+коротким TTL (общий кеш для всех процессов бота), а на время обработки
+апдейта Telegram - еще и в памяти (ProfileMiddleware): повторные чтения в
+обработчиках не делают ни запросов к API, ни обращений к Redis.
+
+Изменения через APIClient записывают новое значение в кеш или сбрасывают
+его ключи. Без Redis используется кеш в памяти процесса.
+"""
+import json
+import logging
+import os
+from contextvars import ContextVar, Token
+from typing import Any, Dict, Optional
+
+from cachetools import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Время жизни профиля в кеше (сек) - граница устаревания для изменений в обход бота
+PROFILE_CACHE_TTL_SECONDS = int(os.getenv("PROFILE_CACHE_TTL_SECONDS", "300"))
+
+# Значения, прочитанные в текущем апдейте: ключ -> значение
+_update_values: ContextVar[Optional[Dict[str, Any]]] = ContextVar("profile_update_values", default=None)
+
+
+class ProfileCache:
+    """Кеш полей профиля: measurements, favorite_ids, photos, tryon_count"""
+
+    def __init__(self):
+        # redis.asyncio.Redis (decode_responses=True), подключается при старте бота
+        self.redis = None
+        self._local: TTLCache = TTLCache(maxsize=50000, ttl=PROFILE_CACHE_TTL_SECONDS)
+
+    @staticmethod
+    def _key(tg_id: int, field: str) -> str:
+        return f"profile:{tg_id}:{field}"
+
+    def begin_update(self) -> Token:
+        """Начать кеш в памяти на время апдейта"""
+        return _update_values.set({})
+
+    def end_update(self, token: Token):
+        _update_values.reset(token)
+
+    async def get(self, tg_id: int, field: str) -> Optional[Any]:
+        """Значение поля профиля или None, если его нет в кеше"""
+        key = self._key(tg_id, field)
+        update_values = _update_values.get()
+        if update_values is not None and key in update_values:
+            return update_values[key]
+
+        value = None
+        if self.redis is not None:
+            try:
+                raw = await self.redis.get(key)
+                value = json.loads(raw) if raw is not None else None
+            except Exception as e:
+                logger.warning(f"Profile cache read failed for {key}: {e}")
+        else:
+            value = self._local.get(key)
+
+        if update_values is not None and value is not None:
+            update_values[key] = value
+        return value
+
+    async def set(self, tg_id: int, field: str, value: Any):
+        """Записать значение поля профиля"""
+        key = self._key(tg_id, field)
+        update_values = _update_values.get()
+        if update_values is not None:
+            update_values[key] = value
+
+        if self.redis is not None:
+            try:
+                await self.redis.set(key, json.dumps(value, ensure_ascii=False), ex=PROFILE_CACHE_TTL_SECONDS)
+            except Exception as e:
+                logger.warning(f"Profile cache write failed for {key}: {e}")
+        else:
+            self._local[key] = value
+
+    async def invalidate(self, tg_id: int, *fields: str):
+        """Сбросить поля профиля (следующее чтение пойдет в API)"""
+        keys = [self._key(tg_id, field) for field in fields]
+        update_values = _update_values.get()
+        for key in keys:
+            if update_values is not None:
+                update_values.pop(key, None)
+            self._local.pop(key, None)
+
+        if self.redis is not None:
+            try:
+                await self.redis.delete(*keys)
+            except Exception as e:
+                logger.warning(f"Profile cache invalidation failed for {keys}: {e}")
+
+
+# Singleton instance
+profile_cache = ProfileCache()
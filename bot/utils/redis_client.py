@@ -0,0 +1,35 @@
+"""
+Подключение к Redis для процессов бота (бот и отдельные воркеры примерок)
+"""
+import logging
+import os
+from typing import Optional
+
+from redis.asyncio import Redis
+
+logger = logging.getLogger(__name__)
+
+
+async def connect_redis() -> Optional[Redis]:
+    """Подключиться к Redis; None - Redis недоступен"""
+    # Настройки читаются при подключении: точки входа загружают .env после импортов
+    redis_host = os.getenv("REDIS_HOST", "localhost")
+    redis_port = int(os.getenv("REDIS_PORT", 6379))
+    redis_db = int(os.getenv("REDIS_DB", 0))
+
+    redis = Redis(
+        host=redis_host,
+        port=redis_port,
+        db=redis_db,
+        decode_responses=True
+    )
+    try:
+        # Проверка подключения к Redis
+        await redis.ping()
+    except Exception as e:
+        logger.error(f"Failed to connect to Redis: {e}")
+        await redis.aclose()
+        return None
+
+    logger.info(f"Connected to Redis at {redis_host}:{redis_port}")
+    return redis
@@ -8,11 +8,14 @@ from dotenv import load_dotenv
 
 from aiogram import Bot, Dispatcher
 from aiogram.fsm.storage.redis import RedisStorage
-from redis.asyncio import Redis
 
 from bot.handlers import register_handlers
+from bot.middlewares.profile import ProfileMiddleware
 from bot.services.photo_preloader import photo_preloader
+from bot.services.tryon_worker import TryOnWorker
 from bot.utils.api_client import api_client
+from bot.utils.profile_cache import profile_cache
+from bot.utils.redis_client import connect_redis
 
 # Загрузка переменных окружения
 load_dotenv()
@@ -138,27 +141,12 @@ async def main():
         logger.error("TELEGRAM_BOT_TOKEN not found in environment variables!")
         return
 
-    # Настройка Redis для FSM storage
-    redis_host = os.getenv("REDIS_HOST", "localhost")
-    redis_port = int(os.getenv("REDIS_PORT", 6379))
-    redis_db = int(os.getenv("REDIS_DB", 0))
-
-    try:
-        # Подключение к Redis
-        redis = Redis(
-            host=redis_host,
-            port=redis_port,
-            db=redis_db,
-            decode_responses=True
-        )
-
-        # Проверка подключения к Redis
-        await redis.ping()
-        logger.info(f"Connected to Redis at {redis_host}:{redis_port}")
-
+    # Redis: FSM storage и общий с воркерами примерок кеш профилей
+    redis = await connect_redis()
+    if redis is not None:
         storage = RedisStorage(redis=redis)
-    except Exception as e:
-        logger.error(f"Failed to connect to Redis: {e}")
+        profile_cache.redis = redis
+    else:
         logger.info("Using MemoryStorage as fallback")
         from aiogram.fsm.storage.memory import MemoryStorage
         storage = MemoryStorage()
@@ -166,6 +154,7 @@ async def main():
     # Инициализация бота и диспетчера
     bot = Bot(token=bot_token)
     dp = Dispatcher(storage=storage)
+    dp.update.outer_middleware(ProfileMiddleware())
 
     # Регистрация обработчиков
     router = register_handlers()
@@ -179,17 +168,24 @@ async def main():
     # Запускаем фоновую задачу обновления фото
     update_interval_minutes = int(os.getenv("PHOTO_UPDATE_INTERVAL_MINUTES", "30"))
     background_task = asyncio.create_task(background_photo_updater(update_interval_minutes))
+    background_tasks = [background_task]
+
+    # Воркер генерации примерок в процессе бота (дополнительные воркеры:
+    # python -m bot.services.tryon_worker)
+    if os.getenv("TRYON_WORKER_EMBEDDED", "true").lower() == "true":
+        background_tasks.append(asyncio.create_task(TryOnWorker(bot).run_forever()))
 
     try:
         # Запуск бота
         await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
     finally:
-        # Останавливаем фоновую задачу
-        background_task.cancel()
-        try:
-            await background_task
-        except asyncio.CancelledError:
-            pass
+        # Останавливаем фоновые задачи
+        for task in background_tasks:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
 
         await bot.session.close()
 
@@ -0,0 +1,118 @@
+"""Initial schema (как создавал Base.metadata.create_all)
+
+Revision ID: 0001
+Revises:
+Create Date: 2024-12-10 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0001'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'users',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('tg_id', sa.BigInteger(), nullable=False),
+        sa.Column('username', sa.String(length=255), nullable=True),
+        sa.Column('first_name', sa.String(length=255), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.Column('last_activity', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.Column('is_admin', sa.Boolean(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_users_id', 'users', ['id'])
+    op.create_index('ix_users_tg_id', 'users', ['tg_id'], unique=True)
+    op.create_index('ix_users_created_at', 'users', ['created_at'])
+    op.create_index('ix_users_last_activity', 'users', ['last_activity'])
+
+    op.create_table(
+        'user_measurements',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('user_id', sa.BigInteger(), nullable=False),
+        sa.Column('russian_size', sa.String(length=20), nullable=True),
+        sa.Column('shoulder_length', sa.Integer(), nullable=True),
+        sa.Column('back_width', sa.Integer(), nullable=True),
+        sa.Column('sleeve_length', sa.Integer(), nullable=True),
+        sa.Column('back_length', sa.Integer(), nullable=True),
+        sa.Column('chest', sa.Integer(), nullable=True),
+        sa.Column('waist', sa.Integer(), nullable=True),
+        sa.Column('hips', sa.Integer(), nullable=True),
+        sa.Column('pants_length', sa.Integer(), nullable=True),
+        sa.Column('waist_girth', sa.Integer(), nullable=True),
+        sa.Column('rise_height', sa.Integer(), nullable=True),
+        sa.Column('back_rise_height', sa.Integer(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.tg_id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('user_id'),
+    )
+    op.create_index('ix_user_measurements_id', 'user_measurements', ['id'])
+
+    op.create_table(
+        'favorites',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('user_id', sa.BigInteger(), nullable=False),
+        sa.Column('product_id', sa.String(length=100), nullable=False),
+        sa.Column('added_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.tg_id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('user_id', 'product_id', name='unique_user_product'),
+    )
+    op.create_index('ix_favorites_id', 'favorites', ['id'])
+    op.create_index('ix_favorites_user_id', 'favorites', ['user_id'])
+    op.create_index('ix_favorites_added_at', 'favorites', ['added_at'])
+
+    op.create_table(
+        'user_photos',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('user_id', sa.BigInteger(), nullable=False),
+        sa.Column('file_id', sa.String(length=255), nullable=False),
+        sa.Column('file_path', sa.String(length=500), nullable=False),
+        sa.Column('uploaded_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.Column('is_active', sa.Boolean(), nullable=False),
+        sa.Column('consent_given', sa.Boolean(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.tg_id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_user_photos_id', 'user_photos', ['id'])
+    op.create_index('ix_user_photos_user_id', 'user_photos', ['user_id'])
+    op.create_index('ix_user_photos_uploaded_at', 'user_photos', ['uploaded_at'])
+
+    op.create_table(
+        'try_on_history',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('user_id', sa.BigInteger(), nullable=False),
+        sa.Column('product_id', sa.String(length=100), nullable=False),
+        sa.Column('user_photo_id', sa.Integer(), nullable=False),
+        sa.Column('result_file_path', sa.String(length=500), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.Column('generation_time', sa.Integer(), nullable=True),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('wb_link', sa.String(length=500), nullable=True),
+        sa.Column('ozon_url', sa.String(length=500), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.tg_id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['user_photo_id'], ['user_photos.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_try_on_history_id', 'try_on_history', ['id'])
+    op.create_index('ix_try_on_history_user_id', 'try_on_history', ['user_id'])
+    op.create_index('ix_try_on_history_product_id', 'try_on_history', ['product_id'])
+    op.create_index('ix_try_on_history_created_at', 'try_on_history', ['created_at'])
+
+
+def downgrade() -> None:
+    op.drop_table('try_on_history')
+    op.drop_table('user_photos')
+    op.drop_table('favorites')
+    op.drop_table('user_measurements')
+    op.drop_table('users')
@@ -0,0 +1,53 @@
+"""Stats rollup tables for /admin/stats
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2024-12-12 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0002'
+down_revision: Union[str, None] = '0001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # До перехода на миграции эти таблицы мог создать create_all
+    if context.is_offline_mode():
+        existing = set()
+    else:
+        existing = set(sa.inspect(op.get_bind()).get_table_names())
+
+    if 'stats_daily' not in existing:
+        op.create_table(
+            'stats_daily',
+            sa.Column('day', sa.Date(), nullable=False),
+            sa.Column('new_users', sa.Integer(), nullable=False),
+            sa.Column('tryons_total', sa.Integer(), nullable=False),
+            sa.Column('tryons_success', sa.Integer(), nullable=False),
+            sa.Column('generation_time_sum', sa.BigInteger(), nullable=False),
+            sa.Column('generation_time_count', sa.Integer(), nullable=False),
+            sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+            sa.PrimaryKeyConstraint('day'),
+        )
+
+    if 'stats_daily_products' not in existing:
+        op.create_table(
+            'stats_daily_products',
+            sa.Column('day', sa.Date(), nullable=False),
+            sa.Column('product_id', sa.String(length=100), nullable=False),
+            sa.Column('tryons_success', sa.Integer(), nullable=False),
+            sa.PrimaryKeyConstraint('day', 'product_id'),
+        )
+
+
+def downgrade() -> None:
+    op.drop_table('stats_daily_products')
+    op.drop_table('stats_daily')
@@ -0,0 +1,55 @@
+"""Composite and partial indexes matched to router query shapes
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2024-12-14 12:00:00.000000
+
+- try_on_history: история (user_id, status='success') ORDER BY created_at DESC, id DESC;
+  дневной лимит по (user_id, created_at); каскадное удаление по user_photo_id
+- favorites: список избранного (user_id) ORDER BY added_at DESC
+- user_photos: фото пользователя (user_id) ORDER BY uploaded_at DESC
+
+Одиночные индексы по user_id заменяются составными с тем же первым столбцом.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0003'
+down_revision: Union[str, None] = '0002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        'ix_try_on_history_user_success_created',
+        'try_on_history',
+        ['user_id', sa.text('created_at DESC'), sa.text('id DESC')],
+        postgresql_where=sa.text("status = 'success'"),
+    )
+    op.create_index('ix_try_on_history_user_created', 'try_on_history', ['user_id', 'created_at'])
+    op.create_index('ix_try_on_history_user_photo_id', 'try_on_history', ['user_photo_id'])
+    op.drop_index('ix_try_on_history_user_id', table_name='try_on_history')
+
+    op.create_index('ix_favorites_user_added', 'favorites', ['user_id', sa.text('added_at DESC')])
+    op.drop_index('ix_favorites_user_id', table_name='favorites')
+
+    op.create_index('ix_user_photos_user_uploaded', 'user_photos', ['user_id', sa.text('uploaded_at DESC')])
+    op.drop_index('ix_user_photos_user_id', table_name='user_photos')
+
+
+def downgrade() -> None:
+    op.create_index('ix_user_photos_user_id', 'user_photos', ['user_id'])
+    op.drop_index('ix_user_photos_user_uploaded', table_name='user_photos')
+
+    op.create_index('ix_favorites_user_id', 'favorites', ['user_id'])
+    op.drop_index('ix_favorites_user_added', table_name='favorites')
+
+    op.create_index('ix_try_on_history_user_id', 'try_on_history', ['user_id'])
+    op.drop_index('ix_try_on_history_user_photo_id', table_name='try_on_history')
+    op.drop_index('ix_try_on_history_user_created', table_name='try_on_history')
+    op.drop_index('ix_try_on_history_user_success_created', table_name='try_on_history')
@@ -0,0 +1,40 @@
+"""Content-addressed blob store refcounts
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2024-12-16 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0004'
+down_revision: Union[str, None] = '0003'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'blobs',
+        sa.Column('key', sa.String(length=64), nullable=False),
+        sa.Column('size', sa.BigInteger(), nullable=False),
+        sa.Column('content_type', sa.String(length=100), nullable=True),
+        sa.Column('ref_count', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.PrimaryKeyConstraint('key'),
+    )
+    op.create_index(
+        'ix_blobs_unreferenced', 'blobs', ['updated_at'],
+        postgresql_where=sa.text('ref_count <= 0'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_blobs_unreferenced', table_name='blobs')
+    op.drop_table('blobs')
@@ -0,0 +1,72 @@
+"""Transactional outbox for file deletions
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2024-12-17 12:00:00.000000
+
+Триггеры пишут ссылку на файл в file_deletion_outbox при удалении строк
+user_photos / try_on_history (включая ON DELETE CASCADE) и при замене ссылки
+на файл, в той же транзакции.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0005'
+down_revision: Union[str, None] = '0004'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Столбец со ссылкой на файл передается аргументом триггера
+ENQUEUE_FUNCTION = """
+CREATE FUNCTION enqueue_file_deletion() RETURNS trigger AS $$
+DECLARE
+    old_ref text := to_jsonb(OLD) ->> TG_ARGV[0];
+    new_ref text;
+BEGIN
+    IF TG_OP = 'UPDATE' THEN
+        new_ref := to_jsonb(NEW) ->> TG_ARGV[0];
+    END IF;
+    IF old_ref IS NOT NULL AND old_ref IS DISTINCT FROM new_ref THEN
+        INSERT INTO file_deletion_outbox (ref) VALUES (old_ref);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql
+"""
+
+TRIGGERS = {
+    'user_photos': 'file_path',
+    'try_on_history': 'result_file_path',
+}
+
+
+def upgrade() -> None:
+    op.create_table(
+        'file_deletion_outbox',
+        sa.Column('id', sa.BigInteger(), autoincrement=True, nullable=False),
+        sa.Column('ref', sa.String(length=500), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.Column('attempts', sa.Integer(), server_default=sa.text('0'), nullable=False),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+    )
+
+    op.execute(ENQUEUE_FUNCTION)
+    for table, column in TRIGGERS.items():
+        op.execute(
+            f"CREATE TRIGGER {table}_enqueue_file_deletion "
+            f"AFTER DELETE OR UPDATE OF {column} ON {table} "
+            f"FOR EACH ROW EXECUTE FUNCTION enqueue_file_deletion('{column}')"
+        )
+
+
+def downgrade() -> None:
+    for table in TRIGGERS:
+        op.execute(f"DROP TRIGGER {table}_enqueue_file_deletion ON {table}")
+    op.execute("DROP FUNCTION enqueue_file_deletion()")
+    op.drop_table('file_deletion_outbox')
@@ -0,0 +1,103 @@
+"""Tiered retention for try-on results
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2024-12-18 12:00:00.000000
+
+- try_on_history: preview_file_path, original_file_path, retention_applied_at
+- blobs.tier: hot / cold
+- Триггер outbox удаления учитывает несколько столбцов со ссылками: ссылка
+  ставится в очередь, только если ее нет ни в одном столбце новой строки
+  (перенос результата в original_file_path не удаляет файл).
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0006'
+down_revision: Union[str, None] = '0005'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Столбцы со ссылками на файлы передаются аргументами триггера
+ENQUEUE_FUNCTION = """
+CREATE OR REPLACE FUNCTION enqueue_file_deletion() RETURNS trigger AS $$
+DECLARE
+    new_refs text[] := '{}';
+    old_ref text;
+BEGIN
+    IF TG_OP = 'UPDATE' THEN
+        FOR i IN 0 .. TG_NARGS - 1 LOOP
+            new_refs := array_append(new_refs, to_jsonb(NEW) ->> TG_ARGV[i]);
+        END LOOP;
+    END IF;
+    FOR i IN 0 .. TG_NARGS - 1 LOOP
+        old_ref := to_jsonb(OLD) ->> TG_ARGV[i];
+        IF old_ref IS NOT NULL AND array_position(new_refs, old_ref) IS NULL THEN
+            INSERT INTO file_deletion_outbox (ref) VALUES (old_ref);
+        END IF;
+    END LOOP;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql
+"""
+
+PREVIOUS_ENQUEUE_FUNCTION = """
+CREATE OR REPLACE FUNCTION enqueue_file_deletion() RETURNS trigger AS $$
+DECLARE
+    old_ref text := to_jsonb(OLD) ->> TG_ARGV[0];
+    new_ref text;
+BEGIN
+    IF TG_OP = 'UPDATE' THEN
+        new_ref := to_jsonb(NEW) ->> TG_ARGV[0];
+    END IF;
+    IF old_ref IS NOT NULL AND old_ref IS DISTINCT FROM new_ref THEN
+        INSERT INTO file_deletion_outbox (ref) VALUES (old_ref);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql
+"""
+
+TRYON_FILE_COLUMNS = ['result_file_path', 'preview_file_path', 'original_file_path']
+
+
+def upgrade() -> None:
+    op.add_column('try_on_history', sa.Column('preview_file_path', sa.String(length=500), nullable=True))
+    op.add_column('try_on_history', sa.Column('original_file_path', sa.String(length=500), nullable=True))
+    op.add_column('try_on_history', sa.Column('retention_applied_at', sa.DateTime(timezone=True), nullable=True))
+    op.create_index(
+        'ix_try_on_history_retention_pending', 'try_on_history', ['created_at'],
+        postgresql_where=sa.text("status = 'success' AND retention_applied_at IS NULL"),
+    )
+    op.add_column('blobs', sa.Column('tier', sa.String(length=10), server_default='hot', nullable=False))
+
+    op.execute(ENQUEUE_FUNCTION)
+    columns = ", ".join(TRYON_FILE_COLUMNS)
+    args = ", ".join(f"'{column}'" for column in TRYON_FILE_COLUMNS)
+    op.execute("DROP TRIGGER try_on_history_enqueue_file_deletion ON try_on_history")
+    op.execute(
+        f"CREATE TRIGGER try_on_history_enqueue_file_deletion "
+        f"AFTER DELETE OR UPDATE OF {columns} ON try_on_history "
+        f"FOR EACH ROW EXECUTE FUNCTION enqueue_file_deletion({args})"
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER try_on_history_enqueue_file_deletion ON try_on_history")
+    op.execute(
+        "CREATE TRIGGER try_on_history_enqueue_file_deletion "
+        "AFTER DELETE OR UPDATE OF result_file_path ON try_on_history "
+        "FOR EACH ROW EXECUTE FUNCTION enqueue_file_deletion('result_file_path')"
+    )
+    op.execute(PREVIOUS_ENQUEUE_FUNCTION)
+
+    op.drop_column('blobs', 'tier')
+    op.drop_index('ix_try_on_history_retention_pending', table_name='try_on_history')
+    op.drop_column('try_on_history', 'retention_applied_at')
+    op.drop_column('try_on_history', 'original_file_path')
+    op.drop_column('try_on_history', 'preview_file_path')
@@ -0,0 +1,62 @@
+"""Try-on job queue
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2024-12-20 12:00:00.000000
+
+- try_on_history: job_payload, attempts, available_at, locked_by,
+  lease_expires_at, last_error
+- Частичные индексы очереди (status = 'queued') и аренд (status = 'processing')
+- Зависшие примерки в статусе processing получают истекшую аренду: без
+  параметров генерации их завершит ошибкой сборщик аренд.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0007'
+down_revision: Union[str, None] = '0006'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('try_on_history', sa.Column('job_payload', postgresql.JSONB(), nullable=True))
+    op.add_column('try_on_history', sa.Column('attempts', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('try_on_history', sa.Column(
+        'available_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True
+    ))
+    op.add_column('try_on_history', sa.Column('locked_by', sa.String(length=100), nullable=True))
+    op.add_column('try_on_history', sa.Column('lease_expires_at', sa.DateTime(timezone=True), nullable=True))
+    op.add_column('try_on_history', sa.Column('last_error', sa.Text(), nullable=True))
+
+    op.create_index(
+        'ix_try_on_history_queued', 'try_on_history', ['available_at', 'id'],
+        postgresql_where=sa.text("status = 'queued'"),
+    )
+    op.create_index(
+        'ix_try_on_history_processing_lease', 'try_on_history', ['lease_expires_at'],
+        postgresql_where=sa.text("status = 'processing'"),
+    )
+
+    op.execute(
+        "UPDATE try_on_history SET attempts = 1, lease_expires_at = now() "
+        "WHERE status = 'processing'"
+    )
+
+
+def downgrade() -> None:
+    op.execute("UPDATE try_on_history SET status = 'failed' WHERE status = 'queued'")
+
+    op.drop_index('ix_try_on_history_processing_lease', table_name='try_on_history')
+    op.drop_index('ix_try_on_history_queued', table_name='try_on_history')
+    op.drop_column('try_on_history', 'last_error')
+    op.drop_column('try_on_history', 'lease_expires_at')
+    op.drop_column('try_on_history', 'locked_by')
+    op.drop_column('try_on_history', 'available_at')
+    op.drop_column('try_on_history', 'attempts')
+    op.drop_column('try_on_history', 'job_payload')
@@ -0,0 +1,162 @@
+"""Trigger-maintained counters for /admin/stats
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2024-12-21 12:00:00.000000
+
+- stats_counters: users, measurements, users_with_photos
+- stats_favorite_products: сколько раз товар сейчас в избранном
+- stats_user_photos: число фото пользователя (первое фото и удаление
+  последнего меняют users_with_photos ровно один раз, в том числе при
+  каскадном удалении пользователя)
+- stats_product_totals: успешные примерки товара за свернутые дни (ведет
+  пересчет агрегатов, заполняется из stats_daily_products)
+
+Триггеры меняют счетчики в транзакции изменения строк, поэтому /admin/stats
+читает их без обхода таблиц. Общего счетчика избранного нет - это была бы
+одна строка, которую блокирует каждое добавление: всего в избранном - сумма
+stats_favorite_products (строк не больше, чем товаров в каталоге).
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0008'
+down_revision: Union[str, None] = '0007'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Имя счетчика передается аргументом триггера
+COUNT_ROWS_FUNCTION = """
+CREATE FUNCTION stats_count_rows() RETURNS trigger AS $$
+BEGIN
+    UPDATE stats_counters
+    SET value = value + CASE WHEN TG_OP = 'INSERT' THEN 1 ELSE -1 END
+    WHERE name = TG_ARGV[0];
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql
+"""
+
+COUNT_FAVORITE_FUNCTION = """
+CREATE FUNCTION stats_count_favorite() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO stats_favorite_products (product_id, favorites) VALUES (NEW.product_id, 1)
+        ON CONFLICT (product_id) DO UPDATE SET favorites = stats_favorite_products.favorites + 1;
+    ELSE
+        UPDATE stats_favorite_products SET favorites = favorites - 1 WHERE product_id = OLD.product_id;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql
+"""
+
+COUNT_USER_PHOTO_FUNCTION = """
+CREATE FUNCTION stats_count_user_photo() RETURNS trigger AS $$
+DECLARE
+    photos_left integer;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO stats_user_photos (user_id, photos) VALUES (NEW.user_id, 1)
+        ON CONFLICT (user_id) DO UPDATE SET photos = stats_user_photos.photos + 1
+        RETURNING stats_user_photos.photos INTO photos_left;
+        IF photos_left = 1 THEN
+            UPDATE stats_counters SET value = value + 1 WHERE name = 'users_with_photos';
+        END IF;
+    ELSE
+        UPDATE stats_user_photos SET photos = photos - 1 WHERE user_id = OLD.user_id
+        RETURNING stats_user_photos.photos INTO photos_left;
+        IF photos_left = 0 THEN
+            DELETE FROM stats_user_photos WHERE user_id = OLD.user_id;
+            UPDATE stats_counters SET value = value - 1 WHERE name = 'users_with_photos';
+        END IF;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql
+"""
+
+# Таблица -> (функция, аргумент)
+TRIGGERS = {
+    'users': ('stats_count_rows', "'users'"),
+    'user_measurements': ('stats_count_rows', "'measurements'"),
+    'favorites': ('stats_count_favorite', ''),
+    'user_photos': ('stats_count_user_photo', ''),
+}
+
+
+def upgrade() -> None:
+    op.create_table(
+        'stats_counters',
+        sa.Column('name', sa.String(length=50), nullable=False),
+        sa.Column('value', sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint('name'),
+    )
+    op.create_table(
+        'stats_favorite_products',
+        sa.Column('product_id', sa.String(length=100), nullable=False),
+        sa.Column('favorites', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('product_id'),
+    )
+    op.create_index('ix_stats_favorite_products_favorites', 'stats_favorite_products', [sa.text('favorites DESC')])
+    op.create_table(
+        'stats_user_photos',
+        sa.Column('user_id', sa.BigInteger(), nullable=False),
+        sa.Column('photos', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('user_id'),
+    )
+    op.create_table(
+        'stats_product_totals',
+        sa.Column('product_id', sa.String(length=100), nullable=False),
+        sa.Column('tryons_success', sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint('product_id'),
+    )
+    op.create_index('ix_stats_product_totals_tryons', 'stats_product_totals', [sa.text('tryons_success DESC')])
+
+    op.execute(COUNT_ROWS_FUNCTION)
+    op.execute(COUNT_FAVORITE_FUNCTION)
+    op.execute(COUNT_USER_PHOTO_FUNCTION)
+    # CREATE TRIGGER блокирует запись в таблицу до конца транзакции миграции,
+    # поэтому начальные значения ниже согласованы с триггерами
+    for table, (function, argument) in TRIGGERS.items():
+        op.execute(
+            f"CREATE TRIGGER {table}_stats_counters "
+            f"AFTER INSERT OR DELETE ON {table} "
+            f"FOR EACH ROW EXECUTE FUNCTION {function}({argument})"
+        )
+
+    op.execute(
+        "INSERT INTO stats_favorite_products (product_id, favorites) "
+        "SELECT product_id, count(*) FROM favorites GROUP BY product_id"
+    )
+    op.execute(
+        "INSERT INTO stats_user_photos (user_id, photos) "
+        "SELECT user_id, count(*) FROM user_photos GROUP BY user_id"
+    )
+    op.execute(
+        "INSERT INTO stats_counters (name, value) "
+        "SELECT 'users', count(*) FROM users "
+        "UNION ALL SELECT 'measurements', count(*) FROM user_measurements "
+        "UNION ALL SELECT 'users_with_photos', count(*) FROM stats_user_photos"
+    )
+    op.execute(
+        "INSERT INTO stats_product_totals (product_id, tryons_success) "
+        "SELECT product_id, sum(tryons_success) FROM stats_daily_products GROUP BY product_id"
+    )
+
+
+def downgrade() -> None:
+    for table in TRIGGERS:
+        op.execute(f"DROP TRIGGER {table}_stats_counters ON {table}")
+    op.execute("DROP FUNCTION stats_count_user_photo()")
+    op.execute("DROP FUNCTION stats_count_favorite()")
+    op.execute("DROP FUNCTION stats_count_rows()")
+    op.drop_table('stats_product_totals')
+    op.drop_table('stats_user_photos')
+    op.drop_table('stats_favorite_products')
+    op.drop_table('stats_counters')
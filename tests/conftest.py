@@ -0,0 +1,64 @@
+"""
+Общие фикстуры тестов API
+
+Тесты идут на реальном PostgreSQL (TEST_DATABASE_URL, отдельная база - миграции
+применяются при старте). Без TEST_DATABASE_URL тесты с БД пропускаются.
+"""
+import itertools
+import os
+
+import pytest
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+# Окружение задается до импорта api: движки создаются при импорте api.database
+if TEST_DATABASE_URL:
+    os.environ["DATABASE_URL"] = TEST_DATABASE_URL
+os.environ["DATABASE_READ_URL"] = ""
+# Отметки активности копятся в памяти процесса и не пишут в БД внутри запросов
+os.environ["ACTIVITY_BUFFER"] = "memory"
+
+# Telegram ID тестовых пользователей (уникальны в пределах прогона)
+_tg_ids = itertools.count(9_000_000_000 + os.getpid() * 1000)
+
+
+@pytest.fixture
+def tg_id() -> int:
+    return next(_tg_ids)
+
+
+@pytest.fixture(scope="session")
+def client():
+    """TestClient приложения без фоновых сервисов, с примененными миграциями"""
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL is not set")
+
+    from contextlib import asynccontextmanager
+    from fastapi.testclient import TestClient
+
+    from api.database import init_db, install_query_counter, track_queries
+    from api.main import app
+
+    @asynccontextmanager
+    async def lifespan(_app):
+        yield
+
+    # Прогрев и фоновые циклы не нужны: миграции применяются здесь же
+    app.router.lifespan_context = lifespan
+
+    # Число обращений к БД при обработке запроса - в заголовке X-DB-Queries
+    install_query_counter()
+
+    @app.middleware("http")
+    async def count_db_queries(request, call_next):
+        counter = track_queries()
+        response = await call_next(request)
+        response.headers["X-DB-Queries"] = str(counter[0])
+        return response
+
+    with TestClient(app) as test_client:
+        try:
+            test_client.portal.call(init_db)
+        except Exception as e:
+            pytest.skip(f"Test database is unavailable: {e}")
+        yield test_client
@@ -0,0 +1,88 @@
+"""
+Число обращений к БД на горячих эндпоинтах записи (заголовок X-DB-Queries)
+
+Каждый эндпоинт - одна команда в транзакции: BEGIN, запрос, COMMIT.
+"""
+from sqlalchemy import insert
+
+from api.database import AsyncSessionLocal
+from api.models import UserPhoto, TryOnHistory
+
+
+def _db_queries(response) -> int:
+    assert response.status_code == 200, response.text
+    return int(response.headers["X-DB-Queries"])
+
+
+def _create_user(client, tg_id: int):
+    response = client.post("/api/users/register", json={"tg_id": tg_id})
+    assert response.status_code == 200, response.text
+
+
+def _create_tryon(client, tg_id: int) -> int:
+    async def create() -> int:
+        async with AsyncSessionLocal() as db:
+            photo_id = await db.scalar(
+                insert(UserPhoto)
+                .values(user_id=tg_id, file_id="file", file_path="photo.jpg", consent_given=True)
+                .returning(UserPhoto.id)
+            )
+            tryon_id = await db.scalar(
+                insert(TryOnHistory)
+                .values(user_id=tg_id, product_id="1", user_photo_id=photo_id, status="processing")
+                .returning(TryOnHistory.id)
+            )
+            await db.commit()
+            return tryon_id
+
+    _create_user(client, tg_id)
+    return client.portal.call(create)
+
+
+def test_register_new_user(client, tg_id):
+    response = client.post("/api/users/register", json={"tg_id": tg_id, "first_name": "Test"})
+    assert _db_queries(response) == 3
+
+
+def test_register_existing_user(client, tg_id):
+    _create_user(client, tg_id)
+    response = client.post("/api/users/register", json={"tg_id": tg_id})
+    # Вставка пропущена - существующий пользователь читается той же командой
+    assert _db_queries(response) == 3
+    assert response.json()["tg_id"] == tg_id
+
+
+def test_add_to_favorites(client, tg_id):
+    _create_user(client, tg_id)
+    response = client.post("/api/favorites/", json={"user_id": tg_id, "product_id": "42"})
+    assert _db_queries(response) == 3
+
+    # Повторное добавление - тот же upsert
+    response = client.post("/api/favorites/", json={"user_id": tg_id, "product_id": "42"})
+    assert _db_queries(response) == 3
+
+
+def test_save_measurements(client, tg_id):
+    _create_user(client, tg_id)
+    response = client.post(f"/api/measurements/{tg_id}", json={"russian_size": "44", "chest": 90})
+    assert _db_queries(response) == 3
+
+    response = client.post(f"/api/measurements/{tg_id}", json={"waist": 70})
+    assert _db_queries(response) == 3
+    assert response.json()["chest"] == 90
+
+
+def test_update_tryon(client, tg_id):
+    tryon_id = _create_tryon(client, tg_id)
+    response = client.put(
+        f"/api/tryon/{tryon_id}",
+        json={"status": "success", "result_file_path": "result.jpg", "generation_time": 12},
+    )
+    assert _db_queries(response) == 3
+
+
+def test_update_missing_tryon(client):
+    response = client.put("/api/tryon/0", json={"status": "success"})
+    assert response.status_code == 404
+    # BEGIN, UPDATE без строк и ROLLBACK при закрытии сессии
+    assert int(response.headers["X-DB-Queries"]) == 3
@@ -0,0 +1,19 @@
+"""
+EXPLAIN-проверка запросов роутеров и сервисов (benchmarks.explain_queries)
+
+Выполняется на тестовой базе в отдельной схеме, изменения откатываются.
+"""
+import asyncio
+import os
+
+import pytest
+
+from benchmarks.explain_queries import main
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+
+@pytest.mark.skipif(not TEST_DATABASE_URL, reason="TEST_DATABASE_URL is not set")
+def test_queries_have_no_unexpected_seq_scans():
+    exit_code = asyncio.run(main(users=2000, tryons_per_photo=3, verbose=False, database_url=TEST_DATABASE_URL))
+    assert exit_code == 0